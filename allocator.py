@@ -0,0 +1,163 @@
+"""
+Collision-free filenames for saves running in parallel.
+
+CounterAllocator hands out counter values from ranges reserved ahead of
+use. The library's counters always hold the end of the reserved range,
+and a range is persisted before any of its values is handed out, so a
+crash can leave a gap in the numbering but never reuses a value. A clean
+close rewinds the counters to the first value not handed out.
+
+NameRegistry keeps the names present in each target directory in a hash
+set, so a name the pattern produces twice (no counter in the pattern, a
+{time} that only changes once a second, counters reset after the index
+was rebuilt) is caught in O(1) and given a deterministic suffix:
+name.png, then name_2.png, name_3.png, ...
+"""
+
+import os
+import threading
+
+RESERVE_BLOCK = 32  # Counter values reserved (and persisted) at a time
+
+
+class CounterAllocator:
+    """Counter values for filenames, taken from ranges reserved ahead.
+
+    take() holds the lock only to bump a few integers, except once per
+    range, when it advances the counters and calls persist(). The
+    counters are compared with the reserved end on every call, so a
+    counter edit (a reset, a reloaded index, settings adopted from a
+    daemon) drops the range and the next take starts from the edit.
+    """
+
+    def __init__(self, persist, block=RESERVE_BLOCK):
+        self.persist = persist
+        self.block = block
+        self.lock = threading.Lock()
+        self.names = ()
+        self.next = {}
+        self.end = {}
+        self.remaining = 0
+
+    def _valid(self, counters, names):
+        return names == self.names and all(
+            name in counters and counters[name].get('value') == self.end.get(name) for name in names)
+
+    def _rewind(self, counters):
+        """Give the unused rest of the range back to the counters; True if they changed"""
+        if not self.remaining or not self._valid(counters, self.names):
+            return False
+        for name in self.names:
+            counters[name]['value'] = self.end[name] = self.next[name]
+        self.remaining = 0
+        return True
+
+    def take(self, counters, names, count):
+        """Start values {name: value} for count consecutive filenames using the counters in names"""
+        with self.lock:
+            if not self._valid(counters, names):
+                self._rewind(counters)
+                self.names = names
+                self.next = {name: counters[name]['value'] for name in names}
+                self.end = dict(self.next)
+                self.remaining = 0
+            if not names:
+                return {}
+            if self.remaining < count:
+                extra = max(self.block, count - self.remaining)
+                for name in names:
+                    counters[name]['value'] += extra * counters[name].get('increment', 1)
+                    self.end[name] = counters[name]['value']
+                # Durable before any value of the range is used
+                self.persist()
+                self.remaining += extra
+            start = dict(self.next)
+            for name in names:
+                self.next[name] += count * counters[name].get('increment', 1)
+            self.remaining -= count
+            return start
+
+    def peek(self, counters, names):
+        """The values the next take would start from, without taking them"""
+        with self.lock:
+            if self._valid(counters, names):
+                return dict(self.next)
+            return {name: counters[name]['value'] for name in names}
+
+    def release(self, counters, names, start, count, used):
+        """Hand back the last count - used of count values taken at start.
+
+        Only if nothing was taken since, so a value handed out in between
+        is never given out twice.
+        """
+        with self.lock:
+            if not self._valid(counters, names):
+                return
+            taken_to = {name: start[name] + count * counters[name].get('increment', 1) for name in names}
+            if self.next != taken_to:
+                return
+            for name in names:
+                self.next[name] = start[name] + used * counters[name].get('increment', 1)
+            self.remaining += count - used
+
+    def rewind(self, counters):
+        """Before closing: counters back to the first value not handed out; True if they changed"""
+        with self.lock:
+            return self._rewind(counters)
+
+
+class NameRegistry:
+    """Names present or claimed in each directory, for O(1) collision checks.
+
+    A directory is listed once, the first time a name is claimed in it;
+    claims and add() keep its set current from then on. Claiming is a
+    single dict.setdefault, which is atomic, so parallel savers need no
+    lock. Names are compared as the filesystem would (os.path.normcase).
+    """
+
+    def __init__(self):
+        self.directories = {}
+        self.suffixes = {}  # (directory, stem, extension) -> last suffix number given out
+        self.lock = threading.Lock()
+
+    def _names(self, directory):
+        names = self.directories.get(directory)
+        if names is None:
+            with self.lock:
+                names = self.directories.get(directory)
+                if names is None:
+                    names = {}
+                    try:
+                        with os.scandir(directory) as listing:
+                            for item in listing:
+                                names[os.path.normcase(item.name)] = True
+                    except FileNotFoundError:
+                        pass
+                    self.directories[directory] = names
+        return names
+
+    def claim(self, directory, filename, extension=''):
+        """filename, or the first free filename_N (N = 2, 3, ...), now marked as taken"""
+        names = self._names(directory)
+        if extension and filename.lower().endswith(extension.lower()):
+            stem, extension = filename[:-len(extension)], filename[-len(extension):]
+        else:
+            stem, extension = os.path.splitext(filename)
+        token = object()
+        if names.setdefault(os.path.normcase(filename), token) is token:
+            return filename
+        # Names are never released, so every suffix below the last one given out is taken
+        key = (directory, stem, extension)
+        number = self.suffixes.get(key, 1)
+        while True:
+            number += 1
+            candidate = f"{stem}_{number}{extension}"
+            if names.setdefault(os.path.normcase(candidate), token) is token:
+                self.suffixes[key] = number
+                return candidate
+
+    def add(self, directory, filename):
+        """Record a file that appeared without being claimed (e.g. found by reconciliation)"""
+        names = self.directories.get(directory)
+        if names is not None:
+            names[os.path.normcase(filename)] = True
@@ -0,0 +1,472 @@
+"""
+Streaming export of captures to zip or tar archives.
+
+Files are copied in 1 MB chunks straight into the archive, so memory stays
+flat however large the export. Images that are already compressed (PNG,
+WebP, JPEG...) are stored as they are; anything else is deflated. Where
+there is compression work it runs on a thread pool (zlib releases the GIL):
+
+    .zip            compressible members are deflated in parallel, each into
+                    a spooled temporary file, and copied in archive order
+    .tar.gz / .tgz  the tar stream is cut into blocks deflated in parallel and
+                    joined with sync flushes into one gzip stream (the pigz
+                    approach, as in ParallelPngEncoder); image data goes into
+                    stored deflate blocks
+    .tar.zst        zstandard's own worker threads (optional zstandard package)
+    .tar            no compression
+
+The archive ends with a ``screenshot_index.json`` holding the index entries
+of the exported files, with ``filepath`` relative to the archive root.
+Delta frames bring their keyframes along so they can still be rebuilt. The
+archive is written under a ``.part`` name and renamed once complete.
+"""
+
+import os
+import json
+import time
+import zlib
+import shutil
+import struct
+import tarfile
+import tempfile
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK = 1 << 20
+SPOOL_BYTES = 4 << 20  # Deflated zip members (and the index) stay in memory up to this size
+STORED_EXTENSIONS = ('.png', '.webp', '.jpg', '.jpeg', '.gif', '.zip', '.gz', '.zst', '.7z', '.mp4')
+ARCHIVE_FORMATS = [('.tar.gz', 'gz'), ('.tgz', 'gz'), ('.tar.zst', 'zst'), ('.tzst', 'zst'),
+                   ('.tar', 'tar'), ('.zip', 'zip')]
+DEFAULT_LEVELS = {'zip': 6, 'gz': 6, 'zst': 3, 'tar': 0}
+INDEX_MEMBER = "screenshot_index.json"
+PROGRESS_INTERVAL = 0.2  # Seconds between progress callbacks
+
+
+class ExportCancelled(Exception):
+    """Raised by a progress callback to stop an export; the partial archive is removed"""
+
+
+def archive_format(path):
+    """'zip', 'tar', 'gz' or 'zst' from the output file name"""
+    lower = path.lower()
+    for suffix, archive_type in ARCHIVE_FORMATS:
+        if lower.endswith(suffix):
+            return archive_type
+    raise ValueError(f"Unsupported archive type: {os.path.basename(path)} "
+                     f"(use .zip, .tar, .tar.gz or .tar.zst)")
+
+
+def compressible(name):
+    return not name.lower().endswith(STORED_EXTENSIONS)
+
+
+def member_name(filepath, root):
+    """Archive path: relative to the save directory (keeping shard folders), else the file name"""
+    path = os.path.abspath(filepath)
+    name = path[len(root):] if path.startswith(root) else os.path.basename(path)
+    return name.replace(os.sep, "/")
+
+
+def plan_members(entries, save_directory):
+    """[(member name, filepath)] for the entries' files plus the keyframes of delta frames"""
+    root = os.path.join(os.path.abspath(save_directory), "")
+    members, names, keyframes = [], set(), {}
+    for entry in entries:
+        filepath = entry['filepath']
+        name = member_name(filepath, root)
+        if name in names:
+            continue
+        names.add(name)
+        members.append((name, filepath))
+        if entry.get('frame') == 'delta' and entry.get('keyframe'):
+            keyframe_path = os.path.join(os.path.dirname(filepath), entry['keyframe'])
+            keyframes.setdefault(member_name(keyframe_path, root), keyframe_path)
+    members.extend((name, path) for name, path in keyframes.items() if name not in names)
+    return members
+
+
+# Zip
+def _dos_time(mtime):
+    stamp = datetime.fromtimestamp(max(mtime, 315532800))  # Zip dates start in 1980
+    return ((stamp.hour << 11) | (stamp.minute << 5) | (stamp.second // 2),
+            ((stamp.year - 1980) << 9) | (stamp.month << 5) | stamp.day)
+
+
+def _deflate_file(path, level):
+    """Pool task: deflate a file into a spooled temp file; returns (spool, crc, size, compressed size)"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc = size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(compressor.compress(chunk))
+    spool.write(compressor.flush())
+    csize = spool.tell()
+    spool.seek(0)
+    return spool, crc, size, csize
+
+
+class ZipWriter:
+    """Minimal streaming zip writer (zip64 where needed) for a seekable output file.
+
+    Each local header is written with placeholder checksums and rewritten
+    in place once the member's data is out, so no data descriptors are
+    needed and nothing is held in memory.
+    """
+    LIMIT = 0xFFFFFFFF
+
+    def __init__(self, f):
+        self.f = f
+        self.records = []  # Central directory fields per member
+
+    def _local_header(self, name, method, mtime, crc, size, csize, zip64):
+        dos_time, dos_date = _dos_time(mtime)
+        extra = struct.pack('<HHQQ', 1, 16, size, csize) if zip64 else b""
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if zip64 else 20, 0x800, method,
+                           dos_time, dos_date, crc,
+                           self.LIMIT if zip64 else csize, self.LIMIT if zip64 else size,
+                           len(name), len(extra)) + name + extra
+
+    def add(self, name, method, mtime, size_hint, write_data):
+        """Write one member; write_data(f) streams it out and returns (crc, size, compressed size)"""
+        encoded = name.encode('utf-8')
+        zip64 = size_hint >= self.LIMIT
+        offset = self.f.tell()
+        self.f.write(self._local_header(encoded, method, mtime, 0, 0, 0, zip64))
+        crc, size, csize = write_data(self.f)
+        if not zip64 and max(size, csize) >= self.LIMIT:
+            raise ValueError(f"{name} grew past 4 GB while being archived")
+        end = self.f.tell()
+        self.f.seek(offset)
+        self.f.write(self._local_header(encoded, method, mtime, crc, size, csize, zip64))
+        self.f.seek(end)
+        self.records.append((encoded, method, mtime, crc, size, csize, offset))
+
+    def close(self):
+        start = self.f.tell()
+        for name, method, mtime, crc, size, csize, offset in self.records:
+            dos_time, dos_date = _dos_time(mtime)
+            values = [size, csize, offset]
+            extra_values = [value for value in values if value >= self.LIMIT]
+            extra = struct.pack(f'<HH{len(extra_values)}Q', 1, 8 * len(extra_values), *extra_values) \
+                if extra_values else b""
+            size32, csize32, offset32 = (min(value, self.LIMIT) for value in values)
+            self.f.write(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | 45,
+                                     45 if extra else 20, 0x800, method, dos_time, dos_date,
+                                     crc, csize32, size32, len(name), len(extra), 0, 0, 0,
+                                     0o100644 << 16, offset32) + name + extra)
+        end = self.f.tell()
+        count, length = len(self.records), end - start
+        if count >= 0xFFFF or max(start, length) >= self.LIMIT:
+            self.f.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, (3 << 8) | 45, 45, 0, 0,
+                                     count, count, length, start))
+            self.f.write(struct.pack('<IIQI', 0x07064b50, 0, end, 1))
+        self.f.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                 min(length, self.LIMIT), min(start, self.LIMIT), 0))
+
+
+# Tar streams
+class PlainStream:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, data, compress=True):
+        self.f.write(data)
+
+    def close(self):
+        pass
+
+
+def _deflate_block(raw, level, last):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(raw) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipStream:
+    """One gzip stream whose blocks are deflated on a thread pool.
+
+    Blocks end on a sync flush so they concatenate into one valid deflate
+    stream; the CRC-32 is taken over the raw data as it is written. Data
+    written with compress=False goes into stored blocks. At most
+    2 x workers blocks are in flight.
+    """
+
+    def __init__(self, f, pool, workers, level=6, block_bytes=CHUNK):
+        self.f = f
+        self.pool = pool
+        self.level = level
+        self.block_bytes = block_bytes
+        self.max_pending = 2 * workers
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.buffer_level = level
+        self.crc = 0
+        self.size = 0
+        f.write(b'\x1f\x8b\x08\x00' + struct.pack('<I', int(time.time())) + b'\x00\xff')
+
+    def write(self, data, compress=True):
+        level = self.level if compress else 0
+        if level != self.buffer_level and self.buffer:
+            self._submit(last=False)
+        self.buffer_level = level
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self.buffer += data
+        if len(self.buffer) >= self.block_bytes:
+            self._submit(last=False)
+
+    def _submit(self, last):
+        while len(self.pending) >= self.max_pending:
+            self.f.write(self.pending.popleft().result())
+        self.pending.append(self.pool.submit(_deflate_block, bytes(self.buffer), self.buffer_level, last))
+        self.buffer = bytearray()
+
+    def close(self):
+        self._submit(last=True)
+        while self.pending:
+            self.f.write(self.pending.popleft().result())
+        self.f.write(struct.pack('<II', self.crc, self.size & 0xFFFFFFFF))
+
+
+class ZstdStream:
+    def __init__(self, f, workers, level=3):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Exporting .tar.zst needs the zstandard package (pip install zstandard)") from None
+        self.writer = zstandard.ZstdCompressor(level=level, threads=workers).stream_writer(f, closefd=False)
+
+    def write(self, data, compress=True):
+        self.writer.write(data)  # zstd stores incompressible blocks as they are
+
+    def close(self):
+        self.writer.close()
+
+
+class TarWriter:
+    """ustar/pax tar written member by member onto a stream with write(data, compress)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.written = 0
+
+    def add(self, name, source, size, mtime, compress=True, progress=None):
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime, info.mode = size, int(mtime), 0o644
+        header = info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        self.stream.write(header)
+        remaining = size
+        while remaining:
+            chunk = source.read(min(CHUNK, remaining))
+            if not chunk:
+                raise ValueError(f"{name} shrank while being archived")
+            self.stream.write(chunk, compress)
+            remaining -= len(chunk)
+            if progress is not None:
+                progress(len(chunk))
+        padding = -size % tarfile.BLOCKSIZE
+        if padding:
+            self.stream.write(b"\0" * padding)
+        self.written += len(header) + size + padding
+
+    def close(self):
+        end = 2 * tarfile.BLOCKSIZE
+        end += -(self.written + end) % tarfile.RECORDSIZE
+        self.stream.write(b"\0" * end)
+        self.stream.close()
+
+
+# Export
+class ExportResult:
+    def __init__(self, out_path):
+        self.out_path = out_path
+        self.files = 0
+        self.skipped = []  # Files that could not be read
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.elapsed = 0.0
+
+    @property
+    def mb_per_second(self):
+        return self.bytes_in / 1024 / 1024 / max(self.elapsed, 1e-9)
+
+    def summary(self):
+        text = (f"Exported {self.files} files ({self.bytes_in / 1024 / 1024:.1f} MB) to "
+                f"{os.path.basename(self.out_path)} in {self.elapsed:.2f}s: {self.mb_per_second:.1f} MB/s, "
+                f"archive {self.bytes_out / 1024 / 1024:.1f} MB")
+        if self.skipped:
+            text += f"; {len(self.skipped)} missing files skipped"
+        return text
+
+
+def _write_index(entries, names, root):
+    """screenshot_index.json for the exported files, streamed into a spooled temp file"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    spool.write(b'{"screenshots": [')
+    first = True
+    for entry in entries:
+        name = member_name(entry['filepath'], root)
+        if name not in names:
+            continue
+        entry = dict(entry, filepath=name)
+        spool.write((b"\n  " if first else b",\n  ") + json.dumps(entry).encode('utf-8'))
+        first = False
+    spool.write(b"\n]}\n")
+    size = spool.tell()
+    spool.seek(0)
+    return spool, size
+
+
+def _copy_stored(source, out, advance):
+    crc = size = 0
+    while True:
+        chunk = source.read(CHUNK)
+        if not chunk:
+            return crc, size, size
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        out.write(chunk)
+        advance(len(chunk))
+
+
+def _copy_deflated(source, out, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    start = out.tell()
+    crc = size = 0
+    while True:
+        chunk = source.read(CHUNK)
+        if not chunk:
+            break
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        out.write(compressor.compress(chunk))
+    out.write(compressor.flush())
+    return crc, size, out.tell() - start
+
+
+def _zip_members(writer, pool, workers, level, members, written, skipped, advance):
+    """Add members in order while the next 2 x workers compressible ones deflate in the pool"""
+    upcoming = iter(members)
+    pending = deque()
+
+    def refill():
+        while len(pending) < 2 * workers:
+            member = next(upcoming, None)
+            if member is None:
+                return
+            name, filepath = member[0], member[1]
+            deflate = level > 0 and compressible(name)
+            pending.append((member, pool.submit(_deflate_file, filepath, level) if deflate else None))
+
+    refill()
+    while pending:
+        (name, filepath, size, mtime), future = pending.popleft()
+        refill()
+        try:
+            if future is None:
+                source = open(filepath, 'rb')
+            else:
+                spool, crc, raw_size, csize = future.result()
+        except OSError:
+            skipped.append(filepath)
+            continue
+        if future is None:
+            with source:
+                writer.add(name, 0, mtime, size, lambda out: _copy_stored(source, out, advance))
+        else:
+            with spool:
+                writer.add(name, zlib.DEFLATED, mtime, raw_size,
+                           lambda out: (shutil.copyfileobj(spool, out, CHUNK), (crc, raw_size, csize))[1])
+            advance(raw_size)
+        written.add(name)
+
+
+def _tar_stream(archive_type, f, pool, workers, level):
+    if archive_type == 'gz':
+        return ParallelGzipStream(f, pool, workers, level)
+    if archive_type == 'zst':
+        return ZstdStream(f, workers, level)
+    return PlainStream(f)
+
+
+def export_archive(entries, out_path, save_directory, workers=None, level=None, progress=None):
+    """Write the entries' files and their index entries to a zip or tar archive.
+
+    entries is a sequence of index entries (a list, the viewer's search
+    results...) and is read twice. progress(done_bytes, total_bytes) is
+    called every so often and may raise ExportCancelled. Returns an
+    ExportResult.
+    """
+    archive_type = archive_format(out_path)
+    workers = workers or os.cpu_count() or 1
+    level = DEFAULT_LEVELS[archive_type] if level is None else level
+    result = ExportResult(out_path)
+    root = os.path.join(os.path.abspath(save_directory), "")
+
+    members = []
+    for name, filepath in plan_members(entries, save_directory):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            result.skipped.append(filepath)
+            continue
+        members.append((name, filepath, stat.st_size, stat.st_mtime))
+    total = sum(size for _, _, size, _ in members)
+
+    done = 0
+    last_report = 0.0
+
+    def advance(count):
+        nonlocal done, last_report
+        done += count
+        now = time.perf_counter()
+        if progress is not None and now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            progress(done, total)
+
+    part_path = out_path + ".part"
+    start = time.perf_counter()
+    written = set()
+    try:
+        with open(part_path, 'wb') as f, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="archive") as pool:
+            if archive_type == 'zip':
+                writer = ZipWriter(f)
+                _zip_members(writer, pool, workers, level, members, written, result.skipped, advance)
+                index, size = _write_index(entries, written, root)
+                with index:
+                    writer.add(INDEX_MEMBER, zlib.DEFLATED, time.time(), size,
+                               lambda out: _copy_deflated(index, out, level))
+            else:
+                writer = TarWriter(_tar_stream(archive_type, f, pool, workers, level))
+                for name, filepath, size, mtime in members:
+                    try:
+                        source = open(filepath, 'rb')
+                    except OSError:
+                        result.skipped.append(filepath)
+                        continue
+                    with source:
+                        writer.add(name, source, size, mtime, compressible(name), advance)
+                    written.add(name)
+                index, size = _write_index(entries, written, root)
+                with index:
+                    writer.add(INDEX_MEMBER, index, size, time.time())
+            writer.close()
+            result.bytes_out = f.tell()
+        os.replace(part_path, out_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    result.files = len(written)
+    result.bytes_in = done
+    result.elapsed = time.perf_counter() - start
+    if progress is not None:
+        progress(done, total)
+    return result
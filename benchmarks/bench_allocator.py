@@ -0,0 +1,108 @@
+"""
+Stress test for filename allocation with many savers in parallel threads
+of one process.
+
+Every saver asks the library for a name and creates the file with
+O_EXCL, so any name handed out twice fails loudly. Patterns that cannot
+tell two saves apart on their own ({time} alone, a fixed name) show the
+collision suffixes. Afterwards the index is reopened without a clean
+close (as after a crash) to check that the persisted counter is past
+every value used, then closed and reopened to check that the unused part
+of the reserved range was given back.
+
+    python benchmarks/bench_allocator.py --threads 32 --saves 500
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import ScreenshotLibrary
+
+PATTERNS = {
+    "{date}_{time}_{counter}": ["date", "_", "time", "_", "counter"],
+    "{time}-{ms}": ["time", "-", "ms"],
+    "{time}": ["time"],
+    "capture": ["capture"],
+}
+
+
+def saver(library, saves, barrier, results):
+    barrier.wait()
+    names, collisions = [], 0
+    for _ in range(saves):
+        filename = library.generate_filename()
+        try:
+            fd = os.open(library.filepath_for(filename), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            collisions += 1
+            continue
+        os.close(fd)
+        names.append(filename)
+    results.append((names, collisions))
+
+
+def run(save_directory, elements, threads, saves):
+    library = ScreenshotLibrary(save_directory, use_daemon=False)
+    library.load_index()
+    library.set_pattern(elements)
+    barrier = threading.Barrier(threads)
+    results = []
+    workers = [threading.Thread(target=saver, args=(library, saves, barrier, results)) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    names = [name for worker_names, _ in results for name in worker_names]
+    collisions = sum(count for _, count in results)
+    suffixed = sum(1 for name in names if "_" in name)  # Only the counter pattern has "_" of its own
+    library.save_index()  # Settings (pattern) on disk; the counters are already there
+
+    crashed = ScreenshotLibrary(save_directory, use_daemon=False)
+    crashed.load_index()
+    persisted = crashed.custom_counters['counter']['value']
+    crashed.index_store.close()
+    library.close()
+    reopened = ScreenshotLibrary(save_directory, use_daemon=False)
+    reopened.load_index()
+    rewound = reopened.custom_counters['counter']['value']
+    reopened.close()
+    return names, collisions, suffixed, elapsed, persisted, rewound
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--saves', type=int, default=500, help="Saves per thread")
+    args = parser.parse_args()
+
+    failed = False
+    total = args.threads * args.saves
+    for label, elements in PATTERNS.items():
+        with tempfile.TemporaryDirectory() as save_directory:
+            names, collisions, suffixed, elapsed, persisted, rewound = \
+                run(save_directory, elements, args.threads, args.saves)
+            repeated = len(names) - len(set(names))
+            line = (f"{label:<26} {total / elapsed:9,.0f} names/sec  {len(names):,} files, "
+                    f"{collisions} collisions, {repeated} repeated")
+            if "counter" in elements:
+                # Every value below the persisted counter may have been used; the rewind returns the rest
+                used = max(int(name[:-4].rsplit("_", 1)[-1]) for name in names)
+                line += f", last counter {used}, persisted {persisted}, after close {rewound}"
+                failed |= persisted <= used or rewound != used + 1
+            else:
+                line += f", {suffixed:,} suffixed"
+            print(line)
+            failed |= bool(collisions or repeated or len(names) != total)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Throughput and memory of archive export (zip, tar, tar.gz, tar.zst when
+zstandard is installed) over a folder of screenshot-sized files.
+
+Most files are incompressible ".png" payloads, stored as they are; one in
+ten is a compressible ".bmp", which exercises the parallel deflate path.
+Peak memory is the process's maximum RSS, which should stay flat however
+large --total-mb is.
+
+    python benchmarks/bench_archive.py --total-mb 2048 --workers 8
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import export_archive
+
+
+def make_files(directory, total_mb, file_mb):
+    rng_block = os.urandom(1 << 20)
+    text_block = (b"pixel row " * (1 << 17))[:1 << 20]  # Compresses well, like a raw bitmap
+    entries = []
+    for i in range(max(1, total_mb // file_mb)):
+        compressible = i % 10 == 9
+        filename = f"capture_{i:06d}{'.bmp' if compressible else '.png'}"
+        filepath = os.path.join(directory, filename)
+        with open(filepath, 'wb') as f:
+            for _ in range(file_mb):
+                f.write(text_block if compressible else rng_block)
+        entries.append({'filename': filename, 'filepath': filepath,
+                        'created': "2024-05-01T12:00:00", 'size': os.path.getsize(filepath)})
+    return entries
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--total-mb', type=int, default=1024)
+    parser.add_argument('--file-mb', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pic_queuer-archive-")
+    try:
+        source = os.path.join(workdir, "captures")
+        os.makedirs(source)
+        entries = make_files(source, args.total_mb, args.file_mb)
+        print(f"{len(entries)} files, {args.total_mb} MB, {args.workers or os.cpu_count()} workers "
+              f"(peak RSS before export {peak_rss_mb():.0f} MB)")
+        try:
+            import zstandard  # noqa: F401
+            suffixes = [".zip", ".tar", ".tar.gz", ".tar.zst"]
+        except ImportError:
+            suffixes = [".zip", ".tar", ".tar.gz"]
+        for suffix in suffixes:
+            out_path = os.path.join(workdir, "export" + suffix)
+            start = time.perf_counter()
+            result = export_archive(entries, out_path, source, workers=args.workers)
+            elapsed = time.perf_counter() - start
+            print(f"  {suffix:<9} {elapsed:6.2f}s  {result.mb_per_second:7.1f} MB/s  "
+                  f"archive {result.bytes_out / 2 ** 20:8.1f} MB  peak RSS {peak_rss_mb():.0f} MB")
+            os.remove(out_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
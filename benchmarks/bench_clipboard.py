@@ -0,0 +1,116 @@
+"""
+Peak memory and time of turning a clipboard QImage into a Pillow image.
+
+Each path runs in a fresh interpreter (offscreen Qt) on a synthetic frame,
+so the process's peak RSS can be compared against a run that only builds
+the source image; tracemalloc shows the Python-side allocations on top.
+
+  serialized   image re-encoded as a BMP/DIB and decoded by Pillow, as
+               ImageGrab.grabclipboard() does with the OS clipboard data
+  copy         QImage.convertToFormat + bytes() + Image.frombytes
+  frombuffer   clipboard.qimage_to_pil (in-place swizzle, Image.frombuffer)
+
+    python benchmarks/bench_clipboard.py --size 7680x4320 --alpha
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ["serialized", "copy", "frombuffer"]
+
+PROBE = """
+import sys, time, json, tracemalloc
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtGui import QImage, QColor, QPainter
+from PyQt6.QtCore import QBuffer, QIODevice
+from PIL import Image
+
+def peak_rss():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+
+path, width, height, alpha, encode = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), sys.argv[4] == "1", sys.argv[5] == "1"
+app = QApplication(sys.argv[:1])
+import clipboard
+
+qimage = QImage(width, height, QImage.Format.Format_ARGB32 if alpha else QImage.Format.Format_RGB32)
+qimage.fill(QColor(240, 240, 240, 200 if alpha else 255))
+painter = QPainter(qimage)
+for i in range(0, width, 97):
+    painter.fillRect(i, (i * 7) % height, 80, 60, QColor(i % 256, 40, 90))
+painter.end()
+Image.new("RGB", (1, 1)).tobytes()  # Load Pillow's core before measuring
+baseline = peak_rss()
+
+tracemalloc.start()
+start = time.perf_counter()
+if path == "serialized":
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    qimage.save(buffer, "BMP")
+    data = bytes(buffer.data())
+    buffer = None
+    import io
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    data = None
+elif path == "copy":
+    rgba = qimage.convertToFormat(QImage.Format.Format_RGBA8888)
+    bits = rgba.constBits()
+    bits.setsize(rgba.sizeInBytes())
+    image = Image.frombytes("RGBA", (width, height), bytes(bits), "raw", "RGBA", rgba.bytesPerLine())
+    rgba = bits = None
+elif path == "frombuffer":
+    image = clipboard.qimage_to_pil(qimage)
+qimage = None
+if encode:
+    from encoders import PngEncoder
+    import tempfile, os
+    with tempfile.TemporaryDirectory() as workdir:
+        PngEncoder(1).save(image, os.path.join(workdir, "paste.png"))
+seconds = time.perf_counter() - start
+_, traced = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+print(json.dumps({'seconds': seconds, 'traced': traced, 'baseline': baseline, 'peak': peak_rss(),
+                  'mode': image.mode}))
+"""
+
+
+def run(path, width, height, alpha, encode):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    result = subprocess.run([sys.executable, "-c", PROBE, path, str(width), str(height),
+                             "1" if alpha else "0", "1" if encode else "0"],
+                            cwd=REPO, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', default="7680x4320")
+    parser.add_argument('--alpha', action="store_true", help="Source image has an alpha channel")
+    parser.add_argument('--encode', action="store_true", help="Include a fast PNG encode in the measurement")
+    args = parser.parse_args()
+
+    width, height = map(int, args.size.split("x"))
+    frame_mb = width * height * 4 / 1024 / 1024
+    print(f"{args.size} {'ARGB32' if args.alpha else 'RGB32'} source ({frame_mb:.0f} MB raw)"
+          f"{', with encode' if args.encode else ''}")
+    for path in PATHS:
+        result = run(path, width, height, args.alpha, args.encode)
+        extra_mb = (result['peak'] - result['baseline']) / 1024 / 1024
+        print(f"{path:<12} peak RSS +{extra_mb:7.1f} MB ({extra_mb / frame_mb:4.2f}x frame)  "
+              f"tracemalloc peak {result['traced'] / 1024 / 1024:7.1f} MB  "
+              f"{result['seconds'] * 1000:7.1f} ms  -> {result['mode']}")
+
+
+if __name__ == "__main__":
+    main()
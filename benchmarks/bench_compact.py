@@ -0,0 +1,94 @@
+"""
+Memory and load time of the in-memory index: JSON dicts versus the
+columnar CompactEntries, on a synthetic index with perceptual hashes.
+
+Memory is what stays allocated after loading (tracemalloc, in a separate
+pass so the timings are not slowed by tracing).
+
+    python benchmarks/bench_compact.py --count 1000000
+"""
+
+import os
+import sys
+import gc
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_index_store import make_entries
+from compact import CompactEntries
+from index_store import JournaledIndex, write_json_atomic
+
+
+def load_dicts(index_file):
+    store = JournaledIndex(index_file)
+    entries = store.load()['screenshots']
+    store.close()
+    return entries
+
+
+def load_compact(index_file):
+    return CompactEntries.from_entries(load_dicts(index_file), os.path.dirname(index_file))
+
+
+def retained(load, index_file):
+    gc.collect()
+    tracemalloc.start()
+    entries = load(index_file)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del entries
+    gc.collect()
+    return size
+
+
+def timed(func):
+    gc.collect()
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pic_queuer-compact-")
+    try:
+        index_file = os.path.join(workdir, "screenshot_index.json")
+        rng = random.Random(7)
+        entries = make_entries(args.count, workdir)
+        for entry in entries:
+            entry['phash'] = f"{rng.getrandbits(64):016x}"
+        write_json_atomic(index_file, {'screenshots': entries})
+        del entries
+
+        print(f"{args.count:,} entries")
+        for name, load in (("dicts", load_dicts), ("compact", load_compact)):
+            print(f"  {name:<8} retained {retained(load, index_file) / 2 ** 20:8.1f} MB")
+
+        parse, dicts = timed(lambda: load_dicts(index_file))
+        convert, compact = timed(lambda: CompactEntries.from_entries(dicts, workdir))
+        print(f"  load: JSON parse {parse:.2f}s, column conversion {convert:.2f}s")
+
+        positions = [rng.randrange(args.count) for _ in range(100_000)]
+        for name, entries in (("dicts", dicts), ("compact", compact)):
+            lookup, _ = timed(lambda: [entries[i]['filename'] for i in positions])
+            scan, _ = timed(lambda: sum(entry['size'] for entry in entries))
+            print(f"  {name:<8} random lookup {lookup / len(positions) * 1e6:.2f} us, "
+                  f"full iteration {scan:.2f}s")
+        ordered, _ = timed(lambda: compact.ordered('created', descending=True))
+        print(f"  compact  sort by created {ordered:.2f}s (from the column, no dicts)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
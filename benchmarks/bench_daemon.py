@@ -0,0 +1,94 @@
+"""
+Load test for the index daemon: many client processes saving concurrently
+into one directory.
+
+Each client goes through ScreenshotLibrary exactly like the GUI does: ask
+the daemon for a filename, write a small file, add the entry. Afterwards
+the index is reloaded from disk and checked for lost entries, repeated
+filenames and the final counter value.
+
+    python benchmarks/bench_daemon.py --clients 16 --saves 200
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from multiprocessing import Pool
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from core import ScreenshotLibrary
+from daemon import DaemonClient
+
+PAYLOAD = b"\x89PNG\r\n\x1a\n" + bytes(2048)
+
+
+def client(job):
+    save_directory, saves = job
+    library = ScreenshotLibrary(save_directory)
+    library.load_index()
+    assert library.daemon is not None, "client did not find the daemon"
+    for _ in range(saves):
+        filename = library.generate_filename()
+        filepath = os.path.join(save_directory, filename)
+        with open(filepath, 'wb') as f:
+            f.write(PAYLOAD)
+        library.add_to_index(filename, filepath, len(PAYLOAD))
+    library.close()
+    return saves
+
+
+def wait_for_daemon(save_directory, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        daemon = DaemonClient.connect(save_directory)
+        if daemon is not None:
+            return daemon
+        time.sleep(0.05)
+    raise RuntimeError("daemon did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--saves', type=int, default=200, help="Saves per client")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as save_directory:
+        server = subprocess.Popen([sys.executable, "-m", "pic_queuer", "daemon", "--dir", save_directory],
+                                  cwd=REPO, stdout=subprocess.PIPE, text=True)
+        try:
+            daemon = wait_for_daemon(save_directory)
+            start = time.perf_counter()
+            with Pool(args.clients) as pool:
+                total = sum(pool.map(client, [(save_directory, args.saves)] * args.clients))
+            elapsed = time.perf_counter() - start
+            status = daemon.status()
+            daemon.shutdown()
+            daemon.close()
+        finally:
+            server.wait(timeout=30)
+
+        library = ScreenshotLibrary(save_directory, use_daemon=False)
+        library.load_index()
+        names = [entry['filename'] for entry in library.screenshot_index]
+        counter = library.custom_counters['counter']['value']
+        library.close()
+
+    lost = total - len(names)
+    repeated = len(names) - len(set(names))
+    print(f"{args.clients} clients x {args.saves} saves: {total / elapsed:,.0f} saves/sec ({elapsed:.2f}s)")
+    print(f"{status['commits']:,} group commits, {status['committed_entries'] / max(status['commits'], 1):.1f} "
+          f"entries per commit on average")
+    print(f"indexed {len(names):,} of {total:,}: {lost} lost, {repeated} repeated names, "
+          f"next counter {counter}")
+    if lost or repeated or counter != total + 1:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
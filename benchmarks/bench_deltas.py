@@ -0,0 +1,103 @@
+"""
+Disk bytes and save time of frame-delta storage against full PNGs on a
+sequence of captures.
+
+By default the sequence is synthetic: a screenshot-like frame with a moving
+cursor, a growing line of typed text and a ticking clock. Pass --frames to
+replay a recorded sequence instead (files are taken in sorted order).
+
+    python benchmarks/bench_deltas.py --count 60 --size 1920x1080
+    python benchmarks/bench_deltas.py --frames "recording/*.png"
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from bench_encoders import make_screenshot
+from deltas import DeltaStore, reconstruct
+from encoders import PngEncoder
+
+
+def synthetic_sequence(width, height, count):
+    base = make_screenshot(width, height)
+    for i in range(count):
+        frame = base.copy()
+        draw = ImageDraw.Draw(frame)
+        # Cursor drifting across the screen
+        x, y = (200 + i * 37) % width, (300 + i * 23) % height
+        draw.polygon([(x, y), (x, y + 18), (x + 12, y + 13)], fill=(255, 255, 255), outline=(0, 0, 0))
+        # Typed text growing along one row
+        draw.rectangle([width // 6 + 20, height - 60, width // 6 + 20 + i * 9, height - 48], fill=(20, 20, 20))
+        # Clock in the title bar
+        draw.text((width - 80, 12), f"12:{i % 60:02d}", fill=(220, 220, 220))
+        yield frame
+
+
+def recorded_sequence(pattern):
+    for path in sorted(glob.glob(pattern)):
+        with Image.open(path) as image:
+            image.load()
+            yield image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', default=None, help="Glob of recorded frames to replay")
+    parser.add_argument('--size', default="1920x1080")
+    parser.add_argument('--count', type=int, default=60)
+    parser.add_argument('--keyframe-interval', type=int, default=30)
+    args = parser.parse_args()
+
+    if args.frames:
+        frames = list(recorded_sequence(args.frames))
+    else:
+        width, height = map(int, args.size.split("x"))
+        frames = list(synthetic_sequence(width, height, args.count))
+
+    encoder = PngEncoder()
+    with tempfile.TemporaryDirectory() as workdir:
+        full_bytes, full_seconds = 0, 0.0
+        for i, frame in enumerate(frames):
+            filepath = os.path.join(workdir, f"full_{i}.png")
+            start = time.perf_counter()
+            encoder.save(frame, filepath)
+            full_seconds += time.perf_counter() - start
+            full_bytes += os.path.getsize(filepath)
+
+        store = DeltaStore({'enabled': True, 'keyframe_interval': args.keyframe_interval})
+        delta_bytes, delta_seconds, keyframes, written = 0, 0.0, 0, []
+        for i, frame in enumerate(frames):
+            start = time.perf_counter()
+            frame_encoder, filename, filepath, extra = store.plan(
+                frame, encoder, lambda ext: f"delta_{i}{ext}", lambda name: os.path.join(workdir, name))
+            frame_encoder.save(frame, filepath)
+            delta_seconds += time.perf_counter() - start
+            delta_bytes += os.path.getsize(filepath)
+            keyframes += extra['frame'] == 'keyframe'
+            written.append(filepath)
+
+        start = time.perf_counter()
+        for filepath, frame in zip(written, frames):
+            if reconstruct(filepath).tobytes() != frame.convert(store.shape[0]).tobytes():
+                print(f"Reconstruction mismatch: {os.path.basename(filepath)}")
+                sys.exit(1)
+        read_seconds = time.perf_counter() - start
+
+    count = len(frames)
+    print(f"{count} frames, {keyframes} keyframes, tile {store.tile}px")
+    print(f"full PNG   {full_bytes / 1024 / 1024:9.2f} MB  {full_seconds / count * 1000:8.1f} ms/frame")
+    print(f"delta      {delta_bytes / 1024 / 1024:9.2f} MB  {delta_seconds / count * 1000:8.1f} ms/frame  "
+          f"({full_bytes / max(delta_bytes, 1):.1f}x smaller)")
+    print(f"reconstruct {read_seconds / count * 1000:7.1f} ms/frame (verified identical)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Encode time and output size of each encoder preset on synthetic,
+screenshot-like images (flat UI panels, text-like noise, a photo region).
+
+    python benchmarks/bench_encoders.py --sizes 1920x1080 3840x2160
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from encoders import ENCODERS, create_encoder
+
+
+def make_screenshot(width, height, seed=0):
+    """Flat panels, rows of small 'glyphs' and a noisy photo-like block"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    # Title bar, sidebar and a few panels
+    draw.rectangle([0, 0, width, 40], fill=(45, 45, 48))
+    draw.rectangle([0, 40, width // 6, height], fill=(37, 37, 38))
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.rectangle([x, y, x + rng.randrange(100, 600), y + rng.randrange(40, 300)],
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    # Text-like rows
+    for row in range(60, height - 20, 22):
+        x = width // 6 + 20
+        while x < width - 40:
+            w = rng.randrange(4, 12)
+            draw.rectangle([x, row, x + w, row + 12], fill=(30, 30, 30))
+            x += w + rng.randrange(2, 10)
+    # Photo-like region
+    photo = Image.effect_noise((width // 4, height // 4), 40).convert("RGB")
+    image.paste(photo, (width // 2, height // 2))
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=["1920x1080", "3840x2160", "7680x4320"])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    presets = [{'name': name} for name in ENCODERS] + [{'name': 'png', 'compress_level': 9}]
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            width, height = map(int, size.split("x"))
+            image = make_screenshot(width, height)
+            print(f"\n{size}")
+            for settings in presets:
+                encoder = create_encoder(settings)
+                path = os.path.join(workdir, "out" + encoder.extension)
+                best = float('inf')
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    encoder.save(image, path)
+                    best = min(best, time.perf_counter() - start)
+                label = settings['name'] + (f"@{settings['compress_level']}" if 'compress_level' in settings else "")
+                print(f"  {label:<16} {best * 1000:9.1f} ms {os.path.getsize(path) / 1024:10.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
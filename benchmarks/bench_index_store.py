@@ -0,0 +1,120 @@
+"""
+Compare the JSON journal index against the SQLite index store.
+
+Measures load time, time to first page, per-entry append cost and the
+date-range / name-prefix / largest-files queries at several index sizes.
+
+    python benchmarks/bench_index_store.py --sizes 10000 100000 1000000
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from index_store import JournaledIndex, SqliteIndex, import_json_index, write_json_atomic
+
+
+def make_entries(count, directory):
+    start = datetime(2024, 1, 1)
+    rng = random.Random(42)
+    entries = []
+    for i in range(count):
+        created = start + timedelta(seconds=i * 37)
+        filename = f"{created:%Y-%m-%d_%H-%M-%S}_{i + 1}.png"
+        entries.append({
+            'filename': filename,
+            'filepath': os.path.join(directory, filename),
+            'created': created.isoformat(),
+            'size': rng.randint(50_000, 8_000_000)
+        })
+    return entries
+
+
+def timed(func, repeat=1):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_size(count, workdir):
+    directory = os.path.join(workdir, str(count))
+    os.makedirs(directory)
+    index_file = os.path.join(directory, "screenshot_index.json")
+    entries = make_entries(count, directory)
+    settings = {'custom_counters': {"counter": {"value": count + 1, "increment": 1}},
+                'pattern_elements': ["date", "_", "time", "_", "counter"]}
+    write_json_atomic(index_file, {'screenshots': entries, **settings})
+
+    # Query parameters: one day in the middle, a one-hour prefix, top 10 by size
+    mid = datetime.fromisoformat(entries[count // 2]['created'])
+    day_start, day_end = mid.replace(hour=0, minute=0, second=0).isoformat(), \
+        (mid.replace(hour=0, minute=0, second=0) + timedelta(days=1)).isoformat()
+    prefix = entries[count // 2]['filename'][:13]
+    new_entry = dict(entries[-1], filename="new.png")
+
+    results = {}
+
+    # JSON path: full load, then linear scans
+    def json_load():
+        store = JournaledIndex(index_file)
+        data = store.load()
+        store.close()
+        return data
+    results['json_load'], data = timed(json_load)
+    screenshots = data['screenshots']
+    results['json_range'], _ = timed(
+        lambda: [e for e in screenshots if day_start <= e['created'] < day_end], 5)
+    results['json_prefix'], _ = timed(
+        lambda: [e for e in screenshots if e['filename'].startswith(prefix)], 5)
+    results['json_largest'], _ = timed(
+        lambda: sorted(screenshots, key=lambda e: e['size'], reverse=True)[:10], 5)
+    journal = JournaledIndex(index_file)
+    journal.load()
+    results['json_append'], _ = timed(lambda: journal.append(entry=new_entry, settings=settings), 20)
+    journal.close()
+    del data, screenshots
+
+    # SQLite path: one-shot import, lazy load, indexed queries
+    db_file = os.path.join(directory, "screenshot_index.db")
+    results['sqlite_import'], _ = timed(lambda: import_json_index(index_file, db_file))
+    store = SqliteIndex(db_file)
+    results['sqlite_load'], data = timed(store.load)
+    results['sqlite_first_page'], _ = timed(lambda: data['screenshots'][0])
+    results['sqlite_count'], _ = timed(lambda: len(data['screenshots']))
+    results['sqlite_range'], _ = timed(lambda: store.created_between(day_start, day_end), 5)
+    results['sqlite_prefix'], _ = timed(lambda: store.filename_prefix(prefix), 5)
+    results['sqlite_largest'], _ = timed(lambda: store.largest(10), 5)
+    results['sqlite_append'], _ = timed(lambda: store.append(entry=new_entry, settings=settings), 20)
+    store.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pic_queuer_bench_")
+    try:
+        for count in args.sizes:
+            results = bench_size(count, workdir)
+            print(f"\n{count:,} entries")
+            for name, seconds in results.items():
+                print(f"  {name:<18} {seconds * 1000:10.3f} ms")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Per-call cost of filename generation: the old str.format path against the
+compiled naming pattern, single calls and batches.
+
+    python benchmarks/bench_naming.py
+"""
+
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from naming import compile_pattern, pattern_string
+
+
+def legacy_generate_filename(pattern, custom_counters):
+    """generate_filename as it was before the compiled pattern engine"""
+    now = datetime.now()
+    format_dict = {
+        'date': now.strftime("%Y-%m-%d"),
+        'time': now.strftime("%H-%M-%S"),
+        'timestamp': now.strftime("%Y-%m-%d_%H-%M-%S"),
+        'date_short': now.strftime("%Y%m%d"),
+        'time_12h': now.strftime("%I-%M-%S %p"),
+        'year': now.strftime("%Y")
+    }
+    for name, data in custom_counters.items():
+        format_dict[name] = data['value']
+        custom_counters[name]['value'] += data.get('increment', 1)
+    filename = pattern.format(**format_dict)
+    if not filename.lower().endswith('.png'):
+        filename += '.png'
+    return filename
+
+
+CASES = {
+    'default': ["date", "_", "time", "_", "counter"],
+    'counter_only': ["shot", "_", "counter"],
+    'many_counters': ["project", "_", "counter", "-", "page", "_", "timestamp"],
+}
+
+
+def make_counters():
+    counters = {"counter": {"value": 1, "increment": 1}, "page": {"value": 1, "increment": 2}}
+    # Unused counters the legacy path still formats and increments
+    for i in range(8):
+        counters[f"unused{i}"] = {"value": 1, "increment": 1}
+    return counters
+
+
+def per_call(stmt, number):
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    number = 20_000
+    print(f"{'case':<16}{'legacy':>12}{'compiled':>12}{'batch x100':>14}   (us per filename)")
+    for name, elements in CASES.items():
+        counters = make_counters()
+        pattern = pattern_string(elements, counters)
+        legacy = per_call(lambda: legacy_generate_filename(pattern, counters), number)
+        compiled = per_call(lambda: compile_pattern(elements, counters).render(counters), number)
+        batch = per_call(lambda: compile_pattern(elements, counters).render_batch(counters, 100),
+                         number // 100) / 100
+        print(f"{name:<16}{legacy:>12.2f}{compiled:>12.2f}{batch:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
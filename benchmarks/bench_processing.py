@@ -0,0 +1,81 @@
+"""
+Per-stage cost of the processing chain (trim, downscale, redact,
+grayscale) on screenshot-like frames, next to the Pillow call that does
+the same job.
+
+Trim runs on the frame inside a uniform border (a window on a plain
+desktop); downscale halves the longer side and shrinks it to 2/3.
+
+    python benchmarks/bench_processing.py --sizes 1920x1080 3840x2160 7680x4320
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image, ImageChops
+
+from bench_encoders import make_screenshot
+from processing import ProcessingChain, downscale, grayscale, redact, trim
+
+
+def best_of(repeat, function):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bordered(image, border):
+    canvas = Image.new("RGB", (image.width + 2 * border, image.height + 2 * border), (0, 99, 177))
+    canvas.paste(image, (border, border))
+    return canvas
+
+
+def pillow_trim(image):
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    return image.crop(ImageChops.difference(image, background).getbbox())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=["1920x1080", "3840x2160"])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        width, height = (int(value) for value in size.split('x'))
+        image = make_screenshot(width, height)
+        pixels = np.asarray(image)
+        framed = np.asarray(bordered(image, height // 8))
+        half, two_thirds = max(width, height) // 2, max(width, height) * 2 // 3
+        regions = [[0, 0, width // 4, 40], [width - 300, height - 200, 300, 200]]
+        rows = [
+            ("trim (no border)", lambda: trim(pixels), None),
+            ("trim (1/8 border)", lambda: trim(framed), lambda: pillow_trim(Image.fromarray(framed))),
+            ("downscale 1/2", lambda: downscale(pixels, half),
+             lambda: image.reduce(2)),
+            ("downscale 2/3", lambda: downscale(pixels, two_thirds),
+             lambda: image.resize((width * 2 // 3, height * 2 // 3), Image.BOX)),
+            ("redact 2 regions", lambda: redact(pixels, regions), None),
+            ("grayscale", lambda: grayscale(pixels), lambda: image.convert("L")),
+        ]
+        print(f"{size}")
+        for label, ours, pillow in rows:
+            line = f"  {label:<18} {best_of(args.repeat, ours) * 1000:8.1f} ms"
+            if pillow is not None:
+                line += f"   Pillow {best_of(args.repeat, pillow) * 1000:8.1f} ms"
+            print(line)
+        chain = ProcessingChain([{'stage': 'trim'}, {'stage': 'redact', 'regions': regions},
+                                 {'stage': 'downscale', 'max_dimension': half}, {'stage': 'grayscale'}])
+        print(f"  {'whole chain':<18} {best_of(args.repeat, lambda: chain.apply(image)) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Reconciling a save directory with its index: a full rebuild of the index
+from the files on disk, a pass with nothing changed, and a pass after
+files were deleted, renamed and dropped in.
+
+Files are small real PNGs (one in ten a delta frame with its text chunk)
+with mtimes spread over the past, so only headers are read, as in a
+real folder.
+
+    python benchmarks/bench_reconcile.py --count 100000
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import ScreenshotLibrary, INDEX_FILENAME
+from deltas import DELTA_CHUNK
+from reconcile import SCAN_FILENAME
+
+
+def png_bytes(delta=False):
+    from PIL import Image
+    from PIL.PngImagePlugin import PngInfo
+    info = PngInfo()
+    if delta:
+        info.add_text(DELTA_CHUNK, json.dumps({'keyframe': "keyframe.png", 'tiles': [0]}))
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (40, 80, 120)).save(buffer, "PNG", pnginfo=info)
+    return buffer.getvalue()
+
+
+def make_files(directory, count):
+    plain, delta = png_bytes(), png_bytes(delta=True)
+    past = time.time() - 365 * 86400
+    for i in range(count):
+        path = os.path.join(directory, f"capture_{i:07d}{'.delta' if i % 10 == 9 else ''}.png")
+        with open(path, 'wb') as f:
+            f.write(delta if i % 10 == 9 else plain)
+        stamp = past + i * 60
+        os.utime(path, (stamp, stamp))
+
+
+def reconcile(directory, full=False):
+    library = ScreenshotLibrary(directory, use_daemon=False)
+    library.load_index()
+    start = time.perf_counter()
+    summary = library.reconcile(full=full)
+    elapsed = time.perf_counter() - start
+    library.close()
+    return elapsed, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=100_000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pic_queuer-reconcile-")
+    try:
+        make_files(workdir, args.count)
+        print(f"{args.count:,} files")
+
+        elapsed, summary = reconcile(workdir, full=True)
+        print(f"  full rebuild     {elapsed:6.2f}s  {summary}")
+        elapsed, summary = reconcile(workdir)
+        print(f"  unchanged        {elapsed:6.2f}s  {summary}")
+
+        changes = max(1, args.count // 100)
+        names = sorted(name for name in os.listdir(workdir) if name.endswith(".png"))
+        for name in names[:changes]:
+            os.remove(os.path.join(workdir, name))
+        for name in names[changes:2 * changes]:
+            os.rename(os.path.join(workdir, name), os.path.join(workdir, "renamed_" + name))
+        past = time.time() - 3600
+        for i in range(changes):
+            path = os.path.join(workdir, f"dropped_{i:07d}.png")
+            shutil.copyfile(os.path.join(workdir, names[-1]), path)
+            os.utime(path, (past, past))
+        elapsed, summary = reconcile(workdir)
+        print(f"  1% changed       {elapsed:6.2f}s  {summary}")
+
+        for name in (INDEX_FILENAME, SCAN_FILENAME):
+            os.remove(os.path.join(workdir, name))
+        elapsed, summary = reconcile(workdir)
+        print(f"  no index, cursor {elapsed:6.2f}s  {summary}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Inverted-index search over the screenshot index versus a linear scan.
+
+Builds a synthetic index (date_time_counter names, with a project word on
+a share of them), then times the index build, single-entry adds and a set
+of typical viewer queries, each against the equivalent list comprehension.
+
+    python benchmarks/bench_search.py --count 1000000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import resource
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import UNBOUNDED, SearchIndex, date_bounds, tokenize
+
+WORDS = ["bugreport", "design", "meeting", "invoice", "dashboard"]
+
+
+def make_entries(count):
+    start = datetime(2024, 1, 1)
+    rng = random.Random(42)
+    entries = []
+    for i in range(count):
+        created = start + timedelta(seconds=i * 19)
+        word = f"{WORDS[i % 50]}_" if i % 50 < len(WORDS) else ""
+        filename = f"{word}{created:%Y-%m-%d_%H-%M-%S}_{i + 1}.png"
+        entries.append({
+            'filename': filename,
+            'filepath': os.path.join("/shots", filename),
+            'created': created.isoformat(),
+            'size': rng.randint(50_000, 8_000_000)
+        })
+    return entries
+
+
+def date_bounds_exclusive(term):
+    """The created range parse() gives a date term (exclusive at both ends)"""
+    start, end = date_bounds(term)
+    return start - 1, end
+
+
+def percentiles(func, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2], times[-1], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    entries = make_entries(args.count)
+    mid = entries[args.count // 2]
+    day = mid['created'][:10]
+    counter = mid['filename'].rsplit('_', 1)[1].split('.')[0]
+    week_start = datetime.fromisoformat(day)
+    week_end = (week_start + timedelta(days=7)).isoformat()[:10]
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    index = SearchIndex(entries)
+    start = time.perf_counter()
+    index.build()
+    build = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{args.count:,} entries: build {build:.2f}s, "
+          f"~{(rss_after - rss_before) / 1024:.0f} MB peak RSS growth")
+
+    extra = make_entries(1000)
+    start = time.perf_counter()
+    for entry in extra:
+        # Appended first, as the library does: positions refer to the shared list
+        entries.append(dict(entry, filename="late_" + entry['filename']))
+        index.add(entries[-1])
+    print(f"add: {(time.perf_counter() - start) / len(extra) * 1e6:.1f} us/entry")
+
+    def scan_words(words, entry):
+        tokens = tokenize(entry['filename'])
+        return all(any(t.startswith(w) for t in tokens) for w in words)
+
+    queries = [
+        ("word prefix", "bug",
+         lambda: [e for e in entries if scan_words(["bug"], e)]),
+        ("counter value", counter,
+         lambda: [e for e in entries if counter in tokenize(e['filename'])]),
+        ("4-digit count", "1234",
+         lambda: [e for e in entries if "1234" in tokenize(e['filename'])]),
+        ("one year", day[:4],
+         lambda: [e for e in entries if e['created'][:4] == day[:4]]),
+        ("one day", day,
+         lambda: [e for e in entries if e['created'][:10] == day]),
+        ("week range", f"after:{day} before:{week_end}",
+         lambda: [e for e in entries if day <= e['created'] < week_end]),
+        ("size filter", "size>7.5mb",
+         lambda: [e for e in entries if e['size'] > 7.5 * 1024 ** 2]),
+        ("combined", f"design {day[:7]} size>4mb",
+         lambda: [e for e in entries if scan_words(["design"], e)
+                  and e['created'].startswith(day[:7]) and e['size'] > 4 * 1024 ** 2]),
+    ]
+
+    # A bare year is a date filter, not a number matched against filename parts
+    assert index.parse(day[:4])[:3] == ([], [], date_bounds_exclusive(day[:4])), "bare year is not a date filter"
+    # ...but four digits outside plausible years are a counter value
+    assert index.parse("1234")[:3] == (["1234"], [], UNBOUNDED), "1234 is not a number"
+
+    index.search("warm up")
+    print(f"{'query':<14} {'matches':>9} {'index p50':>10} {'index max':>10} {'scan':>9}")
+    for name, query, scan in queries:
+        p50, worst, results = percentiles(lambda: index.search(query), args.repeat)
+        scan_time, _, expected = percentiles(scan, 1)
+        found = [e for e in results if not e['filename'].startswith("late_")]
+        expected = [e for e in expected if not e['filename'].startswith("late_")]
+        assert found == expected, f"{name}: {len(found)} results, scan found {len(expected)}"
+        print(f"{name:<14} {len(results):>9,} {p50 * 1000:>8.2f}ms {worst * 1000:>8.2f}ms "
+              f"{scan_time * 1000:>7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Memory of the save queue under a sustained capture storm: frames arrive
+faster than two encoder threads can write them, with and without a memory
+budget.
+
+Without a budget every waiting frame stays in memory and peak RSS grows
+with the length of the storm. With one, frames past the budget are
+spilled raw to memory-mapped files by a writer thread and mapped back in
+by the encoder, so peak RSS stays near the budget plus the write-ahead and
+one frame per encoder, and admit(), which the GUI calls, stays cheap: the
+slowest call is reported. Each mode runs in a fresh process so its peak
+RSS is its own. Afterwards frames are
+spilled and left behind, as after a crash, and recover() must give back
+every one of them pixel for pixel.
+
+    python benchmarks/bench_spill.py --fps 30 --seconds 10 --memory-mb 64
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import ImageDraw
+
+from bench_archive import peak_rss_mb
+from bench_encoders import make_screenshot
+from core import save_image_file
+from encoders import create_encoder
+from spill import SaveQueue, recover
+
+WORKERS = 2
+
+
+def storm(directory, width, height, fps, seconds, memory_mb, spill_mb):
+    """Capture at fps for seconds into a SaveQueue drained by WORKERS encoder threads"""
+    base = make_screenshot(width, height)
+    encoder = create_encoder({'name': 'png_fast'})
+    levels = []
+    queue = SaveQueue(os.path.join(directory, ".spill"), memory_mb << 20, spill_mb << 20,
+                      lambda report: levels.append(report['level']))
+
+    def save(frame, filepath):
+        image = None
+        try:
+            image = frame.open()
+            save_image_file(image, filepath, encoder)
+        finally:
+            image = None
+            queue.done(frame)
+
+    captured = refused = spilled = 0
+    slowest_admit = 0.0
+    pool = ThreadPoolExecutor(WORKERS)
+    start = time.perf_counter()
+    for i in range(int(fps * seconds)):
+        due = start + i / fps
+        time.sleep(max(0.0, due - time.perf_counter()))
+        image = base.copy()  # A fresh frame each time, like a clipboard grab
+        ImageDraw.Draw(image).text((20, 20), f"frame {i}", fill=(0, 0, 0))
+        if not queue.accepts(image):
+            refused += 1
+            continue
+        started = time.perf_counter()
+        frame = queue.admit(image, {'frame': i})
+        slowest_admit = max(slowest_admit, time.perf_counter() - started)
+        del image
+        captured += 1
+        spilled += frame.spilled
+        pool.submit(save, frame, os.path.join(directory, f"frame_{i:05d}.png"))
+    storm_seconds = time.perf_counter() - start
+    pool.shutdown(wait=True)
+    queue.flush()
+    drain_seconds = time.perf_counter() - start - storm_seconds
+    return {'captured': captured, 'refused': refused, 'spilled': spilled, 'storm': storm_seconds,
+            'drain': drain_seconds, 'admit': slowest_admit, 'peak_rss': peak_rss_mb(), 'left': len(os.listdir(queue.spill_dir))
+            if os.path.isdir(queue.spill_dir) else 0, 'levels': sorted(set(levels))}
+
+
+def check_recovery(directory, width, height, frames):
+    """Spill frames, abandon them as a crash would, and recover them"""
+    spill_dir = os.path.join(directory, ".spill")
+    queue = SaveQueue(spill_dir, 0, 1 << 40)
+    images = []
+    for i, mode in zip(range(frames), ["RGB", "RGBA", "L"] * frames):
+        image = make_screenshot(width, height, seed=i).convert(mode)
+        images.append(image)
+        queue.memory_frames = 1  # Nothing fits in memory: every frame spills
+        queue.admit(image, {'frame': i})
+    queue.flush()
+    with open(os.path.join(spill_dir, "torn.spill.part"), 'wb') as f:
+        f.write(b"half a frame")
+    recovered = recover(spill_dir)
+    matched = 0
+    for frame in recovered:
+        image = frame.open()
+        matched += image.tobytes() == images[frame.meta['frame']].tobytes()
+        del image
+        frame.close()
+    return len(recovered), matched, os.listdir(spill_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', default="1920x1080")
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--memory-mb', type=int, default=64)
+    parser.add_argument('--spill-mb', type=int, default=16384)
+    parser.add_argument('--child', choices=['unbounded', 'budget'], help=argparse.SUPPRESS)
+    parser.add_argument('--dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    width, height = (int(value) for value in args.size.split('x'))
+
+    if args.child:
+        memory_mb = args.memory_mb if args.child == 'budget' else 1 << 30
+        print(json.dumps(storm(args.dir, width, height, args.fps, args.seconds, memory_mb, args.spill_mb)))
+        return
+
+    failed = False
+    print(f"{args.size} at {args.fps:g} fps for {args.seconds:g} s, {WORKERS} encoder threads")
+    for mode in ('unbounded', 'budget'):
+        workdir = tempfile.mkdtemp(prefix="pic_queuer-spill-")
+        try:
+            output = subprocess.run([sys.executable, __file__, '--child', mode, '--dir', workdir,
+                                     '--size', args.size, '--fps', str(args.fps), '--seconds', str(args.seconds),
+                                     '--memory-mb', str(args.memory_mb), '--spill-mb', str(args.spill_mb)],
+                                    check=True, capture_output=True, text=True).stdout
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        result = json.loads(output.strip().splitlines()[-1])
+        label = "no budget" if mode == 'unbounded' else f"{args.memory_mb} MB budget"
+        print(f"  {label:<14} peak RSS {result['peak_rss']:7.0f} MB  {result['captured']} saved, "
+              f"{result['spilled']} spilled, {result['refused']} refused, "
+              f"slowest admit {result['admit'] * 1000:.1f} ms, "
+              f"drained {result['drain']:.1f} s after the storm, pressure {'/'.join(result['levels']) or '-'}")
+        failed |= bool(result['left'])
+
+    workdir = tempfile.mkdtemp(prefix="pic_queuer-spill-")
+    try:
+        recovered, matched, left = check_recovery(workdir, width, height, 6)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"  crash recovery  {recovered} of 6 frames recovered, {matched} identical, {len(left)} files left")
+    failed |= recovered != 6 or matched != 6 or bool(left)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Startup budget: import time of the GUI module and time to first window.
+
+Each measurement runs in a fresh interpreter under the offscreen Qt
+platform, with HOME pointed at a scratch directory holding a synthetic
+index so index size can be shown not to affect time to first window.
+
+    python benchmarks/bench_startup.py --entries 100000 --budget-ms 800
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import time
+start = time.perf_counter()
+import screenshot_paster
+print(time.perf_counter() - start)
+"""
+
+WINDOW_PROBE = """
+import time
+start = time.perf_counter()
+import sys
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QTimer
+from screenshot_paster import ScreenshotPaster
+app = QApplication(sys.argv)
+window = ScreenshotPaster()
+window.show()
+def shown():
+    print(time.perf_counter() - start)
+    window.library.close()
+    app.quit()
+QTimer.singleShot(0, shown)
+app.exec()
+"""
+
+
+def make_home(entries):
+    home = tempfile.mkdtemp(prefix="pic_queuer_startup_")
+    directory = os.path.join(home, "Pictures", "Screenshots")
+    os.makedirs(directory)
+    screenshots = [{
+        'filename': f"shot_{i}.png",
+        'filepath': os.path.join(directory, f"shot_{i}.png"),
+        'created': "2024-01-01T00:00:00",
+        'size': 123456
+    } for i in range(entries)]
+    with open(os.path.join(directory, "screenshot_index.json"), 'w') as f:
+        json.dump({'screenshots': screenshots,
+                   'custom_counters': {"counter": {"value": entries + 1, "increment": 1}}}, f)
+    return home
+
+
+def run_probe(code, home):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", HOME=home, USERPROFILE=home)
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100_000, help="Synthetic index size")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="Fail if median time to first window exceeds this")
+    args = parser.parse_args()
+
+    home = make_home(args.entries)
+    try:
+        imports = [run_probe(IMPORT_PROBE, home) for _ in range(args.runs)]
+        windows = [run_probe(WINDOW_PROBE, home) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(home)
+
+    import_ms = statistics.median(imports) * 1000
+    window_ms = statistics.median(windows) * 1000
+    print(f"import screenshot_paster   {import_ms:8.1f} ms (median of {args.runs})")
+    print(f"time to first window       {window_ms:8.1f} ms (median of {args.runs}, {args.entries:,} entries)")
+
+    if args.budget_ms is not None and window_ms > args.budget_ms:
+        print(f"Over budget: {window_ms:.1f} ms > {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Reproducible benchmark suite over the app's hot paths, with JSON output
+and regression checks against a stored baseline.
+
+Runs under the offscreen Qt platform with HOME pointed at a scratch
+directory, on synthetic screenshot-like images and synthetic indexes:
+
+    naming.generate_filename          one call, through ScreenshotLibrary
+    save_image.WxH.queue              ScreenshotPaster.save_image on the GUI thread
+    save_image.WxH.end_to_end         ...until the entry is in the index
+    index.save_index.N                settings write (journal append)
+    index.snapshot.N                  full snapshot write (compaction)
+    index.load_index.N                fresh ScreenshotLibrary.load_index()
+    viewer.construct.N                IndexViewDialog(...) for an N-entry index
+
+    python benchmarks/bench_suite.py --out results.json
+    python benchmarks/bench_suite.py --compare baseline.json --threshold 0.15
+
+With --compare, every metric more than --threshold slower than the
+baseline is flagged and the exit status is 1.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+RESOLUTIONS = {'1080p': (1920, 1080), '4k': (3840, 2160), '8k': (7680, 4320)}
+
+
+def measure(func, repeat, setup=None):
+    """Median, min and max seconds of func() over repeat runs (setup() untimed)"""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'median': statistics.median(times), 'min': min(times), 'max': max(times), 'runs': repeat}
+
+
+def write_index(directory, count):
+    from bench_index_store import make_entries
+    from index_store import write_json_atomic
+    from core import INDEX_FILENAME, DEFAULT_PATTERN_ELEMENTS
+    os.makedirs(directory, exist_ok=True)
+    write_json_atomic(os.path.join(directory, INDEX_FILENAME), {
+        'screenshots': make_entries(count, directory),
+        'custom_counters': {"counter": {"value": count + 1, "increment": 1}},
+        'pattern_elements': list(DEFAULT_PATTERN_ELEMENTS)
+    })
+
+
+def bench_naming(results, workdir, args):
+    from core import ScreenshotLibrary
+    save_directory = os.path.join(workdir, "naming")
+    os.makedirs(save_directory, exist_ok=True)
+    library = ScreenshotLibrary(save_directory, use_daemon=False)
+    library.load_index()
+    calls = 10000
+
+    def batch():
+        for _ in range(calls):
+            library.generate_filename()
+    stats = measure(batch, args.repeat)
+    results['naming.generate_filename'] = {key: value / calls if key != 'runs' else value
+                                           for key, value in stats.items()}
+    library.close()
+
+
+def bench_save_image(results, workdir, args, app):
+    from bench_encoders import make_screenshot
+    from screenshot_paster import ScreenshotPaster
+
+    window = ScreenshotPaster()
+    window.library.ensure_loaded()
+    window.on_index_loaded()
+    window.library.duplicate_settings = dict(window.library.duplicate_settings, policy='off')
+    window.show_save_notice = lambda text: None  # No message boxes piling up offscreen
+
+    def wait_idle():
+        while window.pending_saves:
+            app.processEvents()
+            time.sleep(0.001)
+
+    for name in args.resolutions:
+        width, height = RESOLUTIONS[name]
+        images = [make_screenshot(width, height, seed) for seed in range(args.repeat)]
+        queue_times, total_times = [], []
+        for image in images:
+            start = time.perf_counter()
+            assert window.save_image(image), "capture was not queued"
+            queued = time.perf_counter()
+            wait_idle()
+            queue_times.append(queued - start)
+            total_times.append(time.perf_counter() - start)
+        del images
+        for metric, times in (('queue', queue_times), ('end_to_end', total_times)):
+            results[f'save_image.{name}.{metric}'] = {
+                'median': statistics.median(times), 'min': min(times), 'max': max(times), 'runs': len(times)}
+    window.close()
+
+
+def bench_index(results, workdir, args, app):
+    from core import ScreenshotLibrary
+    from screenshot_paster import IndexViewDialog
+
+    for count in args.sizes:
+        directory = os.path.join(workdir, f"index-{count}")
+        write_index(directory, count)
+        library = ScreenshotLibrary(directory, use_daemon=False)
+        repeat = max(1, args.repeat if count <= 100_000 else args.repeat // 3)
+
+        results[f'index.load_index.{count}'] = measure(library.load_index, repeat)
+        results[f'index.save_index.{count}'] = measure(library.save_index, repeat)
+
+        def snapshot():
+            library.index_store.compact(
+                lambda: dict(library.index_settings(), screenshots=list(library.screenshot_index)), background=False)
+        results[f'index.snapshot.{count}'] = measure(snapshot, repeat)
+
+        def construct():
+            dialog = IndexViewDialog(None, library.screenshot_index, library.similarity, None, library.search)
+            dialog.close()
+            dialog.deleteLater()
+            app.processEvents()
+
+        def fresh_search():
+            # Each dialog starts the search build; let it finish off the clock
+            library.search.build()
+            library.search = type(library.search)(library.screenshot_index)
+        results[f'viewer.construct.{count}'] = measure(construct, repeat, setup=fresh_search)
+        library.search.build()
+        library.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def metadata():
+    from PIL import __version__ as pillow_version
+    from PyQt6.QtCore import QT_VERSION_STR
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        'commit': commit,
+        'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'qt': QT_VERSION_STR,
+        'pillow': pillow_version,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print current vs baseline medians; returns the names of regressed metrics"""
+    regressions = []
+    print(f"\n{'metric':<32} {'baseline':>11} {'current':>11} {'change':>8}")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<32} {'-':>11} {format_seconds(current['median']):>11}      new")
+            continue
+        change = current['median'] / before['median'] - 1 if before['median'] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<32} {format_seconds(before['median']):>11} {format_seconds(current['median']):>11} "
+              f"{change:>+7.0%}{flag}")
+    for name in baseline:
+        if name not in results:
+            print(f"{name:<32} {format_seconds(baseline[name]['median']):>11} {'-':>11}  missing")
+    return regressions
+
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f} ms"
+    return f"{seconds:.2f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', default=None, help="Write results JSON here (default: stdout)")
+    parser.add_argument('--compare', default=None, metavar="BASELINE", help="Results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="Slowdown (fraction of the baseline median) that counts as a regression")
+    parser.add_argument('--only', nargs='+', default=None, choices=['naming', 'save_image', 'index'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 100_000, 1_000_000])
+    parser.add_argument('--resolutions', nargs='+', default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # Isolate from the user's screenshots and display before anything reads them
+    workdir = tempfile.mkdtemp(prefix="pic_queuer-suite-")
+    os.environ['HOME'] = os.path.join(workdir, "home")
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication(sys.argv)
+
+    groups = args.only or ['naming', 'save_image', 'index']
+    results = {}
+    try:
+        if 'naming' in groups:
+            bench_naming(results, workdir, args)
+        if 'save_image' in groups:
+            bench_save_image(results, workdir, args, app)
+        if 'index' in groups:
+            bench_index(results, workdir, args, app)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'meta': metadata(), 'results': results}
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.out}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+from core import save_image_file
+from similarity import image_hash
+
+DROP_OLDEST = 'oldest'
+DROP_NEWEST = 'newest'
+
+
+class BurstCapture:
+    """Capture frames at a fixed interval and encode them while capture continues.
+
+    A capture thread calls ``grab`` on a deadline schedule and pushes frames
+    into a bounded ring buffer; encoder threads drain it and write each
+    frame under the next of the pre-allocated ``filenames``, at the path
+    ``filepath_for(filename)`` returns, with the time it was grabbed as its
+    ``created``. When encoding
+    falls behind and the buffer is full, ``drop_policy`` decides which frame
+    is discarded: ``'oldest'`` keeps the most recent frames, ``'newest'``
+    keeps what is already queued. Names are handed out in capture order as
+    frames are encoded, so dropped frames leave no gaps.
+
+    Each frame goes through ``chain`` (a ProcessingChain, if given) on its
+    encoder thread before it is written.
+
+    ``on_progress(report)`` is called from worker threads after every frame;
+    ``on_finished(report, entries)`` once all frames are written, with the
+    index entries in capture order.
+    """
+
+    def __init__(self, grab, filenames, filepath_for, encoder, thumbnail_dir=None,
+                 interval=0.25, duration=30.0, buffer_size=16, workers=2,
+                 drop_policy=DROP_OLDEST, on_progress=None, on_finished=None, chain=None):
+        self.grab = grab
+        self.filenames = filenames
+        self.filepath_for = filepath_for
+        self.encoder = encoder
+        self.thumbnail_dir = thumbnail_dir
+        self.interval = interval
+        self.duration = duration
+        self.buffer_size = buffer_size
+        self.workers = workers
+        self.drop_policy = drop_policy
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.chain = chain
+
+        self.buffer = deque()
+        self.condition = threading.Condition()
+        self.stopping = threading.Event()
+        self.capture_done = False
+        self.next_name = 0
+        self.entries = {}
+        self.captured = 0
+        self.dropped = 0
+        self.missed_ticks = 0
+        self.errors = 0
+        self.started_at = None
+        self.capture_seconds = 0.0
+        self.threads = []
+        self.capture_thread = None
+        self.finish_thread = None
+
+    @staticmethod
+    def max_frames(interval, duration):
+        return int(duration / interval) + 1
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.threads = [threading.Thread(target=self._encode_loop, name=f"burst-encoder-{i}", daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+        self.capture_thread = threading.Thread(target=self._capture_loop, name="burst-capture", daemon=True)
+        self.capture_thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def wait(self):
+        """Block until every captured frame has been written and on_finished has run"""
+        if self.capture_thread is not None:
+            self.capture_thread.join()
+        if self.finish_thread is not None:
+            self.finish_thread.join()
+
+    def _capture_loop(self):
+        deadline = self.started_at
+        end = self.started_at + self.duration
+        limit = min(self.max_frames(self.interval, self.duration), len(self.filenames))
+        try:
+            while not self.stopping.is_set() and self.captured < limit and deadline <= end:
+                frame = self.grab()
+                # Stamped at grab time: the frame may sit in the buffer or wait for an encoder
+                created = datetime.now().isoformat()
+                with self.condition:
+                    self.captured += 1
+                    if len(self.buffer) >= self.buffer_size:
+                        self.dropped += 1
+                        if self.drop_policy == DROP_OLDEST:
+                            self.buffer.popleft()
+                            self.buffer.append((frame, created))
+                    else:
+                        self.buffer.append((frame, created))
+                    self.condition.notify()
+                frame = None
+
+                # Keep to the schedule; ticks that passed during a slow grab are skipped
+                deadline += self.interval
+                now = time.perf_counter()
+                if now > deadline:
+                    skipped = int((now - deadline) / self.interval)
+                    self.missed_ticks += skipped
+                    deadline += skipped * self.interval
+                else:
+                    self.stopping.wait(deadline - now)
+        finally:
+            self.capture_seconds = time.perf_counter() - self.started_at
+            with self.condition:
+                self.capture_done = True
+                self.condition.notify_all()
+            self.finish_thread = threading.Thread(target=self._finish, name="burst-finish", daemon=True)
+            self.finish_thread.start()
+
+    def _encode_loop(self):
+        while True:
+            with self.condition:
+                while not self.buffer and not self.capture_done:
+                    self.condition.wait()
+                if not self.buffer:
+                    return
+                frame, created = self.buffer.popleft()
+                sequence = self.next_name
+                self.next_name += 1
+            filename = self.filenames[sequence]
+            filepath = self.filepath_for(filename)
+            try:
+                size = save_image_file(frame, filepath, self.encoder, self.thumbnail_dir, self.chain)
+                self.entries[sequence] = {
+                    'filename': filename,
+                    'filepath': filepath,
+                    'created': created,
+                    'size': size,
+                    'phash': image_hash(frame),
+                    'burst_frame': sequence
+                }
+            except Exception as e:
+                print(f"Error saving burst frame {filename}: {e}")
+                self.errors += 1
+            frame = None
+            if self.on_progress is not None:
+                self.on_progress(self.report())
+
+    def _finish(self):
+        for thread in self.threads:
+            thread.join()
+        if self.on_finished is not None:
+            entries = [self.entries[sequence] for sequence in sorted(self.entries)]
+            self.on_finished(self.report(), entries)
+
+    def report(self):
+        elapsed = self.capture_seconds or (time.perf_counter() - self.started_at)
+        return {
+            'captured': self.captured,
+            'saved': len(self.entries),
+            'dropped': self.dropped,
+            'missed_ticks': self.missed_ticks,
+            'errors': self.errors,
+            'names_used': self.next_name,
+            'fps': self.captured / elapsed if elapsed > 0 else 0.0,
+            'target_fps': 1 / self.interval,
+            'elapsed': elapsed
+        }
@@ -0,0 +1,141 @@
+"""
+Clipboard watching for automatic capture.
+
+The watcher is driven by QClipboard.dataChanged only: while nothing is
+copied it does no work at all. A burst of change events (several formats
+announced one after another) restarts a single-shot debounce timer, and
+only when it fires is the clipboard image read and keyed cheaply so the
+same content is not handed on twice.
+
+qimage_to_pil() turns the clipboard's QImage into a Pillow image without
+going back through the OS clipboard, and without copying pixels where the
+formats allow it.
+"""
+
+import sys
+import zlib
+import time
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from PyQt6.QtGui import QImage
+from PyQt6.QtWidgets import QApplication
+
+DEBOUNCE_MS = 150
+KEY_SAMPLE_BYTES = 2 * 1024 * 1024
+
+# Opaque QImage formats Pillow can unpack straight from Qt's buffer. 32-bit
+# formats are native-endian words, so RGB32 is laid out BGRX on little-endian.
+OPAQUE_RAWMODES = {
+    QImage.Format.Format_RGB32: "BGRX" if sys.byteorder == "little" else "XRGB",
+    QImage.Format.Format_RGBX8888: "RGBX",
+    QImage.Format.Format_RGB888: "RGB",
+    QImage.Format.Format_BGR888: "BGR",
+}
+
+
+def pixel_buffer(qimage):
+    """Read-only memoryview over a QImage's pixels (constBits never detaches)"""
+    bits = qimage.constBits()
+    bits.setsize(qimage.sizeInBytes())
+    return memoryview(bits)
+
+
+def image_key(qimage, sample_bytes=KEY_SAMPLE_BYTES):
+    """Cheap content key: size plus Adler-32 over evenly spaced scanlines.
+
+    At most about sample_bytes of pixel data are read, so keying an 8K
+    image costs the same as a 1080p one.
+    """
+    height, stride = qimage.height(), qimage.bytesPerLine()
+    view = pixel_buffer(qimage)
+    step = max(1, height * stride // sample_bytes)
+    checksum = 1
+    for y in range(0, height, step):
+        checksum = zlib.adler32(view[y * stride:(y + 1) * stride], checksum)
+    return qimage.width(), height, qimage.format(), checksum
+
+
+def qimage_to_pil(qimage):
+    """Pillow image over a QImage's pixels, copying as little as possible.
+
+    Images with alpha are converted to RGBA8888 in place (Qt swizzles
+    BGRA to RGBA within the same buffer) and mapped with Image.frombuffer,
+    so the Pillow image shares the QImage's memory and holds a reference
+    to it. Opaque images are unpacked by Pillow straight from Qt's buffer
+    into an RGB image (one copy, no intermediate bytes), so saved files
+    stay RGB. The QImage may be converted in place.
+    """
+    from PIL import Image
+
+    size = (qimage.width(), qimage.height())
+    if qimage.hasAlphaChannel():
+        if qimage.format() != QImage.Format.Format_RGBA8888:
+            qimage.convertTo(QImage.Format.Format_RGBA8888)
+        image = Image.frombuffer("RGBA", size, pixel_buffer(qimage), "raw", "RGBA",
+                                 qimage.bytesPerLine(), 1)
+        image.qimage = qimage  # The pixels belong to the QImage
+        return image
+
+    if qimage.format() not in OPAQUE_RAWMODES:
+        qimage.convertTo(QImage.Format.Format_RGB32)
+    return Image.frombuffer("RGB", size, pixel_buffer(qimage), "raw", OPAQUE_RAWMODES[qimage.format()],
+                            qimage.bytesPerLine(), 1)
+
+
+def clipboard_image():
+    """The clipboard's image as a Pillow image, or None if it holds no image"""
+    clipboard = QApplication.clipboard()
+    if not clipboard.mimeData().hasImage():
+        return None
+    qimage = clipboard.image()
+    return None if qimage.isNull() else qimage_to_pil(qimage)
+
+
+class ClipboardWatcher(QObject):
+    """Emits image_copied(QImage) once per new image placed on the clipboard"""
+    # Passed as a plain object so receivers get this QImage rather than a
+    # shared copy, and can convert it in place without detaching
+    image_copied = pyqtSignal(object)
+
+    def __init__(self, parent=None, debounce_ms=DEBOUNCE_MS):
+        super().__init__(parent)
+        self.clipboard = QApplication.clipboard()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounce_ms)
+        self.timer.timeout.connect(self.check_clipboard)
+        self.last_key = None
+        self.last_cost = 0.0  # Seconds spent in the last check, for profiling
+        self.active = False
+
+    def start(self):
+        if self.active:
+            return
+        self.active = True
+        # Content already on the clipboard when watching starts is not new
+        image = self.clipboard.image()
+        self.last_key = None if image.isNull() else image_key(image)
+        self.clipboard.dataChanged.connect(self.timer.start)
+
+    def stop(self):
+        if not self.active:
+            return
+        self.active = False
+        self.clipboard.dataChanged.disconnect(self.timer.start)
+        self.timer.stop()
+
+    def check_clipboard(self):
+        start = time.perf_counter()
+        try:
+            if not self.clipboard.mimeData().hasImage():
+                return
+            image = self.clipboard.image()
+            if image.isNull():
+                return
+            key = image_key(image)
+            if key == self.last_key:
+                return
+            self.last_key = key
+        finally:
+            self.last_cost = time.perf_counter() - start
+        self.image_copied.emit(image)
@@ -0,0 +1,265 @@
+"""
+Columnar in-memory form of the screenshot index.
+
+A JSON index holds one dict per capture, each with its own copy of the
+save directory inside ``filepath``, an ISO ``created`` string and usually
+a hex ``phash`` and ``digest``. CompactEntries keeps the same data in
+columns instead:
+
+    filenames   list of str (names are unique, so interning would share nothing)
+    directory   stored once; filepath is rebuilt as directory/filename
+    created     array('q') of microseconds since 1970-01-01 (naive, like the ISO strings)
+    sizes       array('q')
+    phashes     array('Q') plus a presence bytearray
+    digests     32 bytes each, packed in a bytearray, for the positions listed
+                in array('q') digest_positions (older entries have none)
+
+Anything that does not fit a column exactly (a filepath elsewhere, an ISO
+string that would not round-trip, extra fields such as ``frame`` or
+``duplicate_of``) is kept per entry in a small side dict, so converting
+back gives the original values. Reading an entry builds a fresh dict, so
+callers that only look entries up keep working unchanged; the index file
+on disk stays a list of dicts.
+"""
+
+import os
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+COLUMNS = ('filename', 'filepath', 'created', 'size', 'phash', 'digest')
+DIGEST_BYTES = 32  # SHA-256
+BULK_MIN = 1000  # Below this, extend() converts entry by entry
+
+
+def _canonical(created):
+    """Whether an ISO string is exactly what isoformat() gives back for it"""
+    return (type(created) is str and len(created) in (19, 26) and created[10] == "T"
+            and not created.endswith(".000000"))
+
+
+def _hex_digest(digest):
+    """Whether a digest is exactly what hex() gives back for DIGEST_BYTES bytes"""
+    if type(digest) is not str or len(digest) != 2 * DIGEST_BYTES or digest != digest.lower():
+        return False
+    try:
+        bytes.fromhex(digest)
+    except ValueError:
+        return False
+    return True
+
+
+class CompactEntries:
+    """List-like, append-only sequence of index entries stored as columns"""
+    append_only = True  # Positions never move, so views may keep them
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.prefix = os.path.join(directory, "")  # directory/filename by concatenation
+        self.filenames = []
+        self.created = array('q')
+        self.sizes = array('q')
+        self.phashes = array('Q')
+        self.has_phash = bytearray()
+        self.digest_positions = array('q')  # Ascending, since entries are only appended
+        self.digests = bytearray()
+        self.extra = {}  # position -> fields kept as-is
+
+    @classmethod
+    def from_entries(cls, entries, directory):
+        """Convert a list of entry dicts saved under directory"""
+        compact = cls(directory)
+        compact.extend(entries)
+        return compact
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __bool__(self):
+        return bool(self.filenames)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._entry(position) for position in range(*i.indices(len(self.filenames)))]
+        return self._entry(range(len(self.filenames))[i])  # Negative indexes and IndexError as for a list
+
+    def __iter__(self):
+        for position in range(len(self.filenames)):
+            yield self._entry(position)
+
+    def _entry(self, position):
+        filename = self.filenames[position]
+        entry = {
+            'filename': filename,
+            'filepath': self.prefix + filename,
+            'created': (EPOCH + self.created[position] * MICROSECOND).isoformat(),
+            'size': self.sizes[position],
+        }
+        if self.has_phash[position]:
+            entry['phash'] = f"{self.phashes[position]:016x}"
+        found = bisect_left(self.digest_positions, position)
+        if found < len(self.digest_positions) and self.digest_positions[found] == position:
+            entry['digest'] = self.digests[found * DIGEST_BYTES:(found + 1) * DIGEST_BYTES].hex()
+        extra = self.extra.get(position)
+        if extra is not None:
+            entry.update(extra)
+        return entry
+
+    def _convert(self, entry):
+        """(filename, created micros, size, phash int or None, digest bytes or None, leftover fields) for one entry"""
+        extra = {key: value for key, value in entry.items() if key not in COLUMNS}
+        filename = entry['filename']
+        filepath = entry['filepath']
+        if filepath != self.prefix + filename:
+            extra['filepath'] = filepath
+
+        created = entry['created']
+        micros = 0
+        try:
+            # Only the two forms isoformat() produces are stored as integers
+            if _canonical(created):
+                micros = (datetime.fromisoformat(created) - EPOCH) // MICROSECOND
+            else:
+                extra['created'] = created
+        except (ValueError, IndexError, TypeError):
+            extra['created'] = created
+
+        size = entry.get('size')
+        if type(size) is not int:
+            extra['size'] = size
+            size = 0
+
+        phash = entry.get('phash')
+        value = None
+        if type(phash) is str and len(phash) == 16 and phash == phash.lower():
+            try:
+                value = int(phash, 16)
+            except ValueError:
+                pass
+        if value is None and 'phash' in entry:
+            extra['phash'] = phash
+
+        digest = entry.get('digest')
+        raw = None
+        if _hex_digest(digest):
+            raw = bytes.fromhex(digest)
+        elif 'digest' in entry:
+            extra['digest'] = digest
+        return filename, micros, size, value, raw, extra
+
+    def append(self, entry):
+        filename, micros, size, value, raw, extra = self._convert(entry)
+        # Every column grows together, after anything that could raise
+        if extra:
+            self.extra[len(self.filenames)] = extra
+        if raw is not None:
+            self.digest_positions.append(len(self.filenames))
+            self.digests += raw
+        self.filenames.append(filename)
+        self.created.append(micros)
+        self.sizes.append(size)
+        self.phashes.append(value or 0)
+        self.has_phash.append(value is not None)
+
+    def extend(self, entries):
+        """Append many entries, converting whole columns at once with NumPy"""
+        if not isinstance(entries, list):
+            entries = list(entries)
+        if len(entries) < BULK_MIN:
+            for entry in entries:
+                self.append(entry)
+            return
+        import numpy as np
+
+        prefix = self.prefix
+        filenames = [entry['filename'] for entry in entries]
+        created = [entry['created'] for entry in entries]
+        phashes = [entry.get('phash') for entry in entries]
+        digests = [entry.get('digest') for entry in entries]
+        # Entries whose fields all fit their columns exactly; the rest go through _convert
+        regular = [len(entry) == 4 + (phash is not None) + (digest is not None) and type(entry.get('size')) is int
+                   and entry.get('filepath') == prefix + filename and _canonical(stamp)
+                   and (phash is None or (type(phash) is str and len(phash) == 16))
+                   and (digest is None or _hex_digest(digest))
+                   for entry, filename, stamp, phash, digest in zip(entries, filenames, created, phashes, digests)]
+
+        stamps = [stamp if ok else "1970-01-01T00:00:00" for stamp, ok in zip(created, regular)]
+        hexes = [phash if ok and phash is not None else "0" * 16 for phash, ok in zip(phashes, regular)]
+        joined = "".join(hexes)
+        try:
+            micros = np.array(stamps, dtype='datetime64[us]').astype(np.int64)
+            if joined != joined.lower():
+                raise ValueError("upper-case hash")
+            hashes = np.frombuffer(bytes.fromhex(joined), dtype='>u8').astype(np.uint64)
+        except ValueError:
+            # Something only the per-entry path copes with
+            for entry in entries:
+                self.append(entry)
+            return
+        sizes = [entry['size'] if ok else 0 for entry, ok in zip(entries, regular)]
+        present = bytearray(ok and phash is not None for phash, ok in zip(phashes, regular))
+        raws = [bytes.fromhex(digest) if ok and digest is not None else None for digest, ok in zip(digests, regular)]
+
+        start = len(self.filenames)
+        for offset in [offset for offset, ok in enumerate(regular) if not ok]:
+            _, micros[offset], sizes[offset], value, raw, extra = self._convert(entries[offset])
+            hashes[offset] = value or 0
+            present[offset] = value is not None
+            raws[offset] = raw
+            if extra:
+                self.extra[start + offset] = extra
+        self.filenames.extend(filenames)
+        self.created.frombytes(micros.tobytes())
+        self.sizes.extend(sizes)
+        self.phashes.frombytes(hashes.tobytes())
+        self.has_phash.extend(present)
+        for offset, raw in enumerate(raws):
+            if raw is not None:
+                self.digest_positions.append(start + offset)
+                self.digests += raw
+
+    def subset(self, positions):
+        """A new CompactEntries with the entries at the given positions, in that order"""
+        import numpy as np
+        keep = np.asarray(positions, dtype=np.int64)
+        subset = CompactEntries(self.directory)
+        subset.filenames = [self.filenames[position] for position in keep.tolist()]
+        for column in ('created', 'sizes', 'phashes'):
+            values = np.asarray(getattr(self, column))[keep]
+            getattr(subset, column).frombytes(values.tobytes())
+        subset.has_phash = bytearray(np.frombuffer(self.has_phash, dtype=np.uint8)[keep].tobytes())
+        if self.digest_positions:
+            positions = np.asarray(self.digest_positions, dtype=np.int64)
+            found = np.minimum(np.searchsorted(positions, keep), len(positions) - 1)
+            hit = positions[found] == keep
+            subset.digest_positions.frombytes(np.flatnonzero(hit).astype(np.int64).tobytes())
+            digests = np.frombuffer(self.digests, dtype=np.uint8).reshape(-1, DIGEST_BYTES)
+            subset.digests = bytearray(digests[found[hit]].tobytes())
+        if self.extra:
+            subset.extra = {new: self.extra[old] for new, old in enumerate(keep.tolist()) if old in self.extra}
+        return subset
+
+    def frozen(self):
+        """The entries appended so far, as a view that later appends don't change.
+
+        Reading it builds the dicts, so it can be handed to another thread
+        (e.g. the snapshot writer) instead of converting on this one.
+        """
+        from search import SearchResults
+        return SearchResults(self, range(len(self.filenames)))
+
+    def ordered(self, column, descending=False):
+        """All entries sorted by filename, created or size, as a list-like view"""
+        from search import SearchResults
+        if column == 'filename':
+            keys = self.filenames
+        elif column == 'size':
+            keys = self.sizes
+        else:
+            keys = self.created
+        if self.extra and any(column in extra for extra in self.extra.values()):
+            keys = [entry[column] for entry in self]  # Some values live outside the column
+        positions = sorted(range(len(keys)), key=keys.__getitem__, reverse=descending)
+        return SearchResults(self, positions)
@@ -0,0 +1,565 @@
+"""
+Naming, counter, index and save logic shared by the GUI and the headless tools.
+
+Nothing here imports Qt, and heavy modules (PIL, NumPy) are only imported
+by the functions that need them, so importing this module stays cheap.
+"""
+
+import os
+import copy
+import bisect
+import threading
+from datetime import datetime
+
+from index_store import JournaledIndex, open_index_store
+from naming import compile_pattern, pattern_string
+from encoders import DEFAULT_ENCODER, create_encoder
+from similarity import SimilarityIndex, DEFAULT_DUPLICATES, hamming, image_hash, pixel_digest
+from thumbnails import THUMBNAIL_DIR, write_thumbnail
+from deltas import DeltaStore, DEFAULT_DELTAS
+from search import SearchIndex
+from metrics import METRICS, DEFAULT_METRICS
+from compact import CompactEntries
+from processing import DEFAULT_PROCESSING, create_chain
+from allocator import CounterAllocator, NameRegistry
+from reconcile import Reconciler
+from spill import SPILL_DIR, DEFAULT_SAVE_QUEUE, SaveQueue, encoder_state
+
+DEFAULT_SAVE_DIRECTORY = os.path.expanduser("~/Pictures/Screenshots")
+DEFAULT_PATTERN_ELEMENTS = ["date", "_", "time", "_", "counter"]
+INDEX_FILENAME = "screenshot_index.json"
+
+
+def default_counters():
+    return {"counter": {"value": 1, "increment": 1}}
+
+
+def save_image_file(image, filepath, encoder, thumbnail_dir=None, chain=None):
+    """Run the processing chain, encode the result to filepath (plus its thumbnail) and return the file size"""
+    if chain:
+        image = chain.apply(image)
+    # Pillow encodes and writes in one pass, so the two are timed together
+    with METRICS.time('encode_write'):
+        encoder.save(image, filepath)
+    with METRICS.time('getsize'):
+        size = os.path.getsize(filepath)
+    # Thumbnail from the frame already in memory, so the viewer never decodes it
+    if thumbnail_dir:
+        with METRICS.time('thumbnail'):
+            try:
+                write_thumbnail(image, filepath, thumbnail_dir)
+            except Exception as e:
+                print(f"Error writing thumbnail: {e}")
+    return size
+
+
+class ScreenshotLibrary:
+    """One save directory: its naming pattern, counters, settings and index"""
+
+    def __init__(self, save_directory=DEFAULT_SAVE_DIRECTORY, use_daemon=True):
+        self.pattern_elements = list(DEFAULT_PATTERN_ELEMENTS)  # Track pattern as list
+        self.custom_counters = default_counters()  # Custom counters
+        self.naming_pattern = pattern_string(self.pattern_elements, self.custom_counters)
+        self.encoder_settings = dict(DEFAULT_ENCODER)  # Image format and compression
+        self.duplicate_settings = dict(DEFAULT_DUPLICATES)  # skip/link/off near-identical pastes
+        self.delta_settings = dict(DEFAULT_DELTAS)  # Store only changed tiles between keyframes
+        self.deltas = DeltaStore(self.delta_settings)
+        self.metrics_settings = dict(DEFAULT_METRICS)  # Save-stage timings and their export
+        self.processing_settings = dict(DEFAULT_PROCESSING)  # Trim/downscale/redact/grayscale before encoding
+        self.queue_settings = dict(DEFAULT_SAVE_QUEUE)  # Memory and spill budgets of the pending-save queue
+        self.allocator = CounterAllocator(self.persist_counters)  # Counter ranges reserved ahead of use
+        self.names = NameRegistry()  # Names taken in each directory
+        self.screenshot_index = CompactEntries(save_directory)
+        self.similarity = SimilarityIndex(self.screenshot_index)
+        self.search = SearchIndex(self.screenshot_index)  # Built on first search, then kept current
+        self.pending_hashes = {}  # filepath -> phash of captures still being encoded
+        self.pending_digests = {}  # filepath -> pixel digest of queued captures (exact duplicate match)
+        self.index_store = None
+        self.use_daemon = use_daemon  # Defer to a running index daemon for this directory
+        self.daemon = None
+        self.daemon_counters = None  # Counters as last reported by the daemon
+        self._loader = None
+        self._loaded = None
+        self.needs_rebuild = False  # The snapshot was unreadable; entries come back from disk
+        self._reconciler = None
+        self._reconciled = None
+        self.set_directory(save_directory)
+
+    def set_directory(self, save_directory):
+        self.save_directory = save_directory
+        self.index_file = os.path.join(save_directory, INDEX_FILENAME)
+        self.thumbnail_dir = os.path.join(save_directory, THUMBNAIL_DIR)
+        self.spill_dir = os.path.join(save_directory, SPILL_DIR)
+
+    # Index loading
+    def read_index(self):
+        """Open the index store and read it; safe to call from a worker thread"""
+        store = open_index_store(self.index_file)
+        try:
+            # JSON snapshot plus replayed journal, or a lazy view over screenshot_index.db
+            return store, store.load()
+        except Exception as e:
+            print(f"Error loading index: {e}")
+            return store, None
+
+    def apply_index(self, store, data):
+        """Adopt a store and its data read by read_index"""
+        if self.index_store is not None:
+            self.release_counters()
+            self.index_store.close()
+        self.index_store = store
+        self.needs_rebuild = getattr(store, 'corrupt_file', None) is not None
+        if data is None:
+            self.screenshot_index = CompactEntries(self.save_directory)
+            self.custom_counters = default_counters()
+        else:
+            self.screenshot_index = data.get('screenshots', [])
+            if isinstance(self.screenshot_index, list):
+                # JSON entries become columns; lazy SQLite and sharded views stay as they are
+                self.screenshot_index = CompactEntries.from_entries(self.screenshot_index, self.save_directory)
+
+            # Load custom counters
+            saved_counters = data.get('custom_counters', {})
+            if saved_counters:
+                self.custom_counters = saved_counters
+            else:
+                # Migrate old counter format
+                old_counter = data.get('counter', 1)
+                self.custom_counters = {"counter": {"value": old_counter, "increment": 1}}
+
+            # Load pattern elements if available
+            saved_elements = data.get('pattern_elements', [])
+            if saved_elements:
+                self.pattern_elements = saved_elements
+
+            # Load image format and duplicate handling if available
+            self.encoder_settings = data.get('encoder', dict(DEFAULT_ENCODER))
+            self.duplicate_settings = data.get('duplicates', dict(DEFAULT_DUPLICATES))
+            self.delta_settings = data.get('deltas', dict(DEFAULT_DELTAS))
+            self.metrics_settings = data.get('metrics', dict(DEFAULT_METRICS))
+            self.processing_settings = data.get('processing', dict(DEFAULT_PROCESSING))
+            self.queue_settings = data.get('save_queue', dict(DEFAULT_SAVE_QUEUE))
+
+        self.naming_pattern = pattern_string(self.pattern_elements, self.custom_counters)
+        self.similarity = SimilarityIndex(self.screenshot_index,
+                                          self.duplicate_settings.get('recent', 20))
+        self.search = SearchIndex(self.screenshot_index)
+        self.deltas = DeltaStore(self.delta_settings)
+        self.allocator = CounterAllocator(self.persist_counters)
+        self.names = NameRegistry()
+        self.connect_daemon()
+
+    def load_index(self):
+        self.ensure_loaded()
+        self.apply_index(*self.read_index())
+
+    def load_index_async(self, callback=None):
+        """Read the index on a background thread; callback runs on that thread when done.
+
+        The result is applied by ensure_loaded(), which the owner calls from
+        its own thread (e.g. in response to the callback, or before a save).
+        """
+        def worker():
+            self._loaded = self.read_index()
+            if callback is not None:
+                callback()
+        self._loader = threading.Thread(target=worker, name="index-loader", daemon=True)
+        self._loader.start()
+
+    def ensure_loaded(self):
+        """Wait for a background load and apply it; returns True if one was applied"""
+        if self._loader is None:
+            return False
+        self._loader.join()
+        self._loader = None
+        loaded, self._loaded = self._loaded, None
+        self.apply_index(*loaded)
+        return True
+
+    # Reconciliation with the directory
+    def _scanner(self):
+        """A Reconciler for the directory, and whether to walk subfolders (shards)"""
+        from shards import ShardedIndex
+        return Reconciler(self.save_directory), isinstance(self.index_store, ShardedIndex)
+
+    def reconcile(self, full=False):
+        """Compare the directory with the index and apply the result; returns a status line"""
+        reconciler, recursive = self._scanner()
+        return self.apply_reconcile(reconciler.scan(self.screenshot_index, recursive=recursive,
+                                                    full=full or self.needs_rebuild))
+
+    def reconcile_async(self, callback=None):
+        """Scan the directory against the index on a background thread.
+
+        As with load_index_async, callback runs on that thread and the
+        owner applies the result with finish_reconcile(). Only indexes that
+        are append-only in memory can be scanned while saves continue;
+        returns False if no scan was started.
+        """
+        entries = self.screenshot_index
+        if not getattr(entries, 'append_only', False) or self._reconciler is not None:
+            return False
+        reconciler, recursive = self._scanner()
+        count, full = len(entries), self.needs_rebuild
+
+        def worker():
+            try:
+                self._reconciled = reconciler.scan(entries, count, recursive, full)
+            except Exception as e:
+                print(f"Error reconciling index: {e}")
+            if callback is not None:
+                callback()
+        self._reconciler = threading.Thread(target=worker, name="index-reconciler", daemon=True)
+        self._reconciler.start()
+        return True
+
+    def finish_reconcile(self):
+        """Wait for a background scan and apply it; returns its status line, or None if nothing changed"""
+        if self._reconciler is None:
+            return None
+        self._reconciler.join()
+        self._reconciler = None
+        plan, self._reconciled = self._reconciled, None
+        if plan is None:
+            return None
+        summary = self.apply_reconcile(plan)
+        return summary if plan else None
+
+    def apply_reconcile(self, plan):
+        """Adopt a Reconciler pass: add new files, drop missing ones, update sizes.
+
+        Missing entries can only be dropped from a JSON index this process
+        owns; the entries are then rebuilt from the columns and written as a
+        fresh snapshot in the background. Otherwise only new files are added,
+        through the journal or the daemon.
+        """
+        if plan.entries is not self.screenshot_index:
+            return "Index reloaded during the scan; nothing applied"
+        entries = self.screenshot_index
+        # Entries appended since the scan started (saves, other passes) win
+        known = {entry['filepath'] for entry in entries[plan.count:]}
+        added = [entry for entry in plan.added if entry['filepath'] not in known]
+        removed = [position for position in plan.removed
+                   if not os.path.exists(entries[position]['filepath'])]
+
+        owned = isinstance(entries, CompactEntries) and isinstance(self.index_store, JournaledIndex) \
+            and self.check_daemon() is None
+        # Large batches (e.g. a rebuild) also go straight into a snapshot instead of the journal
+        rewrite = owned and bool(removed or plan.resized or len(added) >= self.index_store.compact_threshold)
+        if rewrite and self.index_store.compacting():
+            return "Index snapshot is being written; reconcile again later"
+        summary = plan.summary()
+        for entry in added:
+            self.names.add(os.path.dirname(entry['filepath']), entry['filename'])
+        if rewrite:
+            dropped = set(removed)
+            keep = [position for position in range(len(entries)) if position not in dropped]
+            rebuilt = entries.subset(keep)
+            for position, size in plan.resized.items():
+                if position not in dropped:
+                    new_position = bisect.bisect_left(keep, position)
+                    rebuilt.sizes[new_position] = size
+                    extra = rebuilt.extra.get(new_position)
+                    if extra is not None and 'size' in extra:
+                        rebuilt.extra[new_position] = {key: value for key, value in extra.items()
+                                                       if key != 'size'}
+            rebuilt.extend(added)
+            self.screenshot_index = rebuilt
+            self.similarity = SimilarityIndex(rebuilt, self.duplicate_settings.get('recent', 20))
+            self.search = SearchIndex(rebuilt)
+            self.index_store.compact(self.snapshot_data)
+        else:
+            if added:
+                self.add_entries(added)
+            if removed or plan.resized:
+                summary += " (missing and changed entries are kept: the index is shared or not JSON)"
+        self.needs_rebuild = False
+        return summary
+
+    # Index daemon
+    def connect_daemon(self):
+        """Hand naming and index writes to the directory's daemon, if one is running"""
+        self.disconnect_daemon()
+        if not self.use_daemon:
+            return False
+        from daemon import DaemonClient
+        client = DaemonClient.connect(self.save_directory)
+        if client is None:
+            return False
+        self.daemon = client
+        self.adopt_daemon_settings(client.settings())
+        return True
+
+    def disconnect_daemon(self):
+        if self.daemon is not None:
+            self.daemon.close()
+            self.daemon = None
+
+    def adopt_daemon_settings(self, settings):
+        self.custom_counters = settings['custom_counters']
+        self.daemon_counters = copy.deepcopy(self.custom_counters)
+        self.pattern_elements = settings['pattern_elements']
+        self.encoder_settings = settings['encoder']
+        self.duplicate_settings = settings['duplicates']
+        self.delta_settings = settings.get('deltas', dict(DEFAULT_DELTAS))
+        self.metrics_settings = settings.get('metrics', dict(DEFAULT_METRICS))
+        self.processing_settings = settings.get('processing', dict(DEFAULT_PROCESSING))
+        self.queue_settings = settings.get('save_queue', dict(DEFAULT_SAVE_QUEUE))
+        self.naming_pattern = pattern_string(self.pattern_elements, self.custom_counters)
+        self.deltas = DeltaStore(self.delta_settings)
+
+    def check_daemon(self):
+        """Before a write: notice a daemon started since the index was loaded"""
+        if self.daemon is None and self.use_daemon:
+            from daemon import DaemonClient
+            if DaemonClient.running(self.save_directory):
+                self.connect_daemon()
+        return self.daemon
+
+    def daemon_request(self, method, *args):
+        """Call the daemon, or return None if there is none.
+
+        If the daemon went away, the index is reloaded from disk (picking up
+        everything it committed) and the caller carries on writing directly.
+        """
+        if self.check_daemon() is None:
+            return None
+        from daemon import DaemonUnavailable
+        try:
+            return getattr(self.daemon, method)(*args)
+        except DaemonUnavailable as e:
+            print(f"{e}; writing the index directly")
+            self.disconnect_daemon()
+            self.load_index()
+            return None
+
+    # Index updates
+    def add_to_index(self, filename, filepath, size=None, **extra):
+        if size is None:
+            size = os.path.getsize(filepath)
+        entry = {
+            'filename': filename,
+            'filepath': filepath,
+            'created': datetime.now().isoformat(),
+            'size': size
+        }
+        entry.update(extra)
+
+        with METRICS.time('index_append'):
+            if self.daemon_request('add', [entry]):
+                self.screenshot_index.append(entry)
+                self.similarity.add(entry)
+                self.search.add(entry)
+                return entry
+
+            self.screenshot_index.append(entry)
+            self.similarity.add(entry)
+            self.search.add(entry)
+
+            # Journal the entry together with the advanced counters
+            self.index_store.append(entry=entry, settings=self.index_settings())
+            self.compact_index_if_needed()
+        return entry
+
+    def add_entries(self, entries):
+        """Append a batch of ready-made entries with a single index write"""
+        if not self.daemon_request('add', entries):
+            self.index_store.append_many(entries, settings=self.index_settings())
+        for entry in entries:
+            self.screenshot_index.append(entry)
+            self.similarity.add(entry)
+            self.search.add(entry)
+        if self.daemon is None:
+            self.compact_index_if_needed()
+
+    def save_index(self):
+        with METRICS.time('save_index'):
+            settings = self.daemon_request('settings', self.index_settings(), self.daemon_counters)
+            if settings is not None:
+                self.adopt_daemon_settings(settings)
+                return
+            self.index_store.append(settings=self.index_settings())
+            self.compact_index_if_needed()
+
+    def index_settings(self):
+        return {
+            'custom_counters': self.custom_counters,
+            'pattern_elements': self.pattern_elements,
+            'naming_pattern': self.naming_pattern,
+            'encoder': self.encoder_settings,
+            'duplicates': self.duplicate_settings,
+            'deltas': self.delta_settings,
+            'metrics': self.metrics_settings,
+            'processing': self.processing_settings,
+            'save_queue': self.queue_settings
+        }
+
+    def compact_index_if_needed(self):
+        """Fold the journal into a fresh snapshot in the background once it grows large"""
+        if not self.index_store.needs_compaction():
+            return
+        self.index_store.compact(self.snapshot_data)
+
+    def snapshot_data(self):
+        """Copy of the settings and entries for a snapshot (called by the store under its journal lock)"""
+        data = copy.deepcopy(self.index_settings())
+        if isinstance(self.screenshot_index, CompactEntries):
+            data['screenshots'] = self.screenshot_index.frozen()  # Expanded on the compactor thread
+        else:
+            data['screenshots'] = list(self.screenshot_index)
+        return data
+
+    def close(self):
+        self.ensure_loaded()
+        if self._reconciler is not None:
+            self._reconciler.join()
+            self._reconciler = None
+        self.disconnect_daemon()
+        if self.index_store is not None:
+            self.release_counters()
+            self.index_store.close()
+
+    # Naming
+    def set_pattern(self, pattern_elements):
+        self.pattern_elements = pattern_elements
+        self.update_naming_pattern()
+
+    def update_naming_pattern(self):
+        self.naming_pattern = pattern_string(self.pattern_elements, self.custom_counters)
+        return self.naming_pattern
+
+    def create_encoder(self):
+        return create_encoder(self.encoder_settings)
+
+    def create_chain(self):
+        return create_chain(self.processing_settings)
+
+    def create_save_queue(self, on_pressure=None):
+        return SaveQueue.from_settings(self.spill_dir, self.queue_settings, on_pressure)
+
+    def generate_filename(self, extension='.png'):
+        return self.generate_filenames(1, extension)[0]
+
+    def generate_filenames(self, count, extension='.png'):
+        """Allocate filenames for several queued images at once; safe to call from any thread"""
+        return self._allocate_filenames(count, extension)[0]
+
+    def _allocate_filenames(self, count, extension):
+        """Filenames plus the counter values they started from (None when a daemon named them)"""
+        allocated = self.daemon_request('allocate', count, extension)
+        if allocated is not None:
+            filenames, self.custom_counters = allocated
+            self.daemon_counters = copy.deepcopy(self.custom_counters)
+            return filenames, None
+        pattern = compile_pattern(self.pattern_elements, self.custom_counters)
+        start = self.allocator.take(self.custom_counters, pattern.counters, count)
+        counters = {name: dict(self.custom_counters[name], value=value) for name, value in start.items()}
+        filenames = pattern.render_batch(counters, count, advance=False, extension=extension)
+        return [self.claim_filename(filename, extension) for filename in filenames], (pattern.counters, start, count)
+
+    def claim_filename(self, filename, extension=''):
+        """filename, or filename_N if that name is already taken where it would be written"""
+        directory = os.path.dirname(self.filepath_for(filename))
+        return self.names.claim(directory, filename, extension)
+
+    def persist_counters(self):
+        """Write the counters (with the other settings) durably; the allocator's range reservations"""
+        if self.index_store is not None and self.daemon is None:
+            # Naming may come before the first save has created the directory
+            os.makedirs(self.save_directory, exist_ok=True)
+            self.index_store.append(settings=self.index_settings())
+
+    def release_counters(self):
+        """Give the unused rest of the reserved counter range back before the index is closed"""
+        if self.daemon is None and self.allocator.rewind(self.custom_counters):
+            self.persist_counters()
+
+    def reserve_filenames(self, count, extension='.png'):
+        """Allocate names for up to count frames, persisted before use; pair with release_filenames"""
+        return self._allocate_filenames(count, extension)
+
+    def release_filenames(self, reservation, used):
+        """Hand back the reserved names that were never used.
+
+        Counters are only rewound if nothing else allocated a name since the
+        reservation, so an interleaved save can never be given a used name.
+        """
+        if reservation is None or self.daemon is not None:
+            return  # Other clients may already have allocated past the reservation
+        names, start, count = reservation
+        self.allocator.release(self.custom_counters, names, start, count, used)
+
+    def set_delta_storage(self, enabled):
+        self.delta_settings['enabled'] = enabled
+        self.deltas = DeltaStore(self.delta_settings)
+
+    def prepare_capture(self, image):
+        """Encoder, filename, filepath and extra index fields for a single capture.
+
+        With delta storage on, the capture is compared tile by tile against
+        the last keyframe and may be written as a delta frame instead. Not
+        while a processing chain is set: tiles are compared before
+        processing, which may change the frame's size.
+        """
+        encoder = self.create_encoder()
+        if not self.plans_deltas():
+            filename = self.generate_filename(encoder.extension)
+            return encoder, filename, self.filepath_for(filename), {}
+        return self.deltas.plan(image, encoder, self.generate_filename, self.filepath_for)
+
+    def plans_deltas(self):
+        """Whether prepare_capture hashes the capture's tiles against a keyframe (too slow for the GUI thread)"""
+        return bool(self.delta_settings.get('enabled')) and not self.processing_settings.get('stages')
+
+    def capture_meta(self, filename, filepath, encoder, extra):
+        """What the save queue keeps with a capture, so a spilled one can be saved and indexed after a crash"""
+        return {'filename': filename, 'filepath': filepath, 'entry': extra, 'created': datetime.now().isoformat(),
+                'encoder': encoder_state(encoder, self.encoder_settings),
+                'processing': self.processing_settings.get('stages', [])}
+
+    def filepath_for(self, filename):
+        """Where a new capture is written: the save directory, or today's shard"""
+        if hasattr(self.index_store, 'filepath_for'):
+            return self.index_store.filepath_for(filename, datetime.now().isoformat())
+        return os.path.join(self.save_directory, filename)
+
+    def generate_filename_preview(self):
+        """Generate a preview filename without incrementing counters"""
+        if not self.pattern_elements:
+            return ""
+        pattern = compile_pattern(self.pattern_elements, self.custom_counters)
+        return pattern.render(self.next_counters(), advance=False, extension=self.create_encoder().extension)
+
+    def next_counters(self):
+        """Copy of the counters at the values the next filename gets (not the reserved range's end)"""
+        pattern = compile_pattern(self.pattern_elements, self.custom_counters)
+        values = self.allocator.peek(self.custom_counters, pattern.counters)
+        return {name: dict(data, value=values.get(name, data['value']))
+                for name, data in self.custom_counters.items()}
+
+    # Duplicates
+    def find_duplicate(self, image):
+        """Check a new capture against recent and still-queued ones.
+
+        Returns (phash, digest, duplicate_entry, queued_filename); phash is
+        None when duplicate detection is off. With the default 'exact' match
+        only a capture with the very same pixels is a duplicate, judged by a
+        pixel digest that the caller stores in the entry next to phash; with
+        'near', a dHash within max_distance bits is enough and digest is None.
+        """
+        settings = self.duplicate_settings
+        if settings.get('policy', 'skip') == 'off':
+            return None, None, None, None
+        phash = image_hash(image)
+        max_distance = settings.get('max_distance', 4)
+        # Repeated Ctrl+V can arrive before the first copy finished saving
+        if settings.get('match', 'exact') == 'exact':
+            digest = pixel_digest(image)
+            queued = next((path for path, queued_digest in list(self.pending_digests.items())
+                           if queued_digest == digest), None)
+        else:
+            digest = None
+            queued = next((path for path, queued_hash in list(self.pending_hashes.items())
+                           if hamming(phash, queued_hash) <= max_distance), None)
+        duplicate = self.similarity.find_recent_duplicate(phash, digest, max_distance)
+        return phash, digest, duplicate, queued and os.path.basename(queued)
@@ -0,0 +1,333 @@
+"""
+Single-writer index daemon for one save directory.
+
+    python -m pic_queuer daemon [--dir DIR]
+
+While a daemon runs it is the only process that writes the directory's
+index and counters. Front-ends (the GUI, the ingest command, scripts)
+connect over a local socket (a Unix domain socket, or a named pipe on
+Windows), ask it for filenames and hand it finished entries. Requests
+from all clients go to one writer thread, which applies everything that
+arrived together and persists it with a single journal write (group
+commit) before replying. Messages are JSON objects, one per frame.
+"""
+
+import os
+import sys
+import json
+import queue
+import shutil
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from multiprocessing.connection import Listener, Client
+
+from core import ScreenshotLibrary, save_image_file
+
+SOCKET_NAME = ".pic_queuer.sock"
+MAX_SOCKET_PATH = 100  # sun_path is 104-108 bytes depending on the platform
+
+
+class DaemonError(Exception):
+    """A request the daemon rejected"""
+
+
+class DaemonUnavailable(DaemonError):
+    """The connection to the daemon was lost"""
+
+
+def daemon_address(save_directory):
+    """Socket path (or pipe name) of the daemon serving save_directory"""
+    save_directory = os.path.abspath(save_directory)
+    key = hashlib.sha1(os.path.normcase(save_directory).encode()).hexdigest()[:16]
+    if sys.platform == "win32":
+        return rf"\\.\pipe\pic_queuer-{key}"
+    path = os.path.join(save_directory, SOCKET_NAME)
+    if len(path) > MAX_SOCKET_PATH:
+        path = os.path.join(tempfile.gettempdir(), f"pic_queuer-{key}.sock")
+    return path
+
+
+def address_exists(address):
+    """Whether a daemon's socket file or named pipe exists, without connecting to it"""
+    if sys.platform != "win32":
+        return os.path.exists(address)
+    # Listing the pipe namespace does not open the pipe, unlike stat(), which would use up an instance
+    pipe_directory, name = address.rsplit("\\", 1)
+    try:
+        return name.lower() in (pipe.lower() for pipe in os.listdir(pipe_directory + "\\"))
+    except OSError:
+        return True  # Cannot tell: let the connect attempt decide
+
+
+def merge_counters(current, theirs, base):
+    """Three-way merge of a client's counters into the daemon's.
+
+    base is what the client last heard from the daemon: values the client
+    did not touch keep the daemon's (possibly advanced) value, explicit
+    edits such as a reset win, and counters added or deleted by the client
+    are added or deleted.
+    """
+    merged = {}
+    for name, data in theirs.items():
+        if name in current and base.get(name, {}).get('value') == data.get('value'):
+            merged[name] = dict(data, value=current[name]['value'])
+        else:
+            merged[name] = dict(data)
+    for name, data in current.items():
+        if name not in theirs and name not in base:
+            merged[name] = data
+    return merged
+
+
+class DaemonClient:
+    """Connection to a running daemon; safe to share between threads"""
+
+    def __init__(self, connection, address):
+        self.connection = connection
+        self.address = address
+        self.lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, save_directory):
+        """Client for the daemon serving save_directory, or None if none is running"""
+        address = daemon_address(save_directory)
+        if not address_exists(address):
+            return None
+        try:
+            return cls(Client(address), address)
+        except (OSError, EOFError):
+            return None
+
+    @staticmethod
+    def running(save_directory):
+        """Cheap check used before every write; a stale socket file only costs a failed connect"""
+        return address_exists(daemon_address(save_directory))
+
+    def request(self, op, **args):
+        try:
+            with self.lock:
+                self.connection.send_bytes(json.dumps(dict(args, op=op)).encode())
+                reply = json.loads(self.connection.recv_bytes())
+        except (OSError, EOFError) as e:
+            raise DaemonUnavailable(f"Lost connection to index daemon: {e}") from e
+        if 'error' in reply:
+            raise DaemonError(reply['error'])
+        return reply
+
+    def allocate(self, count=1, extension='.png'):
+        """Reserve count filenames; returns (filenames, counters after allocation)"""
+        reply = self.request('allocate', count=count, extension=extension)
+        return reply['filenames'], reply['custom_counters']
+
+    def add(self, entries):
+        return self.request('add', entries=entries)['ok']
+
+    def ingest(self, path, copy=False):
+        """Have the daemon name, write and index an existing image file"""
+        return self.request('ingest', path=os.path.abspath(path), copy=copy)['entry']
+
+    def settings(self, settings=None, base_counters=None):
+        """Current settings, after applying an update if one is given"""
+        return self.request('settings', settings=settings, base_counters=base_counters)['settings']
+
+    def status(self):
+        return self.request('status')
+
+    def shutdown(self):
+        self.request('shutdown')
+
+    def close(self):
+        try:
+            self.connection.close()
+        except OSError:
+            pass
+
+
+class IndexDaemon:
+    """Owns one directory's ScreenshotLibrary and serves it to local clients"""
+
+    def __init__(self, save_directory, max_batch=512):
+        self.save_directory = os.path.abspath(save_directory)
+        self.address = daemon_address(self.save_directory)
+        self.library = ScreenshotLibrary(self.save_directory, use_daemon=False)
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.stopping = threading.Event()
+        self.listener = None
+        self.commits = 0
+        self.committed_entries = 0
+
+    def serve_forever(self, ready=None):
+        os.makedirs(self.save_directory, exist_ok=True)
+        self.library.load_index()
+        if sys.platform != "win32" and os.path.exists(self.address):
+            client = DaemonClient.connect(self.save_directory)
+            if client is not None:
+                client.close()
+                raise DaemonError(f"A daemon is already serving {self.save_directory}")
+            os.remove(self.address)  # Left behind by a daemon that crashed
+        self.listener = Listener(self.address)
+        writer = threading.Thread(target=self._writer, name="daemon-writer", daemon=True)
+        writer.start()
+        if ready is not None:
+            ready()
+        try:
+            while not self.stopping.is_set():
+                try:
+                    connection = self.listener.accept()
+                except OSError:
+                    continue
+                threading.Thread(target=self._serve_client, args=(connection,),
+                                 name="daemon-client", daemon=True).start()
+        finally:
+            self.listener.close()
+            self.requests.put(None)
+            writer.join()
+            self.library.close()
+
+    def _serve_client(self, connection):
+        with connection:
+            while True:
+                try:
+                    message = json.loads(connection.recv_bytes())
+                except (OSError, EOFError, ValueError):
+                    return
+                if message.get('op') == 'ingest':
+                    reply = self._ingest(message)
+                else:
+                    reply = self.submit(message)
+                try:
+                    connection.send_bytes(json.dumps(reply).encode())
+                except OSError:
+                    return
+                if message.get('op') == 'shutdown':
+                    # Replied; now wake the accept loop so it sees the stop flag
+                    self._wake_listener()
+                    return
+
+    def submit(self, message):
+        """Queue a request for the writer thread and wait for its reply"""
+        slot = [message, threading.Event(), None]
+        self.requests.put(slot)
+        slot[1].wait()
+        return slot[2]
+
+    def _ingest(self, message):
+        """Name and write a file outside the writer thread, then commit its entry"""
+        source = message['path']
+        if message.get('copy'):
+            extension = os.path.splitext(source)[1].lower() or '.png'
+        else:
+            extension = self.library.create_encoder().extension
+        reply = self.submit({'op': 'allocate', 'count': 1, 'extension': extension})
+        if 'error' in reply:
+            return reply
+        filename = reply['filenames'][0]
+        filepath = self.library.filepath_for(filename)
+        entry = {'filename': filename, 'filepath': filepath}
+        try:
+            if message.get('copy'):
+                shutil.copyfile(source, filepath)
+                entry['size'] = os.path.getsize(filepath)
+            else:
+                from PIL import Image
+                from similarity import image_hash
+                with Image.open(source) as image:
+                    image.load()
+                    entry['size'] = save_image_file(image, filepath, self.library.create_encoder(),
+                                                    self.library.thumbnail_dir, self.library.create_chain())
+                    entry['phash'] = image_hash(image)
+        except Exception as e:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            return {'error': f"Error ingesting {source}: {e}"}
+        entry['created'] = datetime.now().isoformat()
+        reply = self.submit({'op': 'add', 'entries': [entry]})
+        return reply if 'error' in reply else {'entry': entry}
+
+    def _writer(self):
+        while True:
+            slot = self.requests.get()
+            if slot is None:
+                return
+            # Everything that queued up while the last commit was syncing goes in this one
+            batch = [slot]
+            while len(batch) < self.max_batch:
+                try:
+                    slot = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if slot is None:
+                    self.requests.put(None)
+                    break
+                batch.append(slot)
+
+            entries = []
+            changed = False
+            for slot in batch:
+                try:
+                    slot[2], slot_changed = self._apply(slot[0], entries)
+                    changed |= slot_changed
+                except Exception as e:
+                    slot[2] = {'error': str(e)}
+            if changed:
+                try:
+                    self.library.add_entries(entries)
+                    self.commits += 1
+                    self.committed_entries += len(entries)
+                except Exception as e:
+                    for slot in batch:
+                        slot[2] = {'error': f"Error writing index: {e}"}
+            for slot in batch:
+                slot[1].set()
+
+    def _apply(self, message, entries):
+        """Apply one request in memory; returns (reply, whether the index must be written)"""
+        op = message.get('op')
+        library = self.library
+        if op == 'allocate':
+            filenames = library.generate_filenames(int(message.get('count', 1)), message.get('extension', '.png'))
+            return {'filenames': filenames, 'custom_counters': library.next_counters()}, True
+        if op == 'add':
+            entries.extend(message['entries'])
+            return {'ok': True}, True
+        if op == 'settings':
+            settings = message.get('settings')
+            if settings:
+                if 'custom_counters' in settings:
+                    library.custom_counters = merge_counters(library.custom_counters, settings['custom_counters'],
+                                                             message.get('base_counters') or {})
+                library.pattern_elements = settings.get('pattern_elements', library.pattern_elements)
+                library.encoder_settings = settings.get('encoder', library.encoder_settings)
+                library.duplicate_settings = settings.get('duplicates', library.duplicate_settings)
+                if 'deltas' in settings:
+                    library.set_delta_storage(settings['deltas'].get('enabled', False))
+                library.metrics_settings = settings.get('metrics', library.metrics_settings)
+                library.processing_settings = settings.get('processing', library.processing_settings)
+                library.queue_settings = settings.get('save_queue', library.queue_settings)
+                library.update_naming_pattern()
+            return {'settings': dict(library.index_settings(), custom_counters=library.next_counters())}, \
+                bool(settings)
+        if op == 'status':
+            return {'settings': dict(library.index_settings(), custom_counters=library.next_counters()),
+                    'entries': len(library.screenshot_index),
+                    'commits': self.commits, 'committed_entries': self.committed_entries}, False
+        if op == 'shutdown':
+            self.stopping.set()
+            return {'ok': True}, False
+        raise DaemonError(f"Unknown request: {op}")
+
+    def _wake_listener(self):
+        try:
+            Client(self.address).close()
+        except (OSError, EOFError):
+            pass
+
+
+def serve(save_directory, out=sys.stdout):
+    daemon = IndexDaemon(save_directory)
+    daemon.serve_forever(ready=lambda: print(f"Serving {daemon.save_directory} on {daemon.address}",
+                                             file=out, flush=True))
+    print(f"Stopped after {daemon.commits} commits ({daemon.committed_entries} entries)", file=out)
@@ -0,0 +1,202 @@
+"""
+Frame-delta storage for runs of near-identical captures.
+
+Each frame is cut into square tiles and every tile is hashed in one
+vectorized NumPy pass. Tiles whose hash differs from the current keyframe's
+are written as a single PNG strip, with their positions and the keyframe's
+path (relative to the delta) in a text chunk; everything else is read back from the keyframe.
+A full keyframe is written periodically, when the frame size or mode
+changes, or when too much of the frame changed for a delta to pay off.
+
+    python deltas.py export DELTA_FILES... [--out DIR]
+"""
+
+import os
+import sys
+import json
+import argparse
+
+DELTA_EXTENSION = ".delta.png"
+DELTA_CHUNK = "pic_queuer_delta"
+DEFAULT_DELTAS = {'enabled': False, 'tile': 64, 'keyframe_interval': 30, 'max_changed': 0.5}
+
+_weights = {}
+
+
+def _pixels(image):
+    import numpy as np
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    return image.mode, np.asarray(image)
+
+
+def pad_to_tiles(pixels, tile):
+    """Zero-pad an (H, W, C) array so both sides are whole tiles"""
+    import numpy as np
+    pad_height, pad_width = -pixels.shape[0] % tile, -pixels.shape[1] % tile
+    if pad_height or pad_width:
+        pixels = np.pad(pixels, ((0, pad_height), (0, pad_width), (0, 0)))
+    return pixels
+
+
+def tile_hashes(pixels, tile):
+    """64-bit hash of every tile of an (H, W, C) uint8 array, shaped (rows, cols).
+
+    Each tile row is read as 64-bit words and the tile's words are summed
+    with fixed random odd weights (wrapping), so the whole frame is hashed
+    with one multiply and one reduction and no per-tile Python work.
+    """
+    import numpy as np
+    padded = np.ascontiguousarray(pad_to_tiles(pixels, tile))
+    height, width, channels = padded.shape
+    rows, cols = height // tile, width // tile
+    words = tile * channels // 8
+    key = (tile, words)
+    if key not in _weights:
+        rng = np.random.default_rng(0x5eed)
+        _weights[key] = rng.integers(0, 2 ** 63, size=(tile, 1, words), dtype=np.uint64) * 2 + 1
+    grid = padded.reshape(height, width * channels).view(np.uint64).reshape(rows, tile, cols, words)
+    return (grid * _weights[key]).sum(axis=(1, 3), dtype=np.uint64)
+
+
+class DeltaFrame:
+    """Encoder for one delta frame: writes only the tiles that changed"""
+    extension = DELTA_EXTENSION
+
+    def __init__(self, keyframe_path, tile, changed, compress_level=6):
+        self.keyframe_path = keyframe_path
+        self.tile = tile
+        self.changed = changed
+        self.compress_level = compress_level
+
+    def save(self, image, filepath):
+        import numpy as np
+        from PIL import Image
+        from PIL.PngImagePlugin import PngInfo
+
+        mode, pixels = _pixels(image)
+        tile = self.tile
+        padded = pad_to_tiles(pixels, tile)
+        rows, cols, channels = padded.shape[0] // tile, padded.shape[1] // tile, padded.shape[2]
+        tiles = padded.reshape(rows, tile, cols, tile, channels).swapaxes(1, 2)
+        # Changed tiles stacked into one tile-wide strip (a PNG needs at least one)
+        strip = tiles[self.changed // cols, self.changed % cols].reshape(-1, tile, channels)
+        if not len(strip):
+            strip = np.zeros((tile, tile, channels), dtype=np.uint8)
+
+        info = PngInfo()
+        info.add_text(DELTA_CHUNK, json.dumps({
+            'keyframe': os.path.relpath(self.keyframe_path, os.path.dirname(os.path.abspath(filepath))),
+            'width': image.width,
+            'height': image.height,
+            'mode': mode,
+            'tile': tile,
+            'tiles': self.changed.tolist()
+        }))
+        Image.fromarray(np.ascontiguousarray(strip), mode).save(
+            filepath, "PNG", compress_level=self.compress_level, pnginfo=info)
+
+
+class DeltaStore:
+    """Decides keyframe or delta for each capture of one save directory.
+
+    Only the keyframe's tile hashes are kept in memory. plan() must be
+    called in capture order, from one thread.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = dict(DEFAULT_DELTAS, **(settings or {}))
+        # Tile rows must split into whole 64-bit words for tile_hashes
+        self.tile = max(8, self.settings['tile'] // 8 * 8)
+        self.reset()
+
+    def reset(self):
+        self.keyframe = None
+        self.keyframe_path = None
+        self.hashes = None
+        self.shape = None
+        self.since_keyframe = 0
+
+    def discard(self, filename):
+        """Forget a keyframe whose file could not be written"""
+        if filename == self.keyframe:
+            self.reset()
+
+    def plan(self, image, encoder, allocate, locate):
+        """Pick the encoder for a capture, name it with allocate(extension)
+        and place it with locate(filename).
+
+        Returns (encoder, filename, filepath, entry_fields); keyframes use
+        the given encoder, deltas a DeltaFrame referencing the current
+        keyframe.
+        """
+        mode, pixels = _pixels(image)
+        hashes = tile_hashes(pixels, self.tile)
+        shape = (mode,) + pixels.shape
+
+        if (self.keyframe is not None and shape == self.shape
+                and self.since_keyframe + 1 < self.settings['keyframe_interval']):
+            changed = (hashes != self.hashes).ravel().nonzero()[0]
+            if len(changed) <= self.settings['max_changed'] * hashes.size:
+                frame = DeltaFrame(self.keyframe_path, self.tile, changed,
+                                   getattr(encoder, 'compress_level', 6))
+                self.since_keyframe += 1
+                filename = allocate(frame.extension)
+                return frame, filename, locate(filename), {'frame': 'delta', 'keyframe': self.keyframe}
+
+        filename = allocate(encoder.extension)
+        filepath = locate(filename)
+        self.keyframe, self.keyframe_path, self.hashes, self.shape = filename, filepath, hashes, shape
+        self.since_keyframe = 0
+        return encoder, filename, filepath, {'frame': 'keyframe'}
+
+
+def reconstruct(filepath):
+    """Full image for any stored capture; delta frames are rebuilt from their keyframe"""
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(filepath) as image:
+        image.load()
+    meta = getattr(image, 'text', {}).get(DELTA_CHUNK)
+    if meta is None:
+        return image
+    meta = json.loads(meta)
+
+    with Image.open(os.path.join(os.path.dirname(filepath), meta['keyframe'])) as keyframe:
+        keyframe = keyframe.convert(meta['mode'])
+    tile, changed = meta['tile'], np.asarray(meta['tiles'], dtype=np.int64)
+    pixels = pad_to_tiles(np.array(keyframe), tile)
+    rows, cols, channels = pixels.shape[0] // tile, pixels.shape[1] // tile, pixels.shape[2]
+    tiles = pixels.reshape(rows, tile, cols, tile, channels).swapaxes(1, 2)
+    strip = np.asarray(image).reshape(-1, tile, tile, channels)
+    tiles[changed // cols, changed % cols] = strip[:len(changed)]
+    return Image.fromarray(np.ascontiguousarray(pixels[:meta['height'], :meta['width']]), meta['mode'])
+
+
+def export_png(filepath, out_path, compress_level=6):
+    """Write any stored capture (delta or not) as a plain PNG"""
+    reconstruct(filepath).save(out_path, "PNG", compress_level=compress_level)
+    return out_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pic Q'er frame-delta tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Rebuild delta frames as plain PNGs")
+    export_parser.add_argument("files", nargs="+")
+    export_parser.add_argument("--out", default=None, help="Output directory (defaults to each file's)")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        for filepath in args.files:
+            name = os.path.basename(filepath)
+            if name.endswith(DELTA_EXTENSION):
+                name = name[:-len(DELTA_EXTENSION)] + ".png"
+            out_path = os.path.join(args.out or os.path.dirname(filepath), name)
+            export_png(filepath, out_path)
+            print(f"{filepath} -> {out_path}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import os
+import zlib
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PngEncoder:
+    """Pillow's PNG writer at a chosen zlib level (1 = fastest, 9 = smallest)"""
+    extension = ".png"
+
+    def __init__(self, compress_level=6):
+        self.compress_level = compress_level
+
+    def save(self, image, filepath):
+        image.save(filepath, "PNG", compress_level=self.compress_level)
+
+
+class WebpEncoder:
+    """Lossless WebP; method trades encode speed (0) for size (6)"""
+    extension = ".webp"
+
+    def __init__(self, method=4):
+        self.method = method
+
+    def save(self, image, filepath):
+        image.save(filepath, "WEBP", lossless=True, method=self.method)
+
+
+def adler32_combine(adler1, adler2, len2):
+    """Adler-32 of A+B from the checksums of A and B (port of zlib's adler32_combine)"""
+    base = 65521
+    rem = len2 % base
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % base
+    sum1 += (adler2 & 0xffff) + base - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + base - rem
+    if sum1 >= base:
+        sum1 -= base
+    if sum1 >= base:
+        sum1 -= base
+    if sum2 >= base << 1:
+        sum2 -= base << 1
+    if sum2 >= base:
+        sum2 -= base
+    return sum1 | (sum2 << 16)
+
+
+def _png_chunk(tag, data):
+    return (struct.pack(">I", len(data)) + tag + data +
+            struct.pack(">I", zlib.crc32(data, zlib.crc32(tag))))
+
+
+PNG_COLOR_TYPES = {"L": (0, 1), "RGB": (2, 3), "LA": (4, 2), "RGBA": (6, 4)}
+
+
+class ParallelPngEncoder:
+    """PNG encoder that deflates horizontal strips on several cores.
+
+    Each strip of scanlines is compressed as raw deflate ending on a sync
+    flush (the last one with a final block), the pigz approach, so the
+    pieces concatenate into one valid zlib stream. The per-strip Adler-32
+    checksums are combined instead of re-reading the data. zlib releases the
+    GIL, so a thread pool is enough to use every core. Scanlines use PNG
+    filter type 0, which suits flat screenshot content.
+    """
+    extension = ".png"
+    _executor = None
+
+    def __init__(self, compress_level=6, workers=None, strip_bytes=4 * 1024 * 1024):
+        self.compress_level = compress_level
+        self.workers = workers or os.cpu_count() or 1
+        self.strip_bytes = strip_bytes
+
+    @classmethod
+    def executor(cls, workers):
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="png-deflate")
+        return cls._executor
+
+    def _deflate_strip(self, raw, last):
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15)
+        data = compressor.compress(raw)
+        data += compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+        return data, zlib.adler32(raw), len(raw)
+
+    def save(self, image, filepath):
+        if image.mode not in PNG_COLOR_TYPES:
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        color_type, channels = PNG_COLOR_TYPES[image.mode]
+        width, height = image.size
+        stride = width * channels
+        pixels = image.tobytes()
+
+        rows_per_strip = max(1, self.strip_bytes // max(stride, 1))
+        filter_byte = b"\x00"
+
+        def strip(start):
+            end = min(start + rows_per_strip, height)
+            rows = [pixels[y * stride:(y + 1) * stride] for y in range(start, end)]
+            raw = filter_byte + filter_byte.join(rows)
+            return self._deflate_strip(raw, end == height)
+
+        starts = range(0, height, rows_per_strip)
+        results = list(self.executor(self.workers).map(strip, starts))
+
+        adler = 1
+        for _, strip_adler, length in results:
+            adler = adler32_combine(adler, strip_adler, length)
+        # zlib header for deflate with a 32K window, then the strips and the checksum
+        idat = b"\x78\x9c" + b"".join(data for data, _, _ in results) + struct.pack(">I", adler)
+
+        ihdr = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+        with open(filepath, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+            f.write(_png_chunk(b"IHDR", ihdr))
+            f.write(_png_chunk(b"IDAT", idat))
+            f.write(_png_chunk(b"IEND", b""))
+
+
+# Presets offered in the UI: name -> (label, factory)
+ENCODERS = {
+    'png': ("PNG", lambda s: PngEncoder(s.get('compress_level', 6))),
+    'png_fast': ("PNG (fast)", lambda s: PngEncoder(s.get('compress_level', 1))),
+    'png_parallel': ("PNG (multi-core)", lambda s: ParallelPngEncoder(s.get('compress_level', 6))),
+    'webp_lossless': ("WebP (lossless)", lambda s: WebpEncoder(s.get('method', 4))),
+}
+
+DEFAULT_ENCODER = {'name': 'png', 'compress_level': 6}
+
+
+def create_encoder(settings=None):
+    """Build an encoder from the settings stored in the index file"""
+    settings = settings or DEFAULT_ENCODER
+    _, factory = ENCODERS.get(settings.get('name'), ENCODERS['png'])
+    return factory(settings)
@@ -0,0 +1,491 @@
+import os
+import json
+import shutil
+import threading
+
+
+def _fsync_directory(path):
+    """Flush a directory entry so a rename survives power loss (POSIX only)"""
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path, data, indent=2):
+    """Write JSON to a temp file, fsync it and rename it over the target"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+class JournaledIndex:
+    """Snapshot + append-only JSONL journal for screenshot_index.json.
+
+    New entries and settings changes are appended to
+    ``screenshot_index.journal`` one line per record and fsynced, so a save
+    costs O(1) instead of rewriting the whole index. Every record carries a
+    sequence number; once the journal grows past ``compact_threshold``
+    records it is rotated and folded into a fresh snapshot on a background
+    thread. The snapshot keeps the original ``screenshot_index.json`` layout
+    plus a ``last_seq`` field, so old index files load unchanged and journal
+    records already folded into the snapshot are skipped on replay.
+    """
+
+    def __init__(self, index_file, compact_threshold=1000):
+        self.index_file = index_file
+        self.journal_file = os.path.splitext(index_file)[0] + ".journal"
+        self.rotated_file = self.journal_file + ".old"
+        self.compact_threshold = compact_threshold
+        self.seq = 0
+        self.journal_records = 0
+        self._journal = None
+        self._lock = threading.Lock()
+        self._compactor = None
+        self.corrupt_file = None  # Where an unreadable snapshot was moved by load()
+
+    def load(self):
+        """Return the index data with the journal replayed on top of the snapshot.
+
+        A snapshot that does not parse is moved aside to ``.corrupt`` rather
+        than read as empty; whatever the journal holds is still replayed, and
+        ``corrupt_file`` tells the caller the entries need rebuilding from disk.
+        """
+        data = {}
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r') as f:
+                    data = json.load(f)
+                if not isinstance(data, dict) or not isinstance(data.get('screenshots', []), list):
+                    raise ValueError("not an index object")
+            except ValueError as e:
+                data = {}
+                self.corrupt_file = self._set_aside(e)
+        data.setdefault('screenshots', [])
+        last_seq = data.pop('last_seq', 0)
+        self.seq = last_seq
+
+        recovered, _ = self._replay(self.rotated_file, data, last_seq)
+        self.journal_records, good_bytes = self._replay(self.journal_file, data, last_seq)
+        if os.path.exists(self.journal_file) and good_bytes < os.path.getsize(self.journal_file):
+            # Cut the torn tail so the next append starts on a line of its own
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(good_bytes)
+
+        if recovered:
+            # A compaction was interrupted: fold everything into a snapshot now
+            # so the rotated journal can be dropped safely.
+            self._write_snapshot(data, self.seq)
+            self._truncate_journal()
+            os.remove(self.rotated_file)
+        elif os.path.exists(self.rotated_file):
+            os.remove(self.rotated_file)
+        return data
+
+    def _set_aside(self, error):
+        corrupt_file = self.index_file + ".corrupt"
+        if os.path.exists(corrupt_file):
+            root, ext = os.path.splitext(self.index_file)
+            corrupt_file = f"{root}.{int(os.path.getmtime(self.index_file))}{ext}.corrupt"
+        os.replace(self.index_file, corrupt_file)
+        print(f"Index {self.index_file} is unreadable ({error}); moved to {corrupt_file}")
+        return corrupt_file
+
+    def _replay(self, path, data, last_seq):
+        """Apply journal records newer than last_seq.
+
+        Returns how many were applied and the byte length of the intact prefix.
+        """
+        if not os.path.exists(path):
+            return 0, 0
+        applied = 0
+        good_bytes = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated line")
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash: everything after it is unreliable
+                    break
+                good_bytes += len(line)
+                seq = record.get('seq', 0)
+                self.seq = max(self.seq, seq)
+                if seq <= last_seq:
+                    continue
+                if record.get('op') == 'add':
+                    data['screenshots'].append(record['entry'])
+                elif record.get('op') == 'settings':
+                    data.update(record['settings'])
+                applied += 1
+        return applied, good_bytes
+
+    def append(self, entry=None, settings=None):
+        """Journal a new entry and/or a settings update with a single fsync"""
+        self.append_many([] if entry is None else [entry], settings)
+
+    def append_many(self, entries, settings=None):
+        """Journal a batch of entries (and optionally settings) with a single fsync"""
+        lines = []
+        with self._lock:
+            for entry in entries:
+                self.seq += 1
+                lines.append(json.dumps({'seq': self.seq, 'op': 'add', 'entry': entry}))
+            if settings is not None:
+                self.seq += 1
+                lines.append(json.dumps({'seq': self.seq, 'op': 'settings', 'settings': settings}))
+            if not lines:
+                return
+            if self._journal is None:
+                self._journal = open(self.journal_file, 'a')
+            self._journal.write("\n".join(lines) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self.journal_records += len(lines)
+
+    def needs_compaction(self):
+        return self.journal_records >= self.compact_threshold and not self.compacting()
+
+    def compacting(self):
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def compact(self, snapshot, background=True):
+        """Rotate the journal and write ``snapshot()`` as the new snapshot.
+
+        ``snapshot`` returns a copy of the index data, so it can be serialized
+        while saves continue. It is called under the journal lock, so what it
+        copies reflects exactly the records up to the snapshot's ``last_seq``,
+        even while another thread (e.g. the counter allocator) journals.
+        """
+        if self.compacting():
+            return
+        with self._lock:
+            data = snapshot()
+            last_seq = self.seq
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if os.path.exists(self.journal_file):
+                if os.path.exists(self.rotated_file):
+                    # An earlier compaction failed and its records are in no snapshot yet: keep both
+                    with open(self.journal_file, 'rb') as source, open(self.rotated_file, 'ab') as target:
+                        shutil.copyfileobj(source, target)
+                        target.flush()
+                        os.fsync(target.fileno())
+                    os.remove(self.journal_file)
+                else:
+                    os.replace(self.journal_file, self.rotated_file)
+            self.journal_records = 0
+
+        if background:
+            self._compactor = threading.Thread(target=self._finish_compaction,
+                                               args=(data, last_seq), name="index-compactor")
+            self._compactor.start()
+        else:
+            self._finish_compaction(data, last_seq)
+
+    def _finish_compaction(self, data, last_seq):
+        try:
+            self._write_snapshot(data, last_seq)
+            if os.path.exists(self.rotated_file):
+                os.remove(self.rotated_file)
+        except OSError as e:
+            # The rotated journal is kept and replayed on the next load
+            print(f"Error compacting index: {e}")
+
+    def _write_snapshot(self, data, last_seq):
+        snapshot = dict(data)
+        # Entry views (see CompactEntries.frozen) become a list here, off the caller's thread
+        snapshot['screenshots'] = list(snapshot.get('screenshots', []))
+        snapshot['last_seq'] = last_seq
+        write_json_atomic(self.index_file, snapshot)
+
+    def _truncate_journal(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            open(self.journal_file, 'w').close()
+            self.journal_records = 0
+
+    def close(self):
+        """Wait for a running compaction and release the journal handle"""
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+ENTRY_COLUMNS = ('filename', 'filepath', 'created', 'size')
+
+
+class LazyEntries:
+    """Read-only, list-like view over the screenshots table, fetched page by page.
+
+    Only the pages actually touched are pulled from SQLite and a small number
+    of them are cached. ``append`` mirrors an insert already made through
+    ``SqliteIndex.append`` so callers that keep a list in sync keep working.
+    """
+
+    def __init__(self, store, page_size=500, max_pages=8, order="id"):
+        self.store = store
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.order = order
+        self._pages = {}
+        self._length = None
+
+    def __len__(self):
+        if self._length is None:
+            self._length = self.store.count()
+        return self._length
+
+    def _page(self, number):
+        page = self._pages.get(number)
+        if page is None:
+            if len(self._pages) >= self.max_pages:
+                self._pages.pop(next(iter(self._pages)))
+            page = self.store.page(number * self.page_size, self.page_size, self.order)
+            self._pages[number] = page
+        return page
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("index out of range")
+        return self._page(i // self.page_size)[i % self.page_size]
+
+    def __iter__(self):
+        if self.order != "id":
+            return (self[i] for i in range(len(self)))
+        return self.store.iter_entries(self.page_size)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def append(self, entry):
+        # The row itself was inserted by SqliteIndex.append; drop stale caches
+        self.refresh()
+
+    def refresh(self):
+        self._pages.clear()
+        self._length = None
+
+    def ordered(self, column, descending=False):
+        """Another view over the same rows, sorted by an indexed column in SQL"""
+        if column not in ENTRY_COLUMNS:
+            raise ValueError(f"Cannot sort by {column}")
+        order = f"{column} DESC, id DESC" if descending else f"{column}, id"
+        return LazyEntries(self.store, self.page_size, self.max_pages, order)
+
+
+class SqliteIndex:
+    """SQLite index store with the same load/append/compact surface as JournaledIndex.
+
+    Entries live in ``screenshot_index.db`` with indexes on ``created``,
+    ``filename`` and ``size``, so date-range, name-prefix and largest-file
+    queries are index lookups. ``load`` returns the settings plus a
+    ``LazyEntries`` view instead of materializing every entry.
+
+    The store is opened on the loader thread and then used from the GUI
+    thread and workers (search build, saves), so the connection is shared
+    across threads and every use of it holds ``_lock``.
+    """
+
+    def __init__(self, db_file):
+        import sqlite3
+        self.db_file = db_file
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS screenshots (
+                id INTEGER PRIMARY KEY,
+                filename TEXT NOT NULL,
+                filepath TEXT NOT NULL,
+                created TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                extra TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_screenshots_created ON screenshots(created);
+            CREATE INDEX IF NOT EXISTS idx_screenshots_filename ON screenshots(filename);
+            CREATE INDEX IF NOT EXISTS idx_screenshots_size ON screenshots(size);
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    # Row conversion
+    @staticmethod
+    def _entry_row(entry):
+        extra = {k: v for k, v in entry.items() if k not in ENTRY_COLUMNS}
+        return (entry['filename'], entry['filepath'], entry['created'], entry['size'],
+                json.dumps(extra) if extra else None)
+
+    @staticmethod
+    def _row_entry(row):
+        entry = {'filename': row[0], 'filepath': row[1], 'created': row[2], 'size': row[3]}
+        if row[4]:
+            entry.update(json.loads(row[4]))
+        return entry
+
+    def _select(self, where="", params=(), order="id", limit=None, offset=0):
+        sql = f"SELECT filename, filepath, created, size, extra FROM screenshots {where} ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = tuple(params) + (limit, offset)
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._row_entry(row) for row in rows]
+
+    # Store surface
+    def load(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT key, value FROM settings").fetchall()
+        data = {key: json.loads(value) for key, value in rows}
+        data['screenshots'] = LazyEntries(self)
+        return data
+
+    def append(self, entry=None, settings=None):
+        with self._lock, self.conn:
+            if entry is not None:
+                self.conn.execute(
+                    "INSERT INTO screenshots (filename, filepath, created, size, extra) VALUES (?, ?, ?, ?, ?)",
+                    self._entry_row(entry))
+            if settings is not None:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                    [(key, json.dumps(value)) for key, value in settings.items()])
+
+    def append_many(self, entries, settings=None):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO screenshots (filename, filepath, created, size, extra) VALUES (?, ?, ?, ?, ?)",
+                (self._entry_row(entry) for entry in entries))
+        if settings is not None:
+            self.append(settings=settings)
+
+    def needs_compaction(self):
+        return False
+
+    def compacting(self):
+        return False
+
+    def compact(self, snapshot, background=True):
+        pass
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # Queries
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM screenshots").fetchone()[0]
+
+    def page(self, offset, limit, order="id"):
+        return self._select(order=order, limit=limit, offset=offset)
+
+    def iter_entries(self, page_size=500):
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT id, filename, filepath, created, size, extra FROM screenshots "
+                    "WHERE id > ? ORDER BY id LIMIT ?", (last_id, page_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for row in rows:
+                yield self._row_entry(row[1:])
+
+    def created_between(self, start, end, limit=None):
+        """Entries with start <= created < end (ISO strings sort chronologically)"""
+        return self._select("WHERE created >= ? AND created < ?", (start, end),
+                            order="created", limit=limit)
+
+    def filename_prefix(self, prefix, limit=None):
+        # A range scan keeps the filename index usable, unlike LIKE
+        return self._select("WHERE filename >= ? AND filename < ?", (prefix, prefix + "\U0010ffff"),
+                            order="filename", limit=limit)
+
+    def largest(self, limit=10):
+        return self._select(order="size DESC", limit=limit)
+
+
+def import_json_index(index_file, db_file=None):
+    """One-shot import of screenshot_index.json (+ journal) into a SQLite store.
+
+    The rows go into a .part database that is renamed into place only once
+    complete: open_index_store() switches to the .db as soon as it exists,
+    so an interrupted import must never leave one behind. An existing .db
+    is refused rather than appended to, which would duplicate every row.
+    """
+    if db_file is None:
+        db_file = os.path.splitext(index_file)[0] + ".db"
+    if os.path.exists(db_file):
+        raise FileExistsError(f"{db_file} already exists, the index was imported before")
+    journaled = JournaledIndex(index_file)
+    data = journaled.load()
+    journaled.close()
+
+    part_file = db_file + ".part"
+    for path in (part_file, part_file + "-wal", part_file + "-shm"):
+        # Left by an interrupted import
+        if os.path.exists(path):
+            os.remove(path)
+    store = SqliteIndex(part_file)
+    screenshots = data.pop('screenshots')
+    store.append_many(screenshots)
+    store.append(settings=data)
+    # Closing the last connection checkpoints the WAL into the file and removes it
+    store.close()
+    os.replace(part_file, db_file)
+    _fsync_directory(os.path.dirname(os.path.abspath(db_file)))
+    return len(screenshots)
+
+
+def open_index_store(index_file):
+    """Use the sharded layout or the SQLite store once set up, else the JSON journal"""
+    from shards import ShardedIndex, summary_file
+    save_directory = os.path.dirname(index_file)
+    if os.path.exists(summary_file(save_directory)):
+        return ShardedIndex(save_directory)
+    db_file = os.path.splitext(index_file)[0] + ".db"
+    if os.path.exists(db_file):
+        return SqliteIndex(db_file)
+    return JournaledIndex(index_file)
+
+
+def main():
+    import sys
+    if len(sys.argv) != 3 or sys.argv[1] != "import":
+        print("Usage: python index_store.py import <screenshot_index.json>")
+        sys.exit(1)
+    try:
+        count = import_json_index(sys.argv[2])
+    except FileExistsError as e:
+        print(e)
+        sys.exit(1)
+    print(f"Imported {count} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Per-stage latency instrumentation for the save path.
+
+Each stage (grab, prepare, queue wait, processing and each processing
+stage, encode and write, getsize, thumbnail, index append, save_index,
+notice, end to end) keeps a rolling
+window of recent durations for p50/p95/p99, plus lifetime counts and
+sums. Everything goes through the process-wide METRICS object, which is
+off by default: while disabled, time() hands back a shared no-op context
+manager and record() returns at once, so instrumented code pays one
+method call per stage.
+
+export() writes the current figures as Prometheus text (any extension)
+or JSON (.json), replacing the file atomically.
+"""
+
+import os
+import json
+import threading
+from time import perf_counter
+from collections import deque
+
+DEFAULT_METRICS = {'enabled': False, 'export': "", 'interval': 15}
+
+# Display order; stages recorded under other names are listed after these
+PROCESS_STAGES = ['process_trim', 'process_downscale', 'process_redact', 'process_grayscale']
+STAGES = ['grab', 'prepare', 'queue_wait', 'process'] + PROCESS_STAGES + \
+    ['encode_write', 'getsize', 'thumbnail', 'index_append', 'save_index', 'notice', 'total']
+SUMMARY_STAGES = ['grab'] + PROCESS_STAGES + ['encode_write', 'index_append', 'total']
+QUANTILES = (50, 95, 99)
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.stage, perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _milliseconds(seconds):
+    return f"{seconds * 1000:.1f}" if seconds < 0.01 else f"{seconds * 1000:.0f}"
+
+
+class LatencyMetrics:
+    """Rolling latency windows per stage; safe to record from any thread"""
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+            self.counts = {}
+            self.sums = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def time(self, stage):
+        """Context manager recording the time spent in its block under stage"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            samples = self.samples.get(stage)
+            if samples is None:
+                samples = self.samples[stage] = deque(maxlen=self.window)
+                self.counts[stage] = 0
+                self.sums[stage] = 0.0
+            samples.append(seconds)
+            self.counts[stage] += 1
+            self.sums[stage] += seconds
+
+    def stages(self):
+        with self.lock:
+            recorded = list(self.samples)
+        return [stage for stage in STAGES if stage in recorded] + \
+            sorted(stage for stage in recorded if stage not in STAGES)
+
+    def percentiles(self, stage, quantiles=QUANTILES):
+        """Nearest-rank percentiles of the stage's window, in seconds (None if never recorded)"""
+        with self.lock:
+            samples = self.samples.get(stage)
+            if not samples:
+                return None
+            ordered = sorted(samples)
+        last = len(ordered) - 1
+        return [ordered[min(last, int(q / 100 * len(ordered)))] for q in quantiles]
+
+    def snapshot(self):
+        """{stage: {'count', 'sum', 'p50', 'p95', 'p99'}} with times in seconds"""
+        result = {}
+        for stage in self.stages():
+            values = self.percentiles(stage)
+            with self.lock:
+                count, total = self.counts[stage], self.sums[stage]
+            result[stage] = dict({f'p{q}': value for q, value in zip(QUANTILES, values)},
+                                 count=count, sum=total)
+        return result
+
+    def summary(self, stages=SUMMARY_STAGES):
+        """One-line p50/p95/p99 summary in milliseconds, e.g. for a status bar"""
+        parts = []
+        for stage in stages:
+            values = self.percentiles(stage)
+            if values is not None:
+                parts.append(f"{stage} " + "/".join(_milliseconds(value) for value in values))
+        return ("p50/p95/p99 ms: " + " · ".join(parts)) if parts else ""
+
+    def prometheus(self):
+        lines = ["# HELP pic_queuer_stage_seconds Latency of each save stage over the recent window",
+                 "# TYPE pic_queuer_stage_seconds summary"]
+        for stage, figures in self.snapshot().items():
+            for q in QUANTILES:
+                lines.append(f'pic_queuer_stage_seconds{{stage="{stage}",quantile="{q / 100}"}} '
+                             f'{figures[f"p{q}"]:.6f}')
+            lines.append(f'pic_queuer_stage_seconds_sum{{stage="{stage}"}} {figures["sum"]:.6f}')
+            lines.append(f'pic_queuer_stage_seconds_count{{stage="{stage}"}} {figures["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write the metrics to path: JSON for .json, Prometheus text otherwise"""
+        if path.lower().endswith(".json"):
+            text = json.dumps({'stages': self.snapshot()}, indent=2)
+        else:
+            text = self.prometheus()
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+
+METRICS = LatencyMetrics()
@@ -0,0 +1,123 @@
+import time
+from functools import lru_cache
+
+# Pattern variables filled from the capture time, with their strftime formats
+DATE_VARIABLES = {
+    'date': "%Y-%m-%d",
+    'time': "%H-%M-%S",
+    'timestamp': "%Y-%m-%d_%H-%M-%S",
+    'date_short': "%Y%m%d",
+    'time_12h': "%I-%M-%S %p",
+    'year': "%Y",
+    'ms': None,  # Milliseconds within the second (000-999); not a strftime field
+}
+
+LITERAL, DATE, COUNTER = range(3)
+
+
+def element_kind(element, counter_names):
+    if element in DATE_VARIABLES:
+        return DATE
+    if element in counter_names:
+        return COUNTER
+    return LITERAL
+
+
+def pattern_string(pattern_elements, custom_counters):
+    """Human readable pattern such as {date}_{time}_{counter}"""
+    parts = []
+    for element in pattern_elements:
+        if element_kind(element, custom_counters) != LITERAL:
+            parts.append(f"{{{element}}}")
+        elif element == "space":
+            parts.append(" ")
+        else:
+            parts.append(element)
+    return "".join(parts)
+
+
+class FilenamePattern:
+    """A naming pattern compiled from the pattern builder's element list.
+
+    Only the variables present in the pattern are evaluated: date/time
+    fragments are formatted at most once per second ({ms} on every call)
+    and only the counters the pattern references are advanced.
+    """
+
+    def __init__(self, pattern_elements, counter_names):
+        self.parts = []
+        for element in pattern_elements:
+            kind = element_kind(element, counter_names)
+            if kind == LITERAL:
+                text = " " if element == "space" else element
+                # Merge adjacent literals so rendering joins fewer pieces
+                if self.parts and self.parts[-1][0] == LITERAL:
+                    self.parts[-1] = (LITERAL, self.parts[-1][1] + text)
+                else:
+                    self.parts.append((LITERAL, text))
+            else:
+                self.parts.append((kind, element))
+        self.date_variables = tuple(dict.fromkeys(v for k, v in self.parts if k == DATE))
+        self.counters = tuple(dict.fromkeys(v for k, v in self.parts if k == COUNTER))
+        self.subsecond = 'ms' in self.date_variables
+        # (second, fragments) swapped as one tuple, so threads naming in parallel never mix them
+        self._cached = (None, {})
+
+    def _date_fragments(self, now=None):
+        if not self.date_variables:
+            return self._cached[1]
+        now = time.time() if now is None else now
+        second = int(now)
+        cached_second, dates = self._cached
+        if second != cached_second:
+            local = time.localtime(second)
+            dates = {name: time.strftime(DATE_VARIABLES[name], local)
+                     for name in self.date_variables if DATE_VARIABLES[name]}
+            self._cached = (second, dates)
+        if self.subsecond:
+            return dict(dates, ms=f"{int(now * 1000) % 1000:03d}")
+        return dates
+
+    def _render(self, dates, values, extension):
+        pieces = []
+        for kind, value in self.parts:
+            if kind == LITERAL:
+                pieces.append(value)
+            elif kind == DATE:
+                pieces.append(dates[value])
+            else:
+                pieces.append(str(values[value]))
+        filename = "".join(pieces)
+        # Ensure it has the encoder's extension
+        if not filename.lower().endswith(extension):
+            filename += extension
+        return filename
+
+    def render(self, custom_counters, advance=True, now=None, extension='.png'):
+        """Build one filename; advances the referenced counters unless advance is False"""
+        return self.render_batch(custom_counters, 1, advance, now, extension)[0]
+
+    def render_batch(self, custom_counters, count, advance=True, now=None, extension='.png'):
+        """Build filenames for ``count`` queued images in one call"""
+        dates = self._date_fragments(now)
+        values = {name: custom_counters[name]['value'] for name in self.counters}
+        steps = {name: custom_counters[name].get('increment', 1) for name in self.counters}
+        filenames = []
+        for _ in range(count):
+            filenames.append(self._render(dates, values, extension))
+            for name in self.counters:
+                values[name] += steps[name]
+        if advance:
+            for name in self.counters:
+                custom_counters[name]['value'] = values[name]
+        return filenames
+
+
+@lru_cache(maxsize=32)
+def _compile(pattern_elements, counter_names):
+    return FilenamePattern(pattern_elements, counter_names)
+
+
+def compile_pattern(pattern_elements, custom_counters):
+    """Return the compiled pattern, reusing it while elements and counter names are unchanged"""
+    return _compile(tuple(pattern_elements), frozenset(custom_counters))
@@ -0,0 +1,207 @@
+"""
+Headless entry point for Pic Q'er.
+
+    python -m pic_queuer ingest [--dir DIR] [--copy] [--workers N] FILES_OR_GLOBS...
+    python -m pic_queuer daemon [--dir DIR] [--stop]
+    python -m pic_queuer reconcile [--dir DIR] [--full]
+    python -m pic_queuer export [--dir DIR] --out ARCHIVE [--workers N] [QUERY...]
+
+Images are named with the save directory's current naming pattern and
+counters (from screenshot_index.json), written into the save directory and
+appended to its index. Decoding, the directory's processing chain and
+encoding run in a process pool; names are allocated up front in input
+order so results are deterministic. A file that cannot be read or decoded
+is reported and skipped, and the rest are still indexed. If an
+index daemon serves the directory, names come from it and entries are
+committed through it. This module must not import PyQt6.
+"""
+
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from core import ScreenshotLibrary, DEFAULT_SAVE_DIRECTORY, save_image_file
+from encoders import ENCODERS, create_encoder
+from processing import create_chain
+
+
+def expand_inputs(patterns):
+    """Files from paths and globs, in argument order, without duplicates"""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        files.extend(path for path in matches if os.path.isfile(path))
+    return list(dict.fromkeys(os.path.abspath(path) for path in files))
+
+
+def _ingest_one(job):
+    """Process-pool worker: write one image; returns (size, entry fields, None) or (None, None, error)"""
+    source, filepath, encoder_settings, processing_settings, copy, thumbnail_dir = job
+    extra = {}
+    try:
+        if copy:
+            shutil.copyfile(source, filepath)
+            return os.path.getsize(filepath), extra, None
+        from PIL import Image
+        from similarity import image_hash
+        with Image.open(source) as image:
+            image.load()
+            size = save_image_file(image, filepath, create_encoder(encoder_settings), thumbnail_dir,
+                                   create_chain(processing_settings))
+            extra['phash'] = image_hash(image)
+        return size, extra, None
+    except Exception as e:
+        # Nothing half-written is left under the allocated name
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return None, None, f"{type(e).__name__}: {e}"
+
+
+def ingest(patterns, save_directory=DEFAULT_SAVE_DIRECTORY, copy=False, workers=None,
+           encoder_name=None, out=sys.stdout):
+    files = expand_inputs(patterns)
+    if not files:
+        print("No input files found", file=out)
+        return 0
+
+    os.makedirs(save_directory, exist_ok=True)
+    library = ScreenshotLibrary(save_directory)
+    library.load_index()
+    try:
+        encoder_settings = {'name': encoder_name} if encoder_name else library.encoder_settings
+
+        # Allocate every name in input order and persist the counters before writing
+        if copy:
+            filenames = [library.generate_filename(os.path.splitext(path)[1].lower() or '.png')
+                         for path in files]
+        else:
+            filenames = library.generate_filenames(len(files), create_encoder(encoder_settings).extension)
+        library.save_index()
+
+        thumbnail_dir = library.thumbnail_dir
+        jobs = [(source, library.filepath_for(filename), encoder_settings, library.processing_settings, copy,
+                 thumbnail_dir) for source, filename in zip(files, filenames)]
+
+        start = time.perf_counter()
+        entries = []
+        failures = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for (source, filepath, *_), (size, extra, error) in zip(jobs, pool.map(_ingest_one, jobs, chunksize=4)):
+                if error is not None:
+                    failures.append((source, error))
+                    continue
+                entry = {
+                    'filename': os.path.basename(filepath),
+                    'filepath': filepath,
+                    'created': datetime.now().isoformat(),
+                    'size': size
+                }
+                entry.update(extra)
+                entries.append(entry)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+
+        library.add_entries(entries)
+    finally:
+        library.close()
+
+    total_mb = sum(entry['size'] for entry in entries) / 1024 / 1024
+    print(f"Ingested {len(entries)} images into {save_directory} in {elapsed:.2f}s "
+          f"({len(entries) / elapsed:.1f} images/sec, {total_mb / elapsed:.1f} MB/s written)", file=out)
+    for source, error in failures:
+        print(f"Skipped {source}: {error}", file=out)
+    if failures:
+        print(f"{len(failures)} of {len(files)} files could not be ingested", file=out)
+    return len(entries)
+
+
+def export(query, save_directory=DEFAULT_SAVE_DIRECTORY, out_path=None, workers=None, level=None,
+           out=sys.stdout):
+    from archive import export_archive
+    library = ScreenshotLibrary(save_directory)
+    library.load_index()
+    try:
+        entries = library.search.search(" ".join(query)) if query else library.screenshot_index
+        if not len(entries):
+            print("No captures match", file=out)
+            return 0
+        try:
+            result = export_archive(entries, out_path, save_directory, workers, level)
+        except (ValueError, RuntimeError, OSError) as e:
+            print(f"Export failed: {e}", file=out)
+            return 0
+    finally:
+        library.close()
+    print(result.summary(), file=out)
+    return result.files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pic_queuer", description="Headless Pic Q'er tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Name, store and index existing images")
+    ingest_parser.add_argument("inputs", nargs="+", help="Image files or glob patterns")
+    ingest_parser.add_argument("--dir", default=DEFAULT_SAVE_DIRECTORY, help="Save directory")
+    ingest_parser.add_argument("--copy", action="store_true",
+                               help="Copy files byte-for-byte instead of re-encoding")
+    ingest_parser.add_argument("--workers", type=int, default=None, help="Worker processes")
+    ingest_parser.add_argument("--format", choices=sorted(ENCODERS), default=None,
+                               help="Encoder preset (defaults to the directory's setting)")
+
+    daemon_parser = commands.add_parser("daemon", help="Own a directory's index and serve it to other front-ends")
+    daemon_parser.add_argument("--dir", default=DEFAULT_SAVE_DIRECTORY, help="Save directory")
+    daemon_parser.add_argument("--stop", action="store_true", help="Stop the running daemon")
+
+    reconcile_parser = commands.add_parser("reconcile", help="Bring the index in line with the files on disk")
+    reconcile_parser.add_argument("--dir", default=DEFAULT_SAVE_DIRECTORY, help="Save directory")
+    reconcile_parser.add_argument("--full", action="store_true",
+                                  help="Ignore the scan cursor and re-read every file not matching the index")
+
+    export_parser = commands.add_parser("export", help="Write matching captures to a zip or tar archive")
+    export_parser.add_argument("query", nargs="*",
+                               help="Search terms as in the index viewer, e.g. 2024-05-01 or after:2024-05 size>1mb "
+                                    "(default: everything)")
+    export_parser.add_argument("--dir", default=DEFAULT_SAVE_DIRECTORY, help="Save directory")
+    export_parser.add_argument("--out", required=True, help="Archive path: .zip, .tar, .tar.gz or .tar.zst")
+    export_parser.add_argument("--workers", type=int, default=None, help="Compression threads")
+    export_parser.add_argument("--level", type=int, default=None, help="Compression level")
+
+    args = parser.parse_args(argv)
+    if args.command == "ingest":
+        count = ingest(args.inputs, os.path.expanduser(args.dir), args.copy, args.workers, args.format)
+        sys.exit(0 if count else 1)
+    elif args.command == "daemon":
+        from daemon import DaemonClient, serve
+        save_directory = os.path.expanduser(args.dir)
+        if args.stop:
+            client = DaemonClient.connect(save_directory)
+            if client is None:
+                print(f"No daemon is serving {save_directory}")
+                sys.exit(1)
+            client.shutdown()
+            client.close()
+        else:
+            serve(save_directory)
+    elif args.command == "export":
+        from archive import archive_format
+        try:
+            archive_format(args.out)
+        except ValueError as e:
+            export_parser.error(str(e))
+        sys.exit(0 if export(args.query, os.path.expanduser(args.dir), args.out, args.workers, args.level) else 1)
+    elif args.command == "reconcile":
+        library = ScreenshotLibrary(os.path.expanduser(args.dir))
+        library.load_index()
+        try:
+            print(library.reconcile(full=args.full))
+        finally:
+            library.close()
+
+
+if __name__ == "__main__":
+    main()
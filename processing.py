@@ -0,0 +1,322 @@
+"""
+Processing stages applied to a capture between grab and encode.
+
+A chain is a list of stage settings, run in order on the capture's pixel
+array in the save worker, so the GUI thread never waits on it:
+
+    trim [TOLERANCE]            crop borders of the corner pixel's colour
+    downscale MAX_DIMENSION     area-average down so neither side exceeds it
+    redact X,Y,W,H... [#RRGGBB] fill fixed rectangles (in the stage's input)
+    grayscale                   ITU-R 601 luma, keeping any alpha
+
+Every stage is a vectorized NumPy operation on the frame (trim reads
+inward from the edges; grayscale walks large frames in bands of rows to
+bound temporaries). The image is turned into an array once, before the
+first stage, and back into an image once, after the last. Each stage is
+timed as process_<stage>, the whole chain as process.
+
+In the index file the chain is stored as {"stages": [...]}; in the UI it
+is written as text, stages separated by "|":
+
+    trim 8 | redact 0,0,400,80 | downscale 1920 | grayscale
+"""
+
+from math import gcd
+
+from metrics import METRICS
+
+DEFAULT_PROCESSING = {'stages': []}
+STAGE_NAMES = ('trim', 'downscale', 'redact', 'grayscale')
+BAND_PIXELS = 1 << 20  # Pixels per band of rows when a stage needs wide temporaries
+TRIM_PROBE_PIXELS = 1 << 14  # First block trim compares from each edge
+CHAIN_SEPARATOR = "|"
+
+
+def _bands(height, width):
+    """Row slices covering an image of the given size, about BAND_PIXELS each"""
+    rows = max(1, BAND_PIXELS // max(width, 1))
+    return [slice(top, min(top + rows, height)) for top in range(0, height, rows)]
+
+
+def _first_differing(pixels, low, high, axis, from_end):
+    """Index of the first row (axis 0) or column (axis 1), counting from either end, with a
+    pixel outside [low, high] in some channel; None when there is none.
+
+    Lines are compared in blocks that start small and double, so a narrow
+    border costs a few thin slices rather than a pass over the frame.
+    """
+    import numpy as np
+    length, across = pixels.shape[axis], pixels.shape[1 - axis]
+    step = max(1, TRIM_PROBE_PIXELS // max(across, 1))
+    limit = max(step, BAND_PIXELS // max(across, 1))
+    done = 0
+    while done < length:
+        count = min(step, length - done)
+        span = slice(length - done - count, length - done) if from_end else slice(done, done + count)
+        block = pixels[span] if axis == 0 else pixels[:, span]
+        # uint8 comparisons against the channel bounds, no widening of the frame
+        outside = (block < low) | (block > high)
+        # Reduce over the long contiguous axis first; channels last
+        lines = np.flatnonzero(outside.reshape(count, -1).any(axis=1) if axis == 0
+                               else outside.any(axis=0).any(axis=1))
+        if len(lines):
+            return span.start + (lines[-1] if from_end else lines[0])
+        done += count
+        step = min(step * 2, limit)
+    return None
+
+
+def trim(pixels, tolerance=0):
+    """Crop away borders whose every pixel is within tolerance of the top-left pixel.
+
+    Each side is probed from the edge inward, so only the border and the
+    first line of content are read. A frame that is all border colour is
+    returned as it is.
+    """
+    import numpy as np
+    corner = pixels[0, 0].astype(np.int16)
+    low = np.clip(corner - tolerance, 0, 255).astype(np.uint8)
+    high = np.clip(corner + tolerance, 0, 255).astype(np.uint8)
+    top = _first_differing(pixels, low, high, 0, from_end=False)
+    if top is None:
+        return pixels
+    bottom = _first_differing(pixels, low, high, 0, from_end=True)
+    pixels = pixels[top:bottom + 1]
+    left = _first_differing(pixels, low, high, 1, from_end=False)
+    right = _first_differing(pixels, low, high, 1, from_end=True)
+    return pixels[:, left:right + 1]
+
+
+def _area_resize_axis(pixels, axis, size):
+    """Box-filter resample one axis to size, averaging each output pixel's exact source span.
+
+    With length / size reduced to p / q, output pixel r of every group of
+    q covers a fixed share of a few source pixels of its group of p, so
+    the axis is resampled by about p + q strided multiply-adds of whole
+    slices, in integers (shares are counted in 1/q of a source pixel).
+    """
+    import numpy as np
+    length = pixels.shape[axis]
+    divisor = gcd(length, size)
+    p, q = length // divisor, size // divisor
+    dtype = np.uint16 if p * 255 < 1 << 16 else np.uint32
+    # Along the width, channels go first so the strided axis is the innermost loop
+    source = pixels if axis == 0 else pixels.transpose(0, 2, 1)
+    shape = list(source.shape)
+    shape[0 if axis == 0 else 2] = size
+    sums = np.zeros(shape, dtype=dtype)
+
+    def strided(start, step):
+        return (slice(start, None, step),) if axis == 0 else (Ellipsis, slice(start, None, step))
+
+    for r in range(q):
+        low, high = r * p, (r + 1) * p
+        for j in range(low // q, -(-high // q)):
+            share = min(high, (j + 1) * q) - max(low, j * q)
+            if share == 1:
+                sums[strided(r, q)] += source[strided(j, p)]
+            else:
+                # dtype= widens before multiplying, whatever NumPy's scalar promotion rules
+                sums[strided(r, q)] += np.multiply(source[strided(j, p)], share, dtype=dtype)
+    sums += dtype(p // 2)
+    sums //= dtype(p)
+    result = sums.astype(np.uint8)
+    return result if axis == 0 else result.transpose(0, 2, 1)
+
+
+def downscale(pixels, max_dimension):
+    """Shrink so the longer side is at most max_dimension, keeping the aspect ratio.
+
+    Area averaging, like Pillow's reduce(): every source pixel counts
+    once, so text and thin lines fade evenly instead of aliasing. Frames
+    already small enough are returned as they are.
+    """
+    height, width = pixels.shape[:2]
+    longest = max(height, width)
+    if longest <= max_dimension:
+        return pixels
+    scale = max_dimension / longest
+    new_width, new_height = max(1, round(width * scale)), max(1, round(height * scale))
+    # Rows first: they are contiguous, and the width pass then runs over fewer of them
+    pixels = _area_resize_axis(pixels, 0, new_height)
+    return _area_resize_axis(pixels, 1, new_width)
+
+
+def redact(pixels, regions, color=(0, 0, 0)):
+    """Fill each (x, y, width, height) region with color; regions are clipped to the frame"""
+    import numpy as np
+    height, width = pixels.shape[:2]
+    if not pixels.flags.writeable:
+        pixels = pixels.copy()
+    # Colour as gray, gray+alpha, RGB or RGBA; alpha opaque unless given
+    color = list(color[:1]) * 3 + list(color[1:]) if len(color) <= 2 else list(color)
+    red, green, blue, alpha = (color + [255])[:4]
+    if pixels.shape[2] >= 3:
+        fill = np.array([red, green, blue, alpha][:pixels.shape[2]], dtype=np.uint8)
+    else:
+        fill = np.array([(red * 77 + green * 150 + blue * 29 + 128) >> 8, alpha][:pixels.shape[2]], dtype=np.uint8)
+    for x, y, w, h in regions:
+        left, top = max(0, x), max(0, y)
+        right, bottom = min(width, x + w), min(height, y + h)
+        if left < right and top < bottom:
+            pixels[top:bottom, left:right] = fill
+    return pixels
+
+
+def grayscale(pixels):
+    """ITU-R 601 luma in 8-bit fixed point (within one level of Pillow's "L"), alpha kept"""
+    import numpy as np
+    height, width, channels = pixels.shape
+    if channels <= 2:
+        return pixels
+    luma = np.empty((height, width), dtype=np.uint8)
+    for band in _bands(height, width):
+        block = pixels[band]
+        # 255 * 256 fits 16 bits, so the weighted sum never widens further
+        total = np.multiply(block[..., 0], 77, dtype=np.uint16)
+        total += np.multiply(block[..., 1], 150, dtype=np.uint16)
+        total += np.multiply(block[..., 2], 29, dtype=np.uint16)
+        total += 128
+        total >>= 8
+        luma[band] = total
+    if channels == 4:
+        return np.dstack([luma, pixels[..., 3]])
+    return luma[..., None]
+
+
+def _to_pixels(image):
+    """(H, W, C) uint8 array for an image, converting palette and other modes first"""
+    import numpy as np
+    if image.mode not in ("L", "LA", "RGB", "RGBA"):
+        has_alpha = image.mode in ("PA", "La") or 'transparency' in image.info or 'A' in image.getbands()
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    pixels = np.asarray(image)
+    return pixels[..., None] if pixels.ndim == 2 else pixels
+
+
+def _to_image(pixels):
+    from PIL import Image
+    import numpy as np
+    pixels = np.ascontiguousarray(pixels)
+    mode = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}[pixels.shape[2]]
+    return Image.fromarray(pixels[..., 0] if mode == "L" else pixels, mode)
+
+
+def validate_stage(stage):
+    """A stage settings dict with defaults filled in; ValueError if it makes no sense"""
+    name = stage.get('stage')
+    if name == 'trim':
+        tolerance = int(stage.get('tolerance', 0))
+        if not 0 <= tolerance <= 255:
+            raise ValueError("trim tolerance must be between 0 and 255")
+        return {'stage': 'trim', 'tolerance': tolerance}
+    if name == 'downscale':
+        max_dimension = int(stage.get('max_dimension', 0))
+        if max_dimension < 1:
+            raise ValueError("downscale needs a maximum dimension of at least 1 pixel")
+        return {'stage': 'downscale', 'max_dimension': max_dimension}
+    if name == 'redact':
+        regions = [[int(value) for value in region] for region in stage.get('regions', [])]
+        if not regions or any(len(region) != 4 or region[2] < 1 or region[3] < 1 for region in regions):
+            raise ValueError("redact needs one or more X,Y,WIDTH,HEIGHT regions")
+        color = [int(value) for value in stage.get('color', [0, 0, 0])]
+        if not 1 <= len(color) <= 4 or any(not 0 <= value <= 255 for value in color):
+            raise ValueError("redact color must be 1 to 4 values between 0 and 255")
+        return {'stage': 'redact', 'regions': regions, 'color': color}
+    if name == 'grayscale':
+        return {'stage': 'grayscale'}
+    raise ValueError(f"Unknown processing stage: {name!r} (expected one of {', '.join(STAGE_NAMES)})")
+
+
+def parse_chain(text):
+    """Stage settings from the UI's text form, e.g. "trim 8 | downscale 1920"; ValueError if malformed"""
+    stages = []
+    for part in text.split(CHAIN_SEPARATOR):
+        words = part.split()
+        if not words:
+            continue
+        name, arguments = words[0].lower(), words[1:]
+        if name not in STAGE_NAMES:
+            raise ValueError(f"Unknown processing stage: {name!r} (expected one of {', '.join(STAGE_NAMES)})")
+        if (name == 'trim' and len(arguments) > 1 or name == 'downscale' and len(arguments) != 1
+                or name == 'grayscale' and arguments):
+            raise ValueError(f"Wrong arguments in {part.strip()!r}")
+        try:
+            if name == 'trim':
+                stage = {'stage': 'trim', 'tolerance': int(arguments[0]) if arguments else 0}
+            elif name == 'downscale':
+                stage = {'stage': 'downscale', 'max_dimension': int(arguments[0])}
+            elif name == 'redact':
+                colors = [list(bytes.fromhex(word[1:])) for word in arguments if word.startswith('#')]
+                stage = {'stage': 'redact', 'regions': [[int(value) for value in word.split(',')]
+                                                        for word in arguments if not word.startswith('#')]}
+                if colors:
+                    stage['color'] = colors[-1]
+            else:
+                stage = {'stage': 'grayscale'}
+        except ValueError:
+            raise ValueError(f"Numbers expected in {part.strip()!r}") from None
+        stages.append(validate_stage(stage))
+    return stages
+
+
+def chain_string(stages):
+    """The UI's text form of a list of stage settings"""
+    parts = []
+    for stage in stages:
+        name = stage.get('stage')
+        if name == 'trim':
+            parts.append(f"trim {stage['tolerance']}" if stage.get('tolerance') else "trim")
+        elif name == 'downscale':
+            parts.append(f"downscale {stage['max_dimension']}")
+        elif name == 'redact':
+            words = [",".join(str(value) for value in region) for region in stage['regions']]
+            if stage.get('color', [0, 0, 0]) != [0, 0, 0]:
+                words.append("#" + bytes(stage['color']).hex())
+            parts.append("redact " + " ".join(words))
+        else:
+            parts.append(name)
+    return f" {CHAIN_SEPARATOR} ".join(parts)
+
+
+class ProcessingChain:
+    """An immutable, validated chain of stages; safe to share between save workers"""
+
+    def __init__(self, stages):
+        self.stages = tuple(validate_stage(stage) for stage in stages)
+
+    def __bool__(self):
+        return bool(self.stages)
+
+    def __len__(self):
+        return len(self.stages)
+
+    def apply(self, image):
+        """Run every stage on image (a PIL image) and return the processed image"""
+        if not self.stages:
+            return image
+        with METRICS.time('process'):
+            pixels = _to_pixels(image)
+            for stage in self.stages:
+                name = stage['stage']
+                with METRICS.time('process_' + name):
+                    if name == 'trim':
+                        pixels = trim(pixels, stage['tolerance'])
+                    elif name == 'downscale':
+                        pixels = downscale(pixels, stage['max_dimension'])
+                    elif name == 'redact':
+                        pixels = redact(pixels, stage['regions'], stage['color'])
+                    else:
+                        pixels = grayscale(pixels)
+            return _to_image(pixels)
+
+
+def create_chain(settings):
+    """ProcessingChain for a library's processing settings (invalid stages are skipped)"""
+    stages = []
+    for stage in settings.get('stages', []):
+        try:
+            stages.append(validate_stage(stage))
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"Skipping processing stage {stage!r}: {e}")
+    return ProcessingChain(stages)
@@ -0,0 +1,346 @@
+"""
+Reconciliation of the index against the files in the save directory.
+
+Files deleted or renamed outside the app leave stale entries behind, and
+images copied in by hand are never indexed. A Reconciler pass lists the
+directory with os.scandir (shard folders too for a sharded layout; dot
+folders such as ``.thumbnails`` are skipped) and compares it with the index:
+
+    new files        the PNG or WebP header is read to check the file is
+                     complete, plus the delta text chunk for frame fields;
+                     pixels are never decoded
+    missing files    returned as positions to drop
+    changed files    re-examined when mtime or size moved since the last pass
+
+The mtime and size of every file seen go into a scan cursor,
+``screenshot_index.scan.json``, so a later pass opens only files that are
+new or changed since. Files written in the last few seconds are left for
+the next pass, since a save may still be in progress. A missing entry
+whose name or size matches a new file is taken to be a rename, and its
+metadata (capture time, perceptual hash, frame fields) moves to the new
+entry.
+
+A pass only reads. ScreenshotLibrary.apply_reconcile() adopts the result
+on the owner's thread.
+"""
+
+import os
+import json
+import time
+import struct
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from deltas import DELTA_CHUNK
+
+SCAN_FILENAME = "screenshot_index.scan.json"
+IMAGE_EXTENSIONS = ('.png', '.webp')
+SETTLE_SECONDS = 10  # Younger files may still be being written
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_END = b'\x00\x00\x00\x00IEND\xaeB`\x82'
+MAX_TEXT_CHUNK = 1 << 20
+HEAD_BYTES = 4096
+BATCH = 256  # Files per worker task
+OPEN_FLAGS = os.O_RDONLY | getattr(os, 'O_BINARY', 0)  # No newline translation on Windows
+
+
+def _read_at(fd, offset, count):
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, count)
+
+
+def read_png_header(path):
+    """{'width', 'height', 'text'} from a PNG's chunks before the image data.
+
+    Returns None for anything that is not a complete PNG (wrong signature,
+    or no IEND chunk at the end, as for a file still being written).
+    """
+    fd = os.open(path, OPEN_FLAGS)
+    try:
+        data = os.read(fd, HEAD_BYTES)  # Signature, IHDR and text chunks usually fit
+        if data[:8] != PNG_SIGNATURE:
+            return None
+        if len(data) < HEAD_BYTES:
+            tail = data[-len(PNG_END):]  # Whole file already read
+        else:
+            tail = _read_at(fd, os.lseek(fd, 0, os.SEEK_END) - len(PNG_END), len(PNG_END))
+        if tail != PNG_END:
+            return None
+        header = {'width': 0, 'height': 0, 'text': {}}
+        offset = 8
+        while True:
+            if offset + 8 > len(data):
+                data += _read_at(fd, len(data), offset + 8 - len(data))
+                if offset + 8 > len(data):
+                    return None
+            length, kind = struct.unpack_from('>I4s', data, offset)
+            if kind in (b'IDAT', b'IEND'):
+                return header
+            body = offset + 8
+            if kind == b'IHDR' or (kind == b'tEXt' and length <= MAX_TEXT_CHUNK):
+                if body + length > len(data):
+                    data += _read_at(fd, len(data), body + length - len(data))
+                if kind == b'IHDR':
+                    header['width'], header['height'] = struct.unpack_from('>II', data, body)
+                else:
+                    key, _, value = data[body:body + length].partition(b'\0')
+                    header['text'][key.decode('latin-1')] = value.decode('latin-1')
+            offset = body + length + 4  # Past the CRC
+    finally:
+        os.close(fd)
+
+
+def read_webp_header(path, size):
+    """{'width', 'height', 'text'} for a complete WebP file, else None"""
+    with open(path, 'rb', buffering=0) as f:
+        head = f.read(30)
+    if len(head) < 30 or head[:4] != b'RIFF' or head[8:12] != b'WEBP':
+        return None
+    if struct.unpack('<I', head[4:8])[0] + 8 > size:
+        return None  # Truncated
+    kind = head[12:16]
+    width = height = 0
+    if kind == b'VP8X':
+        width = 1 + int.from_bytes(head[24:27], 'little')
+        height = 1 + int.from_bytes(head[27:30], 'little')
+    elif kind == b'VP8L':
+        bits = int.from_bytes(head[21:25], 'little')
+        width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    elif kind == b'VP8 ':
+        width, height = (value & 0x3FFF for value in struct.unpack('<HH', head[26:30]))
+    return {'width': width, 'height': height, 'text': {}}
+
+
+def examine(path, size, mtime_ns):
+    """Index entry fields for an image file, from its header alone (None if unusable)"""
+    try:
+        if path.lower().endswith('.webp'):
+            header = read_webp_header(path, size)
+        else:
+            header = read_png_header(path)
+    except (OSError, struct.error):
+        return None
+    if header is None:
+        return None
+    entry = {
+        'filename': os.path.basename(path),
+        'filepath': path,
+        'created': datetime.fromtimestamp(mtime_ns / 1e9).isoformat(),
+        'size': size
+    }
+    delta = header['text'].get(DELTA_CHUNK)
+    if delta is not None:
+        try:
+            entry['keyframe'] = os.path.basename(json.loads(delta)['keyframe'])
+            entry['frame'] = 'delta'
+        except (ValueError, KeyError, TypeError):
+            pass
+    return entry
+
+
+def _examine_batch(jobs):
+    return [examine(*job) for job in jobs]
+
+
+def scan_directory(directory, recursive=True):
+    """{path: (mtime_ns, size)} for the image files under directory"""
+    found = {}
+    pending = [directory]
+    while pending:
+        try:
+            listing = os.scandir(pending.pop())
+        except OSError:
+            continue
+        with listing:
+            for item in listing:
+                name = item.name
+                if name.startswith('.'):
+                    continue
+                try:
+                    if item.is_dir(follow_symlinks=False):
+                        if recursive:
+                            pending.append(item.path)
+                    elif name.lower().endswith(IMAGE_EXTENSIONS) and item.is_file():
+                        stat = item.stat()
+                        found[item.path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    continue  # Removed while listing
+    return found
+
+
+def indexed_files(entries, count=None):
+    """(filepaths, sizes) of the first count entries, from columns when possible"""
+    from compact import CompactEntries
+    count = len(entries) if count is None else count
+    if isinstance(entries, CompactEntries):
+        prefix = entries.prefix
+        paths = [prefix + filename for filename in entries.filenames[:count]]
+        sizes = entries.sizes[:count].tolist()
+        for position, extra in list(entries.extra.items()):
+            if position < count:
+                paths[position] = extra.get('filepath', paths[position])
+                sizes[position] = extra.get('size', sizes[position])
+        return paths, sizes
+    paths, sizes = [], []
+    for position in range(count):
+        entry = entries[position]
+        paths.append(entry['filepath'])
+        sizes.append(entry.get('size'))
+    return paths, sizes
+
+
+class ReconcilePlan:
+    """What one pass found, relative to the first ``count`` index entries"""
+
+    def __init__(self, entries, count):
+        self.entries = entries
+        self.count = count
+        self.added = []     # New entries, oldest first
+        self.removed = []   # Positions whose file is gone
+        self.resized = {}   # position -> size on disk
+        self.renamed = 0    # Added entries that took over a removed entry's metadata
+        self.scanned = 0
+        self.examined = 0
+        self.elapsed = 0.0
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.resized)
+
+    def summary(self):
+        parts = [f"{len(self.added)} new", f"{len(self.removed)} missing"]
+        if self.resized:
+            parts.append(f"{len(self.resized)} changed")
+        if self.renamed:
+            parts.append(f"{self.renamed} renamed")
+        return (f"Reconciled {self.scanned:,} files in {self.elapsed:.2f}s "
+                f"({self.examined:,} examined): " + ", ".join(parts))
+
+
+class Reconciler:
+    """Compares one save directory with its index; a pass may run on any thread"""
+
+    def __init__(self, directory, workers=8, settle=SETTLE_SECONDS):
+        self.directory = directory
+        self.cursor_file = os.path.join(directory, SCAN_FILENAME)
+        self.workers = workers
+        self.settle = settle
+
+    def load_cursor(self):
+        """({relative path: (mtime_ns, size)}, same for unusable files) as of the last pass"""
+        try:
+            with open(self.cursor_file, 'r') as f:
+                cursor = json.load(f)
+            return ({path: tuple(stat) for path, stat in cursor['files'].items()},
+                    {path: tuple(stat) for path, stat in cursor['unusable'].items()})
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}, {}
+
+    def save_cursor(self, files, unusable):
+        from index_store import write_json_atomic
+        write_json_atomic(self.cursor_file, {'version': 1, 'files': files, 'unusable': unusable},
+                          indent=None)
+
+    def scan(self, entries, count=None, recursive=True, full=False):
+        """Compare the directory with entries[:count]; returns a ReconcilePlan.
+
+        entries must only grow while this runs (CompactEntries, or a list
+        the caller no longer changes). With full=True the cursor is
+        ignored, so every file that is new or differs from its entry is read.
+        """
+        start = time.perf_counter()
+        count = len(entries) if count is None else count
+        plan = ReconcilePlan(entries, count)
+        paths, sizes = indexed_files(entries, count)
+        positions = {path: position for position, path in enumerate(paths)}
+
+        on_disk = scan_directory(self.directory, recursive)
+        plan.scanned = len(on_disk)
+        previous, previous_unusable = ({}, {}) if full else self.load_cursor()
+        settled = time.time_ns() - int(self.settle * 1e9)
+        skip = len(os.path.join(self.directory, ""))  # scandir paths are directory/relative
+
+        files, unusable = {}, {}
+        candidates = []  # (path, size, mtime_ns) whose header needs reading
+        for path, stat in on_disk.items():
+            mtime_ns, size = stat
+            if mtime_ns > settled:
+                continue  # Possibly still being written; next pass
+            relative = path[skip:]
+            position = positions.get(path)
+            if position is None:
+                if previous_unusable.get(relative) == stat:
+                    unusable[relative] = stat  # Unchanged since it was found unusable
+                    continue
+                candidates.append((path, size, mtime_ns))
+            elif sizes[position] != size:
+                if previous.get(relative) == stat:
+                    plan.resized[position] = size  # Examined last pass, not applied yet
+                    files[relative] = stat
+                else:
+                    candidates.append((path, size, mtime_ns))
+            else:
+                files[relative] = stat
+
+        # Header reads are mostly system calls, which release the GIL
+        batches = [candidates[i:i + BATCH] for i in range(0, len(candidates), BATCH)]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            examined = [entry for batch in pool.map(_examine_batch, batches) for entry in batch]
+        plan.examined = len(candidates)
+
+        for (path, size, mtime_ns), entry in zip(candidates, examined):
+            relative = path[skip:]
+            if entry is None:
+                unusable[relative] = (mtime_ns, size)
+                continue
+            files[relative] = (mtime_ns, size)
+            position = positions.get(path)
+            if position is None:
+                plan.added.append(entry)
+            else:
+                plan.resized[position] = size
+
+        plan.removed = [position for position, path in enumerate(paths)
+                        if path not in on_disk and not os.path.exists(path)]
+        self._carry_over(entries, plan)
+        self._mark_keyframes(plan)
+        plan.added.sort(key=lambda entry: (entry['created'], entry['filename']))
+
+        if files != previous or unusable != previous_unusable:
+            try:
+                self.save_cursor(files, unusable)
+            except OSError as e:
+                print(f"Error saving scan cursor: {e}")
+        plan.elapsed = time.perf_counter() - start
+        return plan
+
+    @staticmethod
+    def _carry_over(entries, plan):
+        """Give new files the metadata of missing entries they were renamed or moved from"""
+        if not plan.removed or not plan.added:
+            return
+        missing = {position: entries[position] for position in plan.removed}
+        by_name, by_size = {}, {}
+        for position, entry in missing.items():
+            by_name.setdefault(entry['filename'], []).append(position)
+            by_size.setdefault(entry.get('size'), []).append(position)
+        taken = set()
+        for added in plan.added:
+            matches = by_name.get(added['filename'])
+            if not matches or len(matches) != 1:
+                matches = by_size.get(added['size'])
+            if not matches or len(matches) != 1 or matches[0] in taken:
+                continue  # Ambiguous or already used: stays a plain new entry
+            taken.add(matches[0])
+            carried = dict(missing[matches[0]])
+            carried.update(filename=added['filename'], filepath=added['filepath'], size=added['size'])
+            added.clear()
+            added.update(carried)
+            plan.renamed += 1
+
+    @staticmethod
+    def _mark_keyframes(plan):
+        keyframes = {entry['keyframe'] for entry in plan.added if entry.get('frame') == 'delta'}
+        for entry in plan.added:
+            if entry['filename'] in keyframes and 'frame' not in entry:
+                entry['frame'] = 'keyframe'
+
@@ -1,43 +1,278 @@
 import sys
 import os
 import json
+import time
+import threading
 from datetime import datetime
-from PIL import Image, ImageGrab
-import pyperclip
 import re
+from collections import OrderedDict
 from pathlib import Path
 
+from core import ScreenshotLibrary, DEFAULT_PATTERN_ELEMENTS, save_image_file
+from burst import BurstCapture, DROP_OLDEST, DROP_NEWEST
+from encoders import ENCODERS
+from thumbnails import THUMBNAIL_SIZE, ensure_thumbnail
+from deltas import DELTA_EXTENSION, export_png
+from clipboard import ClipboardWatcher, qimage_to_pil, clipboard_image
+from metrics import METRICS
+from archive import ExportCancelled, export_archive
+from processing import chain_string, create_chain, parse_chain
+from spill import recover, restore_encoder
+
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
     QLabel, QPushButton, QLineEdit, QTextEdit, QFrame, QGroupBox, QTreeWidget,
     QTreeWidgetItem, QFileDialog, QMessageBox, QDialog, QSpinBox, QScrollArea,
-    QSizePolicy, QStyle
+    QSizePolicy, QStyle, QComboBox, QTableView, QHeaderView, QAbstractItemView, QCheckBox,
+    QProgressDialog
+)
+from PyQt6.QtCore import (
+    Qt, QTimer, QSize, pyqtSignal, QObject, QRunnable, QThreadPool, QAbstractTableModel, QModelIndex
 )
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal
-from PyQt6.QtGui import QFont, QPixmap, QShortcut, QKeySequence, QAction
+from PyQt6.QtGui import QFont, QPixmap, QImage, QShortcut, QKeySequence, QAction
+
+
+class SaveSignals(QObject):
+    """Signals emitted by background save tasks (delivered on the GUI thread)"""
+    started = pyqtSignal(str)
+    saved = pyqtSignal(str, str, int)
+    failed = pyqtSignal(str, str, str)
+    pressure = pyqtSignal(object)  # SaveQueue report while frames spill or are refused
+
+
+class SaveTask(QRunnable):
+    """Encode and write one queued frame off the GUI thread"""
+    def __init__(self, frame, queue, filename, filepath, encoder, signals, thumbnail_dir=None, chain=None):
+        super().__init__()
+        self.frame = frame
+        self.queue = queue
+        self.encoder = encoder
+        self.chain = chain
+        self.thumbnail_dir = thumbnail_dir
+        self.filename = filename
+        self.filepath = filepath
+        self.signals = signals
+        self.queued_at = time.perf_counter()
+
+    def run(self):
+        METRICS.record('queue_wait', time.perf_counter() - self.queued_at)
+        self.signals.started.emit(self.filename)
+        image = None
+        try:
+            # A spilled frame is mapped back in from its file here, on the encoder thread
+            image = self.frame.open()
+            size = save_image_file(image, self.filepath, self.encoder, self.thumbnail_dir, self.chain)
+        except Exception as e:
+            self.signals.failed.emit(self.filename, self.filepath, str(e))
+            return
+        finally:
+            # Drop the pixel buffer (or unmap and delete the spill file) as soon as the encode is done
+            image = None
+            self.queue.done(self.frame)
+        self.signals.saved.emit(self.filename, self.filepath, size)
+
+
+class PlanSignals(QObject):
+    """Signals emitted by delta planning tasks (delivered on the GUI thread)"""
+    planned = pyqtSignal(str, object, str, str, object, object)
+    failed = pyqtSignal(str, str)
+
+
+class PlanTask(QRunnable):
+    """Compare a capture with the delta keyframe, name it and admit it to the save queue.
+
+    Hashing every tile of the frame takes tens of ms at 8K, so it runs here
+    instead of on the GUI thread; the pool has one thread, so captures are
+    planned in the order they were taken, as DeltaStore requires.
+    """
+    def __init__(self, token, image, library, queue, fields, signals, start):
+        super().__init__()
+        self.token = token
+        self.image = image
+        self.library = library
+        self.queue = queue
+        self.fields = fields
+        self.signals = signals
+        self.start = start
+
+    def run(self):
+        try:
+            encoder, filename, filepath, extra = self.library.prepare_capture(self.image)
+            METRICS.record('prepare', time.perf_counter() - self.start)
+            extra.update(self.fields)
+            frame = self.queue.admit(self.image, self.library.capture_meta(filename, filepath, encoder, extra))
+        except Exception as e:
+            self.signals.failed.emit(self.token, str(e))
+            return
+        finally:
+            self.image = None
+        self.signals.planned.emit(self.token, frame, filename, filepath, encoder, self.queue)
+
+
+class BurstSignals(QObject):
+    """Progress and completion of a burst capture (emitted from its worker threads)"""
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(object, object)
+
+
+class IndexSignals(QObject):
+    loaded = pyqtSignal()
+
+
+class ExportSignals(QObject):
+    """Progress and completion of an archive export (emitted from its worker thread)"""
+    progress = pyqtSignal(object, object)
+    finished = pyqtSignal(object, str)
+
+
+class ThumbnailSignals(QObject):
+    loaded = pyqtSignal(str, QImage)
+
+
+class ThumbnailTask(QRunnable):
+    """Load (or generate on a miss) one on-disk thumbnail off the GUI thread"""
+    def __init__(self, filepath, cache_dir, signals):
+        super().__init__()
+        self.filepath = filepath
+        self.cache_dir = cache_dir
+        self.signals = signals
+        self.started = False
+
+    def run(self):
+        self.started = True
+        try:
+            path = ensure_thumbnail(self.filepath, self.cache_dir)
+            image = QImage(path) if path else QImage()
+        except Exception as e:
+            print(f"Error loading thumbnail: {e}")
+            image = QImage()
+        self.signals.loaded.emit(self.filepath, image)
+
+
+class ThumbnailCache(QObject):
+    """Thumbnails for the index viewer: a byte-bounded LRU of QPixmaps over the disk cache.
+
+    get() never blocks; misses are queued for the worker pool and ready is
+    emitted once the pixmap is available. prefetch() replaces any queued
+    work that has not started, so fast scrolling doesn't build a backlog.
+    """
+    ready = pyqtSignal(str)
+
+    def __init__(self, cache_dir, max_bytes=32 * 1024 * 1024, parent=None):
+        super().__init__(parent)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.pixmaps = OrderedDict()
+        self.queued = {}
+        self.failed = set()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.signals = ThumbnailSignals()
+        self.signals.loaded.connect(self.on_loaded)
+
+    def get(self, filepath):
+        pixmap = self.pixmaps.get(filepath)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(filepath)
+            return pixmap
+        self.want(filepath)
+        return None
+
+    def want(self, filepath):
+        if filepath in self.pixmaps or filepath in self.queued or filepath in self.failed:
+            return
+        task = ThumbnailTask(filepath, self.cache_dir, self.signals)
+        task.setAutoDelete(False)
+        self.queued[filepath] = task
+        self.pool.start(task)
+
+    def prefetch(self, filepaths):
+        # Drop queued work for rows that scrolled away; running tasks finish
+        self.pool.clear()
+        self.queued = {path: task for path, task in self.queued.items() if task.started}
+        for filepath in filepaths:
+            self.want(filepath)
+
+    def on_loaded(self, filepath, image):
+        self.queued.pop(filepath, None)
+        if image.isNull():
+            self.failed.add(filepath)
+            return
+        pixmap = QPixmap.fromImage(image)
+        self.pixmaps[filepath] = pixmap
+        self.used_bytes += pixmap.width() * pixmap.height() * pixmap.depth() // 8
+        while self.used_bytes > self.max_bytes and len(self.pixmaps) > 1:
+            _, evicted = self.pixmaps.popitem(last=False)
+            self.used_bytes -= evicted.width() * evicted.height() * evicted.depth() // 8
+        self.ready.emit(filepath)
+
 
 class ScreenshotPaster(QMainWindow):
+    RECONCILE_INTERVAL_MS = 10 * 60 * 1000  # Background check of the folder against the index
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Pic Q'er")
         self.setGeometry(100, 100, 900, 700)
         
-        # Configuration
-        self.save_directory = os.path.expanduser("~/Pictures/Screenshots")
-        self.naming_pattern = "{date}_{time}_{counter}"
-        self.pattern_elements = ["date", "time", "counter"]  # Track pattern as list
-        self.custom_counters = {"counter": {"value": 1, "increment": 1}}  # Custom counters
-        self.index_file = os.path.join(self.save_directory, "screenshot_index.json")
+        # Configuration: naming, counters and the index live in the Qt-free core
+        self.library = ScreenshotLibrary()
+        
+        # Background save pipeline
+        self.save_queue = None  # Byte-budgeted; created with the index, spills to the save directory
+        self.recovered_spill_dirs = set()
+        self.pending_saves = 0
+        self.pending_entries = {}  # filepath -> extra index fields of queued saves
+        self.save_started = {}  # filepath -> perf_counter() when save_image took it
+        self.save_pool = QThreadPool(self)
+        self.save_pool.setMaxThreadCount(2)
+        self.save_signals = SaveSignals()
+        self.save_signals.started.connect(self.on_save_started)
+        self.save_signals.saved.connect(self.on_save_finished)
+        self.save_signals.failed.connect(self.on_save_failed)
+        self.save_signals.pressure.connect(self.on_save_pressure)
+        self.plan_pool = QThreadPool(self)
+        self.plan_pool.setMaxThreadCount(1)  # Delta planning must follow capture order
+        self.plan_signals = PlanSignals()
+        self.plan_signals.planned.connect(self.on_capture_planned)
+        self.plan_signals.failed.connect(self.on_plan_failed)
+        self.plan_sequence = 0
+        self.plan_started = {}  # token -> perf_counter() of captures still being planned
+        self.save_notice = None
+        self.thumbnails = None
+        self.index_dialog = None  # The index viewer while it is open
+        
+        # Burst capture
+        self.burst = None
+        self.burst_reservation = None
+        self.burst_signals = BurstSignals()
+        self.burst_signals.progress.connect(self.on_burst_progress)
+        self.burst_signals.finished.connect(self.on_burst_finished)
+        
+        # Clipboard auto-capture (created when first enabled)
+        self.clipboard_watcher = None
         
         # Ensure save directory exists
-        os.makedirs(self.save_directory, exist_ok=True)
-        
-        # Load existing index
-        self.load_index()
+        os.makedirs(self.library.save_directory, exist_ok=True)
         
         self.setup_ui()
         self.bind_shortcuts()
         self.apply_native_styling()
+        self.reset_thumbnails()
+        
+        # Load existing index off the startup path; applied on the GUI thread when read
+        self.index_signals = IndexSignals()
+        self.index_signals.loaded.connect(self.on_index_loaded)
+        self.status_label.setText("Loading index...")
+        self.library.load_index_async(self.index_signals.loaded.emit)
+        
+        # Files added, removed or renamed outside the app, picked up in the background
+        self.reconcile_signals = IndexSignals()
+        self.reconcile_signals.loaded.connect(self.on_reconciled)
+        self.reconcile_timer = QTimer(self)
+        self.reconcile_timer.timeout.connect(self.start_reconcile)
+        self.reconcile_timer.start(self.RECONCILE_INTERVAL_MS)
         
     def setup_ui(self):
         # Central widget
@@ -60,13 +295,32 @@ class ScreenshotPaster(QMainWindow):
         dir_group = QGroupBox("Save Directory")
         dir_layout = QHBoxLayout(dir_group)
         
-        self.dir_entry = QLineEdit(self.save_directory)
+        self.dir_entry = QLineEdit(self.library.save_directory)
         dir_layout.addWidget(self.dir_entry)
         
         browse_btn = QPushButton("Browse")
         browse_btn.clicked.connect(self.browse_directory)
         dir_layout.addWidget(browse_btn)
         
+        dir_layout.addWidget(QLabel("Format:"))
+        self.format_combo = QComboBox()
+        for name, (label, _) in ENCODERS.items():
+            self.format_combo.addItem(label, name)
+        self.format_combo.setCurrentIndex(max(self.format_combo.findData(self.library.encoder_settings['name']), 0))
+        self.format_combo.currentIndexChanged.connect(self.change_encoder)
+        dir_layout.addWidget(self.format_combo)
+        
+        self.delta_check = QCheckBox("Changed tiles only")
+        self.delta_check.setToolTip("Store near-identical captures as deltas against a periodic full keyframe")
+        self.delta_check.setChecked(self.library.delta_settings.get('enabled', False))
+        self.delta_check.toggled.connect(self.change_delta_storage)
+        dir_layout.addWidget(self.delta_check)
+        
+        self.timings_check = QCheckBox("Show save timings")
+        self.timings_check.setToolTip("Time each stage of a save and show p50/p95/p99 in the status bar")
+        self.timings_check.toggled.connect(self.change_metrics)
+        dir_layout.addWidget(self.timings_check)
+        
         main_layout.addWidget(dir_group)
         
         # Naming Pattern Section
@@ -83,6 +337,10 @@ class ScreenshotPaster(QMainWindow):
         self.paste_text.mousePressEvent = self.paste_text_mouse_press
         paste_layout.addWidget(self.paste_text)
         
+        self.auto_capture_check = QCheckBox("Auto-save images copied to the clipboard")
+        self.auto_capture_check.toggled.connect(self.toggle_auto_capture)
+        paste_layout.addWidget(self.auto_capture_check)
+        
         main_layout.addWidget(paste_group)
         
         # Buttons
@@ -96,6 +354,10 @@ class ScreenshotPaster(QMainWindow):
         screenshot_btn.clicked.connect(self.take_screenshot)
         button_layout.addWidget(screenshot_btn)
         
+        self.burst_btn = QPushButton("Burst Capture")
+        self.burst_btn.clicked.connect(self.toggle_burst)
+        button_layout.addWidget(self.burst_btn)
+        
         view_index_btn = QPushButton("View Index")
         view_index_btn.clicked.connect(self.view_index)
         button_layout.addWidget(view_index_btn)
@@ -111,6 +373,13 @@ class ScreenshotPaster(QMainWindow):
         self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         main_layout.addWidget(self.status_label)
         
+        # Save-stage latency summary, shown while timings are on
+        self.timings_label = QLabel("")
+        self.statusBar().addPermanentWidget(self.timings_label, 1)
+        self.statusBar().setVisible(False)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.export_metrics)
+        
         # Initialize pattern preview
         self.update_pattern_preview()
         
@@ -131,12 +400,23 @@ class ScreenshotPaster(QMainWindow):
         # Current pattern display
         pattern_display_layout = QHBoxLayout()
         pattern_display_layout.addWidget(QLabel("Pattern:"))
-        self.pattern_display = QLabel(self.naming_pattern)
+        self.pattern_display = QLabel(self.library.naming_pattern)
         self.pattern_display.setStyleSheet("color: gray;")
         pattern_display_layout.addWidget(self.pattern_display)
         pattern_display_layout.addStretch()
         pattern_layout.addLayout(pattern_display_layout)
         
+        # Processing chain, run in the save worker before encoding
+        processing_layout = QHBoxLayout()
+        processing_layout.addWidget(QLabel("Processing:"))
+        self.processing_edit = QLineEdit(chain_string(self.library.processing_settings.get('stages', [])))
+        self.processing_edit.setPlaceholderText("e.g. trim | redact 0,0,400,80 | downscale 1920 | grayscale")
+        self.processing_edit.setToolTip("Stages separated by |, applied in order before encoding:\n"
+                                        "trim [TOLERANCE], downscale MAX_SIDE, redact X,Y,W,H ..., grayscale")
+        self.processing_edit.editingFinished.connect(self.change_processing)
+        processing_layout.addWidget(self.processing_edit)
+        pattern_layout.addLayout(processing_layout)
+        
         # Variable buttons
         self.setup_pattern_builder(pattern_layout)
         
@@ -155,7 +435,8 @@ class ScreenshotPaster(QMainWindow):
             ("Timestamp", "timestamp", "YYYY-MM-DD_HH-MM-SS"),
             ("Date Short", "date_short", "YYYYMMDD"),
             ("Time 12h", "time_12h", "HH-MM-SS AM/PM"),
-            ("Year", "year", "YYYY")
+            ("Year", "year", "YYYY"),
+            ("Milliseconds", "ms", "000-999")
         ]
         
         for label, var, desc in date_vars:
@@ -248,7 +529,7 @@ class ScreenshotPaster(QMainWindow):
     # Pattern building methods
     def add_pattern_element(self, element):
         """Add an element to the pattern"""
-        self.pattern_elements.append(element)
+        self.library.pattern_elements.append(element)
         self.update_pattern_from_elements()
         self.update_pattern_preview()
     
@@ -256,15 +537,16 @@ class ScreenshotPaster(QMainWindow):
         """Add a custom counter"""
         dialog = CustomCounterDialog(self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
+            self.library.ensure_loaded()
             name, start_val, increment = dialog.get_values()
-            if name in self.custom_counters:
+            if name in self.library.custom_counters:
                 reply = QMessageBox.question(self, "Counter Exists", 
                                            f"Counter '{name}' already exists. Overwrite?",
                                            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
                 if reply != QMessageBox.StandardButton.Yes:
                     return
                     
-            self.custom_counters[name] = {"value": start_val, "increment": increment}
+            self.library.custom_counters[name] = {"value": start_val, "increment": increment}
             self.add_pattern_element(name)
     
     def add_custom_text(self):
@@ -277,41 +559,87 @@ class ScreenshotPaster(QMainWindow):
     
     def manage_counters(self):
         """Open counter management dialog"""
-        dialog = CounterManagementDialog(self, self.custom_counters)
+        self.library.ensure_loaded()
+        dialog = CounterManagementDialog(self, self.library.custom_counters)
         dialog.exec()
     
     def clear_pattern(self):
         """Clear the current pattern"""
-        self.pattern_elements = []
+        self.library.pattern_elements = []
         self.update_pattern_from_elements()
         self.update_pattern_preview()
     
     def reset_pattern(self):
         """Reset to default pattern"""
-        self.pattern_elements = ["date", "time", "counter"]
+        self.library.pattern_elements = list(DEFAULT_PATTERN_ELEMENTS)
         self.update_pattern_from_elements()
         self.update_pattern_preview()
     
     def undo_last_element(self):
         """Remove the last added element"""
-        if self.pattern_elements:
-            self.pattern_elements.pop()
+        if self.library.pattern_elements:
+            self.library.pattern_elements.pop()
             self.update_pattern_from_elements()
             self.update_pattern_preview()
     
     def update_pattern_from_elements(self):
         """Update the naming pattern from elements list"""
-        pattern_parts = []
-        for element in self.pattern_elements:
-            if element in ["date", "time", "timestamp", "date_short", "time_12h", "year"] or element in self.custom_counters:
-                pattern_parts.append(f"{{{element}}}")
-            elif element == "space":
-                pattern_parts.append(" ")
-            else:
-                pattern_parts.append(element)
-        
-        self.naming_pattern = "".join(pattern_parts)
-        self.pattern_display.setText(self.naming_pattern)
+        self.pattern_display.setText(self.library.update_naming_pattern())
+    
+    def change_encoder(self, index):
+        """Switch image format/compression preset and persist it"""
+        self.library.encoder_settings = {'name': self.format_combo.itemData(index)}
+        self.update_pattern_preview()
+        self.save_index()
+    
+    def change_delta_storage(self, enabled):
+        """Toggle frame-delta storage and persist it"""
+        self.library.set_delta_storage(enabled)
+        self.save_index()
+    
+    def change_processing(self):
+        """Parse the processing chain and persist it"""
+        text = self.processing_edit.text()
+        try:
+            stages = parse_chain(text)
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid Processing", str(e))
+            self.processing_edit.setText(chain_string(self.library.processing_settings.get('stages', [])))
+            return
+        if stages == self.library.processing_settings.get('stages', []):
+            return
+        self.library.processing_settings = dict(self.library.processing_settings, stages=stages)
+        self.processing_edit.setText(chain_string(stages))
+        self.save_index()
+        self.status_label.setText(f"Processing: {chain_string(stages)}" if stages else "Processing: off")
+    
+    def change_metrics(self, enabled):
+        """Toggle save-stage timings and persist it"""
+        self.library.metrics_settings = dict(self.library.metrics_settings, enabled=enabled)
+        self.apply_metrics_settings()
+        self.save_index()
+    
+    def apply_metrics_settings(self):
+        """Turn instrumentation and its periodic export on or off per the index settings"""
+        settings = self.library.metrics_settings
+        enabled = settings.get('enabled', False)
+        METRICS.enable(enabled)
+        self.statusBar().setVisible(enabled)
+        self.update_timings()
+        self.metrics_timer.stop()
+        if enabled and settings.get('export'):
+            self.metrics_timer.start(int(settings.get('interval', 15) * 1000))
+    
+    def update_timings(self):
+        if METRICS.enabled:
+            self.timings_label.setText(METRICS.summary() or "Timings: waiting for the first save")
+    
+    def export_metrics(self):
+        path = os.path.join(self.library.save_directory, os.path.expanduser(self.library.metrics_settings['export']))
+        try:
+            METRICS.export(path)
+        except OSError as e:
+            print(f"Error exporting metrics: {e}")
     
     def update_pattern_preview(self):
         """Update the pattern preview with current date/time"""
@@ -323,55 +651,27 @@ class ScreenshotPaster(QMainWindow):
     
     def generate_filename_preview(self):
         """Generate a preview filename without incrementing counters"""
-        pattern = self.naming_pattern
-        
-        # Get current date and time
-        now = datetime.now()
-        date_str = now.strftime("%Y-%m-%d")
-        time_str = now.strftime("%H-%M-%S")
-        timestamp_str = now.strftime("%Y-%m-%d_%H-%M-%S")
-        date_short_str = now.strftime("%Y%m%d")
-        time_12h_str = now.strftime("%I-%M-%S %p")
-        year_str = now.strftime("%Y")
-        
-        # Create format dict with all variables
-        format_dict = {
-            'date': date_str,
-            'time': time_str,
-            'timestamp': timestamp_str,
-            'date_short': date_short_str,
-            'time_12h': time_12h_str,
-            'year': year_str
-        }
-        
-        # Add custom counters
-        for name, data in self.custom_counters.items():
-            format_dict[name] = data['value']
-        
-        # Replace pattern variables
-        try:
-            filename = pattern.format(**format_dict)
-        except KeyError as e:
-            return f"Missing variable: {e}"
-            
-        # Ensure it has .png extension
-        if filename and not filename.lower().endswith('.png'):
-            filename += '.png'
-            
-        return filename
+        return self.library.generate_filename_preview()
             
     def browse_directory(self):
-        directory = QFileDialog.getExistingDirectory(self, "Select Directory", self.save_directory)
+        directory = QFileDialog.getExistingDirectory(self, "Select Directory", self.library.save_directory)
         if directory:
-            self.save_directory = directory
+            self.library.ensure_loaded()
+            self.library.set_directory(directory)
             self.dir_entry.setText(directory)
-            self.index_file = os.path.join(directory, "screenshot_index.json")
             self.load_index()
             
     def paste_and_save(self):
         try:
-            # Get image from clipboard
-            image = ImageGrab.grabclipboard()
+            # Imported on first use to keep them off the startup path
+            from PIL import Image, ImageGrab
+            import pyperclip
+            
+            # Get image from clipboard, straight from Qt's buffer when possible
+            with METRICS.time('grab'):
+                image = clipboard_image()
+                if image is None:
+                    image = ImageGrab.grabclipboard()
             
             if image is None:
                 # Try to get text from clipboard and check if it's a file path
@@ -390,6 +690,26 @@ class ScreenshotPaster(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error pasting image: {str(e)}")
             
+    def toggle_auto_capture(self, enabled):
+        """Save every new clipboard image without pressing Enter or Ctrl+V"""
+        if enabled:
+            if self.clipboard_watcher is None:
+                self.clipboard_watcher = ClipboardWatcher(self)
+                self.clipboard_watcher.image_copied.connect(self.on_clipboard_image)
+            self.clipboard_watcher.start()
+            self.status_label.setText("Watching the clipboard for new images")
+        elif self.clipboard_watcher is not None:
+            self.clipboard_watcher.stop()
+            self.status_label.setText("Stopped watching the clipboard")
+    
+    def on_clipboard_image(self, qimage):
+        try:
+            with METRICS.time('grab'):
+                image = qimage_to_pil(qimage)
+            self.save_image(image)
+        except Exception as e:
+            self.status_label.setText(f"Error saving clipboard image: {str(e)}")
+    
     def take_screenshot(self):
         try:
             # Minimize the window temporarily
@@ -400,132 +720,348 @@ class ScreenshotPaster(QMainWindow):
             
     def _capture_screenshot(self):
         try:
+            from PIL import ImageGrab
+            
             # Take screenshot
-            screenshot = ImageGrab.grab()
+            with METRICS.time('grab'):
+                screenshot = ImageGrab.grab()
             self.showNormal()  # Restore window
             self.save_image(screenshot)
         except Exception as e:
             self.showNormal()
             QMessageBox.critical(self, "Error", f"Error taking screenshot: {str(e)}")
             
-    def save_image(self, image):
-        # Generate filename based on pattern
-        filename = self.generate_filename()
-        filepath = os.path.join(self.save_directory, filename)
-        
-        # Save image
-        image.save(filepath, "PNG")
-        
-        # Update index
-        self.add_to_index(filename, filepath)
+    def toggle_burst(self):
+        """Start a burst capture, or stop the running one"""
+        if self.burst is not None:
+            self.burst.stop()
+            self.status_label.setText("Stopping burst, finishing queued frames...")
+            return
+        dialog = BurstDialog(self)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            self.start_burst(*dialog.get_values())
+    
+    def start_burst(self, interval, duration, buffer_size, drop_policy):
+        try:
+            from PIL import ImageGrab
+            
+            if self.library.ensure_loaded():
+                self.on_index_loaded()
+            encoder = self.library.create_encoder()
+            # Names for every possible frame are reserved (and persisted) up front
+            filenames, self.burst_reservation = self.library.reserve_filenames(
+                BurstCapture.max_frames(interval, duration), encoder.extension)
+            self.burst = BurstCapture(ImageGrab.grab, filenames, self.library.filepath_for, encoder,
+                                      self.library.thumbnail_dir, interval, duration, buffer_size,
+                                      drop_policy=drop_policy, chain=self.library.create_chain(),
+                                      on_progress=self.burst_signals.progress.emit,
+                                      on_finished=self.burst_signals.finished.emit)
+            self.burst.start()
+            self.burst_btn.setText("Stop Burst")
+            self.status_label.setText(f"Burst: capturing every {interval * 1000:.0f} ms for {duration:.0f} s")
+        except Exception as e:
+            self.burst = None
+            QMessageBox.critical(self, "Error", f"Error starting burst capture: {str(e)}")
+    
+    def on_burst_progress(self, report):
+        self.status_label.setText(
+            f"Burst: {report['captured']} captured, {report['saved']} saved, "
+            f"{report['dropped']} dropped ({report['fps']:.1f} fps)")
+    
+    def on_burst_finished(self, report, entries):
+        # Return unused reserved names, then index every frame in one batch
+        self.library.release_filenames(self.burst_reservation, report['names_used'])
+        self.library.add_entries(entries)
+        self.index_changed()
+        self.burst = None
+        self.burst_reservation = None
+        self.burst_btn.setText("Burst Capture")
+        self.update_pattern_preview()
         
-        # Update status
-        self.status_label.setText(f"Saved: {filename}")
+        summary = (f"Burst saved {report['saved']} of {report['captured']} frames, "
+                   f"{report['fps']:.1f} of {report['target_fps']:.1f} fps, {report['dropped']} dropped")
+        self.status_label.setText(summary)
+        self.show_save_notice(summary)
+    
+    def save_image(self, image):
+        """Queue an image for encoding on the save pool"""
+        # An index still loading in the background must be in place before naming
+        if self.library.ensure_loaded():
+            self.on_index_loaded()
+        
+        # Over both the memory and the spill budget: refuse rather than grow
+        if not self.save_queue.accepts(image):
+            self.status_label.setText(f"Save queue full ({self.pending_saves} pending), capture skipped")
+            return False
+        
+        start = time.perf_counter()
+        # Skip or link near-identical repeats of a recent capture
+        phash, digest, duplicate, queued = self.library.find_duplicate(image)
+        if queued is not None:
+            self.status_label.setText(f"Duplicate of {queued} (still saving), skipped")
+            return False
+        if duplicate is not None:
+            if self.library.duplicate_settings.get('policy') == 'link':
+                self.library.add_to_index(duplicate['filename'], duplicate['filepath'], duplicate['size'],
+                                          **self.duplicate_fields(phash, digest), duplicate_of=duplicate['filename'])
+                self.index_changed()
+                self.status_label.setText(f"Duplicate of {duplicate['filename']}, linked in index")
+            else:
+                self.status_label.setText(f"Duplicate of {duplicate['filename']}, skipped")
+            self.paste_text.clear()
+            self.paste_text.setPlainText("Paste your screenshot here and press Enter to save...")
+            return False
+        
+        fields = self.duplicate_fields(phash, digest)
+        if self.library.plans_deltas():
+            # Delta or keyframe is decided (and the capture named) on the plan thread
+            self.plan_sequence += 1
+            token = f"capture {self.plan_sequence}"
+            # Until then later captures are checked against it under a placeholder name
+            if phash is not None:
+                self.library.pending_hashes[token] = phash
+            if digest is not None:
+                self.library.pending_digests[token] = digest
+            self.plan_started[token] = start
+            self.plan_pool.start(PlanTask(token, image, self.library, self.save_queue, fields,
+                                          self.plan_signals, start))
+            self.status_label.setText(f"Queued: comparing with the keyframe ({self.pending_saves} pending)")
+        else:
+            # Generate filename based on pattern
+            encoder, filename, filepath, extra = self.library.prepare_capture(image)
+            METRICS.record('prepare', time.perf_counter() - start)
+            
+            # Encode and write in the background; past the memory budget the frame waits on disk
+            extra.update(fields)
+            frame = self.save_queue.admit(image, self.library.capture_meta(filename, filepath, encoder, extra))
+            self.capture_queued(frame, filename, filepath, encoder, start)
         
         # Clear paste area
         self.paste_text.clear()
         self.paste_text.setPlainText("Paste your screenshot here and press Enter to save...")
+        return True
+    
+    @staticmethod
+    def duplicate_fields(phash, digest):
+        """Entry fields that later captures are compared against"""
+        fields = {}
+        if phash is not None:
+            fields['phash'] = phash
+        if digest is not None:
+            fields['digest'] = digest
+        return fields
+    
+    def capture_queued(self, frame, filename, filepath, encoder, start, queue=None):
+        """Hand an admitted capture to the save pool"""
+        self.queue_save(frame, filename, filepath, encoder, frame.meta['entry'],
+                        create_chain({'stages': frame.meta['processing']}), start, queue)
+        if frame.spilled:
+            self.status_label.setText(f"Queued on disk: {filename} ({self.pending_saves} pending)")
+        else:
+            self.status_label.setText(f"Queued: {filename} ({self.pending_saves} pending)")
+    
+    def on_capture_planned(self, token, frame, filename, filepath, encoder, queue):
+        self.library.pending_hashes.pop(token, None)
+        self.library.pending_digests.pop(token, None)
+        self.capture_queued(frame, filename, filepath, encoder, self.plan_started.pop(token, None), queue)
+    
+    def on_plan_failed(self, token, error):
+        self.library.pending_hashes.pop(token, None)
+        self.library.pending_digests.pop(token, None)
+        self.plan_started.pop(token, None)
+        self.status_label.setText("Failed to save capture")
+        QMessageBox.critical(self, "Error", f"Error preparing capture: {error}")
+    
+    def queue_save(self, frame, filename, filepath, encoder, extra, chain, start=None, queue=None):
+        """Encode a frame on the save pool; queue is the SaveQueue it was admitted to, if not the current one"""
+        self.pending_saves += 1
+        self.pending_entries[filepath] = extra
+        if start is not None:
+            self.save_started[filepath] = start
+        # Later captures are checked against this one while it waits
+        if 'phash' in extra:
+            self.library.pending_hashes[filepath] = extra['phash']
+        if 'digest' in extra:
+            self.library.pending_digests[filepath] = extra['digest']
+        self.save_pool.start(SaveTask(frame, queue or self.save_queue, filename, filepath, encoder,
+                                      self.save_signals, self.library.thumbnail_dir, chain))
+    
+    def on_save_pressure(self, report):
+        """Backpressure from the save queue: captures are spilling to disk, refused, or caught up"""
+        memory = f"{report['memory_bytes'] / 2**20:.0f} of {report['memory_budget'] / 2**20:.0f} MB in memory"
+        if report['level'] == 'full':
+            self.status_label.setText(f"Save queue full ({memory}, {report['spilled_frames']} on disk), "
+                                      f"captures are being skipped")
+        elif report['level'] == 'spilling':
+            self.status_label.setText(f"Saving is behind: {report['spilled_frames']} frames "
+                                      f"({report['spilled_bytes'] / 2**20:.0f} MB) waiting on disk, {memory}")
+        else:
+            self.status_label.setText(f"Save queue caught up ({self.pending_saves} pending)")
+    
+    def on_save_started(self, filename):
+        self.status_label.setText(f"Saving: {filename} ({self.pending_saves} pending)")
+    
+    def on_save_finished(self, filename, filepath, size):
+        self.pending_saves -= 1
         
-        QMessageBox.information(self, "Success", f"Screenshot saved as {filename}")
-        
-    def generate_filename(self):
-        pattern = self.naming_pattern
-        
-        # Get current date and time
-        now = datetime.now()
-        date_str = now.strftime("%Y-%m-%d")
-        time_str = now.strftime("%H-%M-%S")
-        timestamp_str = now.strftime("%Y-%m-%d_%H-%M-%S")
-        date_short_str = now.strftime("%Y%m%d")
-        time_12h_str = now.strftime("%I-%M-%S %p")
-        year_str = now.strftime("%Y")
-        
-        # Create format dict with all variables
-        format_dict = {
-            'date': date_str,
-            'time': time_str,
-            'timestamp': timestamp_str,
-            'date_short': date_short_str,
-            'time_12h': time_12h_str,
-            'year': year_str
-        }
-        
-        # Add custom counters and increment them
-        for name, data in self.custom_counters.items():
-            format_dict[name] = data['value']
-            # Increment counter
-            self.custom_counters[name]['value'] += data.get('increment', 1)
-        
-        # Replace pattern variables
-        filename = pattern.format(**format_dict)
-        
-        # Ensure it has .png extension
-        if not filename.lower().endswith('.png'):
-            filename += '.png'
+        # Update index
+        self.library.pending_hashes.pop(filepath, None)
+        self.library.pending_digests.pop(filepath, None)
+        self.library.add_to_index(filename, filepath, size, **self.pending_entries.pop(filepath, {}))
+        self.index_changed()
         
-        return filename
+        # Update status
+        if self.pending_saves:
+            self.status_label.setText(f"Saved: {filename} ({self.pending_saves} pending)")
+        else:
+            self.status_label.setText(f"Saved: {filename}")
+        
+        with METRICS.time('notice'):
+            self.show_save_notice(f"Screenshot saved as {filename}")
+        started = self.save_started.pop(filepath, None)
+        if started is not None and METRICS.enabled:
+            METRICS.record('total', time.perf_counter() - started)
+            self.update_timings()
+    
+    def on_save_failed(self, filename, filepath, error):
+        self.pending_saves -= 1
+        self.library.pending_hashes.pop(filepath, None)
+        self.library.pending_digests.pop(filepath, None)
+        self.pending_entries.pop(filepath, None)
+        self.save_started.pop(filepath, None)
+        # Later deltas must not reference a keyframe that was never written
+        self.library.deltas.discard(filename)
+        self.status_label.setText(f"Failed to save: {filename}")
+        QMessageBox.critical(self, "Error", f"Error saving {filename}: {error}")
+    
+    def show_save_notice(self, text):
+        """Show a non-modal completion notice, reusing one box for bursts of saves"""
+        if self.save_notice is None:
+            self.save_notice = QMessageBox(QMessageBox.Icon.Information, "Success", text,
+                                           QMessageBox.StandardButton.Ok, self)
+            self.save_notice.setModal(False)
+        self.save_notice.setText(text)
+        self.save_notice.show()
         
     def load_index(self):
-        if os.path.exists(self.index_file):
-            try:
-                with open(self.index_file, 'r') as f:
-                    data = json.load(f)
-                    self.screenshot_index = data.get('screenshots', [])
-                    
-                    # Load custom counters
-                    saved_counters = data.get('custom_counters', {})
-                    if saved_counters:
-                        self.custom_counters = saved_counters
-                    else:
-                        # Migrate old counter format
-                        old_counter = data.get('counter', 1)
-                        self.custom_counters = {"counter": {"value": old_counter, "increment": 1}}
-                    
-                    # Load pattern elements if available
-                    saved_elements = data.get('pattern_elements', [])
-                    if saved_elements:
-                        self.pattern_elements = saved_elements
-                        self.update_pattern_from_elements()
-                        
-            except Exception as e:
-                print(f"Error loading index: {e}")
-                self.screenshot_index = []
-                self.custom_counters = {"counter": {"value": 1, "increment": 1}}
+        self.library.load_index()
+        self.on_index_loaded()
+    
+    def on_index_loaded(self):
+        """Refresh the UI from the library once an index has been applied"""
+        self.library.ensure_loaded()
+        self.pattern_display.setText(self.library.naming_pattern)
+        self.format_combo.blockSignals(True)
+        self.format_combo.setCurrentIndex(max(self.format_combo.findData(self.library.encoder_settings.get('name')), 0))
+        self.format_combo.blockSignals(False)
+        self.delta_check.blockSignals(True)
+        self.delta_check.setChecked(self.library.delta_settings.get('enabled', False))
+        self.delta_check.blockSignals(False)
+        self.timings_check.blockSignals(True)
+        self.timings_check.setChecked(self.library.metrics_settings.get('enabled', False))
+        self.timings_check.blockSignals(False)
+        self.processing_edit.setText(chain_string(self.library.processing_settings.get('stages', [])))
+        self.reset_save_queue()
+        self.apply_metrics_settings()
+        self.update_pattern_preview()
+        self.reset_thumbnails()
+        via = ", shared via index daemon" if self.library.daemon is not None else ""
+        self.status_label.setText(f"Ready to paste screenshots ({len(self.library.screenshot_index)} indexed{via})")
+        if self.library.needs_rebuild:
+            self.status_label.setText("Index file was unreadable (kept as .corrupt); rebuilding from the folder...")
+        self.recover_spilled()
+        self.start_reconcile()
+    
+    def reset_save_queue(self):
+        """Save queue for the current directory; queued frames keep the queue they were admitted to"""
+        if self.save_queue is None or self.save_queue.spill_dir != self.library.spill_dir:
+            self.save_queue = self.library.create_save_queue(self.save_signals.pressure.emit)
         else:
-            self.screenshot_index = []
-            self.custom_counters = {"counter": {"value": 1, "increment": 1}}
-            
-    def add_to_index(self, filename, filepath):
-        entry = {
-            'filename': filename,
-            'filepath': filepath,
-            'created': datetime.now().isoformat(),
-            'size': os.path.getsize(filepath)
-        }
-        
-        self.screenshot_index.append(entry)
-        self.save_index()
-        
+            self.save_queue.apply_settings(self.library.queue_settings)
+    
+    def recover_spilled(self):
+        """Save frames spilled by an earlier run that ended before encoding them.
+
+        Not while a daemon serves the directory: other clients' spill files
+        may belong to saves still in progress.
+        """
+        spill_dir = self.library.spill_dir
+        if spill_dir in self.recovered_spill_dirs or self.library.daemon is not None:
+            return
+        self.recovered_spill_dirs.add(spill_dir)
+        frames = recover(spill_dir)
+        if not frames:
+            return
+        indexed = {entry['filepath'] for entry in self.library.screenshot_index}
+        recovered = 0
+        for frame in frames:
+            meta = frame.meta
+            filepath = meta['filepath']
+            if filepath in indexed or filepath in self.pending_entries:
+                frame.close()
+                continue
+            # Keep later captures off the name, and index the frame with the time it was taken
+            self.library.names.claim(os.path.dirname(filepath), meta['filename'])
+            extra = dict(meta.get('entry', {}), created=meta['created'])
+            self.save_queue.adopt(frame)
+            self.queue_save(frame, meta['filename'], filepath, restore_encoder(meta['encoder']), extra,
+                            create_chain({'stages': meta.get('processing', [])}), None)
+            recovered += 1
+        if recovered:
+            self.status_label.setText(f"Recovering {recovered} unsaved captures from the last session")
+    
+    def start_reconcile(self):
+        self.library.reconcile_async(self.reconcile_signals.loaded.emit)
+    
+    def on_reconciled(self):
+        summary = self.library.finish_reconcile()
+        if summary is not None:
+            self.status_label.setText(f"{summary} ({len(self.library.screenshot_index)} indexed)")
+    
+    def reset_thumbnails(self):
+        if self.thumbnails is not None and self.thumbnails.cache_dir == self.library.thumbnail_dir:
+            return
+        if self.thumbnails is not None:
+            self.thumbnails.deleteLater()
+        self.thumbnails = ThumbnailCache(self.library.thumbnail_dir, parent=self)
+    
     def save_index(self):
-        data = {
-            'screenshots': self.screenshot_index,
-            'custom_counters': self.custom_counters,
-            'pattern_elements': self.pattern_elements,
-            'naming_pattern': self.naming_pattern
-        }
-        
-        with open(self.index_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        self.library.save_index()
             
     def view_index(self):
-        dialog = IndexViewDialog(self, self.screenshot_index)
-        dialog.exec()
+        self.library.ensure_loaded()
+        dialog = IndexViewDialog(self, self.library.screenshot_index, self.library.similarity, self.thumbnails,
+                                 self.library.search, self.library.save_directory)
+        # Saves keep finishing while the viewer is open
+        self.index_dialog = dialog
+        try:
+            dialog.exec()
+        finally:
+            self.index_dialog = None
+    
+    def index_changed(self):
+        """Entries were appended to the index: let an open viewer show them"""
+        if self.index_dialog is not None:
+            self.index_dialog.model.entries_added()
+        
+    def closeEvent(self, event):
+        # Let queued saves and bursts finish and deliver their index updates before exit
+        if self.burst is not None:
+            self.burst.stop()
+            self.burst.wait()
+        # Planned captures are handed to the save pool by a queued signal
+        self.plan_pool.waitForDone()
+        QApplication.processEvents()
+        self.save_pool.waitForDone()
+        QApplication.processEvents()
+        self.library.close()
+        super().closeEvent(event)
         
     def open_folder(self):
         try:
-            os.startfile(self.save_directory)
+            os.startfile(self.library.save_directory)
         except:
-            QMessageBox.critical(self, "Error", f"Could not open folder: {self.save_directory}")
+            QMessageBox.critical(self, "Error", f"Could not open folder: {self.library.save_directory}")
 
     def apply_native_styling(self):
         """Apply native OS styling to the application"""
@@ -732,32 +1268,430 @@ class CounterManagementDialog(QDialog):
             self.refresh_tree()
 
 
+class BurstDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Burst Capture")
+        self.setFixedSize(360, 220)
+        self.setStyleSheet("")  # Use native styling
+        
+        layout = QVBoxLayout(self)
+        
+        # Interval
+        interval_layout = QHBoxLayout()
+        interval_layout.addWidget(QLabel("Interval (ms):"))
+        self.interval_spin = QSpinBox()
+        self.interval_spin.setRange(50, 60000)
+        self.interval_spin.setValue(250)
+        interval_layout.addWidget(self.interval_spin)
+        layout.addLayout(interval_layout)
+        
+        # Duration
+        duration_layout = QHBoxLayout()
+        duration_layout.addWidget(QLabel("Duration (s):"))
+        self.duration_spin = QSpinBox()
+        self.duration_spin.setRange(1, 3600)
+        self.duration_spin.setValue(30)
+        duration_layout.addWidget(self.duration_spin)
+        layout.addLayout(duration_layout)
+        
+        # Buffer
+        buffer_layout = QHBoxLayout()
+        buffer_layout.addWidget(QLabel("Buffered frames:"))
+        self.buffer_spin = QSpinBox()
+        self.buffer_spin.setRange(1, 256)
+        self.buffer_spin.setValue(16)
+        buffer_layout.addWidget(self.buffer_spin)
+        layout.addLayout(buffer_layout)
+        
+        # Drop policy
+        drop_layout = QHBoxLayout()
+        drop_layout.addWidget(QLabel("When behind, drop:"))
+        self.drop_combo = QComboBox()
+        self.drop_combo.addItem("Oldest queued frame", DROP_OLDEST)
+        self.drop_combo.addItem("Newest frame", DROP_NEWEST)
+        drop_layout.addWidget(self.drop_combo)
+        layout.addLayout(drop_layout)
+        
+        # Buttons
+        button_layout = QHBoxLayout()
+        
+        start_btn = QPushButton("Start")
+        start_btn.clicked.connect(self.accept)
+        button_layout.addWidget(start_btn)
+        
+        cancel_btn = QPushButton("Cancel")
+        cancel_btn.clicked.connect(self.reject)
+        button_layout.addWidget(cancel_btn)
+        
+        layout.addLayout(button_layout)
+    
+    def get_values(self):
+        return (self.interval_spin.value() / 1000, float(self.duration_spin.value()),
+                self.buffer_spin.value(), self.drop_combo.currentData())
+
+
+class IndexTableModel(QAbstractTableModel):
+    """Table model over the screenshot index that loads rows incrementally.
+
+    Rows are exposed in batches through canFetchMore/fetchMore and formatted
+    only when the view asks for them in data(), so opening the viewer costs
+    the same for ten entries or a million.
+    """
+    HEADERS = ['Filename', 'Created', 'Size']
+    SORT_KEYS = ['filename', 'created', 'size']
+    BATCH_SIZE = 256
+
+    def __init__(self, screenshot_index, parent=None, thumbnails=None):
+        super().__init__(parent)
+        self.entries = screenshot_index
+        self.view = screenshot_index  # Entries in display order
+        self.order = None  # Row -> entry permutation when sorted in Python
+        self.sort_key = None  # (key, descending) of the last sort()
+        self.sorted_count = 0  # Entries there were when sorted; later ones go through entries_added()
+        self.loaded = 0
+        self.thumbnails = thumbnails
+        self.thumbnail_rows = {}  # filepath -> row waiting for its thumbnail
+        if thumbnails is not None:
+            thumbnails.ready.connect(self.on_thumbnail_ready)
+
+    def entry(self, row):
+        if self.order is not None:
+            return self.entries[self.order[row]]
+        return self.view[row]
+
+    def total(self):
+        """Rows in display order, loaded or not"""
+        return len(self.order) if self.order is not None else len(self.view)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < self.total()
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(self.BATCH_SIZE, self.total() - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            entry = self.entry(index.row())
+            column = index.column()
+            if column == 0:
+                return entry['filename']
+            if column == 1:
+                return datetime.fromisoformat(entry['created']).strftime("%Y-%m-%d %H:%M:%S")
+            return f"{entry['size'] / 1024 / 1024:.2f} MB"
+        if role == Qt.ItemDataRole.DecorationRole and index.column() == 0 and self.thumbnails is not None:
+            filepath = self.entry(index.row())['filepath']
+            pixmap = self.thumbnails.get(filepath)
+            if pixmap is None:
+                self.thumbnail_rows[filepath] = index.row()
+            return pixmap
+        if role == Qt.ItemDataRole.TextAlignmentRole and index.column() == 2:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def on_thumbnail_ready(self, filepath):
+        row = self.thumbnail_rows.pop(filepath, None)
+        if row is not None and row < self.loaded:
+            index = self.index(row, 0)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def filepaths(self, first, last):
+        """Filepaths of loaded rows first..last, for thumbnail prefetching"""
+        return [self.entry(row)['filepath'] for row in range(max(first, 0), min(last + 1, self.loaded))]
+
+    def set_entries(self, entries):
+        """Show a different entry list, e.g. query results"""
+        self.beginResetModel()
+        self.entries = self.view = entries
+        self.order = None
+        self.sort_key = None
+        self.loaded = 0
+        self.thumbnail_rows.clear()
+        self.endResetModel()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        key = self.SORT_KEYS[column]
+        descending = order == Qt.SortOrder.DescendingOrder
+        self.beginResetModel()
+        if hasattr(self.entries, 'ordered'):
+            # SQLite-backed entries sort through the column index
+            self.view = self.entries.ordered(key, descending)
+            self.order = None
+        else:
+            keys = [entry[key] for entry in self.entries]
+            self.order = sorted(range(len(keys)), key=keys.__getitem__, reverse=descending)
+        self.sort_key = (key, descending)
+        self.sorted_count = len(self.entries)
+        self.loaded = 0
+        self.thumbnail_rows.clear()
+        self.endResetModel()
+
+    def entries_added(self):
+        """Put entries appended to the index since sort() in their sorted rows.
+
+        Unsorted, the view is the index itself and fetchMore picks them up.
+        """
+        if self.sort_key is None or len(self.entries) <= self.sorted_count:
+            return
+        key, descending = self.sort_key
+        positions = self.order if self.order is not None else getattr(self.view, 'positions', None)
+        if positions is None:
+            # Sorted in SQL: query again, keeping as many rows loaded
+            self.beginResetModel()
+            self.view = self.entries.ordered(key, descending)
+            self.loaded = min(self.loaded, len(self.view))
+            self.thumbnail_rows.clear()
+            self.endResetModel()
+        else:
+            for position in range(self.sorted_count, len(self.entries)):
+                row = self._insertion_row(positions, self.entries[position][key], key, descending)
+                if row < self.loaded:
+                    self.beginInsertRows(QModelIndex(), row, row)
+                    positions.insert(row, position)
+                    self.loaded += 1
+                    self.endInsertRows()
+                else:
+                    positions.insert(row, position)
+        self.sorted_count = len(self.entries)
+
+    def _insertion_row(self, positions, value, key, descending):
+        """Row for a new entry: after every row with an equal key, as a stable sort puts it"""
+        low, high = 0, len(positions)
+        while low < high:
+            middle = (low + high) // 2
+            other = self.entries[positions[middle]][key]
+            if (other < value) if descending else (value < other):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+
 class IndexViewDialog(QDialog):
-    def __init__(self, parent=None, screenshot_index=None):
+    SEARCH_DELAY_MS = 30  # Coalesces fast typing; each query takes a few ms
+    
+    def __init__(self, parent=None, screenshot_index=None, similarity=None, thumbnails=None, search=None,
+                 save_directory=None):
         super().__init__(parent)
         self.setWindowTitle("Screenshot Index")
-        self.setFixedSize(600, 400)
+        self.setFixedSize(700, 500)
         self.setStyleSheet("")  # Use native styling
-        self.screenshot_index = screenshot_index or []
+        self.screenshot_index = screenshot_index if screenshot_index is not None else []
+        self.similarity = similarity
+        self.search = search
+        self.save_directory = save_directory
         
         layout = QVBoxLayout(self)
         
-        # Tree widget for index
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabels(['Filename', 'Created', 'Size'])
-        layout.addWidget(self.tree)
+        # Search box, filtering as you type
+        search_layout = QHBoxLayout()
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search: words, counter values, 2024-05-01, after:2024-05, size>2mb")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.setEnabled(search is not None)
+        search_layout.addWidget(self.search_box)
+        self.match_label = QLabel("")
+        search_layout.addWidget(self.match_label)
+        layout.addLayout(search_layout)
+        
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_box.textChanged.connect(self.search_timer.start)
+        if search is not None and not search.built:
+            # Build the inverted index off the GUI thread; typing waits for it
+            self.search_box.setEnabled(False)
+            self.match_label.setText("Indexing...")
+            self.search_signals = IndexSignals()
+            self.search_signals.loaded.connect(self.on_search_ready)
+            threading.Thread(target=lambda: (search.build(), self.search_signals.loaded.emit()),
+                             name="search-index", daemon=True).start()
+        
+        # Table view over a lazily populated model
+        self.model = IndexTableModel(self.screenshot_index, self, thumbnails)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        if thumbnails is not None:
+            self.table.setIconSize(QSize(THUMBNAIL_SIZE // 2, THUMBNAIL_SIZE // 2))
+            self.table.verticalHeader().setDefaultSectionSize(THUMBNAIL_SIZE // 2 + 4)
+            self.table.verticalScrollBar().valueChanged.connect(self.prefetch_thumbnails)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.horizontalHeader().setSortIndicatorShown(True)
+        self.table.horizontalHeader().setSectionsClickable(True)
+        self.table.horizontalHeader().sortIndicatorChanged.connect(self.model.sort)
+        layout.addWidget(self.table)
         
-        # Populate tree
-        for entry in self.screenshot_index:
-            created = datetime.fromisoformat(entry['created']).strftime("%Y-%m-%d %H:%M:%S")
-            size_mb = f"{entry['size'] / 1024 / 1024:.2f} MB"
-            item = QTreeWidgetItem([entry['filename'], created, size_mb])
-            self.tree.addTopLevelItem(item)
+        # Buttons
+        button_layout = QHBoxLayout()
+        
+        similar_btn = QPushButton("Find Similar")
+        similar_btn.clicked.connect(self.find_similar)
+        similar_btn.setEnabled(similarity is not None)
+        button_layout.addWidget(similar_btn)
+        
+        show_all_btn = QPushButton("Show All")
+        show_all_btn.clicked.connect(self.show_all)
+        button_layout.addWidget(show_all_btn)
+        
+        export_btn = QPushButton("Export PNG...")
+        export_btn.clicked.connect(self.export_png)
+        button_layout.addWidget(export_btn)
+        
+        archive_btn = QPushButton("Export Archive...")
+        archive_btn.setToolTip("Selected rows if several are selected, otherwise every row shown")
+        archive_btn.clicked.connect(self.export_archive)
+        archive_btn.setEnabled(save_directory is not None)
+        button_layout.addWidget(archive_btn)
+        
+        button_layout.addStretch()
         
-        # Close button
         close_btn = QPushButton("Close")
         close_btn.clicked.connect(self.accept)
-        layout.addWidget(close_btn)
+        button_layout.addWidget(close_btn)
+        
+        layout.addLayout(button_layout)
+    
+    def find_similar(self):
+        """Show captures whose perceptual hash is close to the selected one"""
+        current = self.table.currentIndex()
+        if not current.isValid():
+            QMessageBox.warning(self, "No Selection", "Please select a screenshot first")
+            return
+        entry = self.model.entry(current.row())
+        if not entry.get('phash'):
+            QMessageBox.information(self, "No Hash", "This screenshot was saved without a perceptual hash")
+            return
+        matches = [match for _, match in self.similarity.similar(entry['phash'])]
+        self.model.set_entries(matches)
+    
+    def show_all(self):
+        self.search_box.blockSignals(True)
+        self.search_box.clear()
+        self.search_box.blockSignals(False)
+        self.match_label.setText("")
+        self.model.set_entries(self.screenshot_index)
+    
+    def on_search_ready(self):
+        self.search_box.setEnabled(True)
+        self.match_label.setText("")
+        self.search_box.setFocus()
+    
+    def run_search(self):
+        query = self.search_box.text().strip()
+        if not query:
+            self.show_all()
+            return
+        start = time.perf_counter()
+        results = self.search.search(query)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.model.set_entries(results)
+        self.match_label.setText(f"{len(results):,} matches ({elapsed:.1f} ms)")
+    
+    def export_png(self):
+        """Save the selected capture as a plain PNG, rebuilding delta frames"""
+        current = self.table.currentIndex()
+        if not current.isValid():
+            QMessageBox.warning(self, "No Selection", "Please select a screenshot first")
+            return
+        entry = self.model.entry(current.row())
+        name = entry['filename']
+        if name.endswith(DELTA_EXTENSION):
+            name = name[:-len(DELTA_EXTENSION)] + ".png"
+        default_path = os.path.join(os.path.dirname(entry['filepath']), name)
+        out_path, _ = QFileDialog.getSaveFileName(self, "Export PNG", default_path, "PNG Images (*.png)")
+        if not out_path:
+            return
+        try:
+            export_png(entry['filepath'], out_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Error exporting {entry['filename']}: {str(e)}")
+    
+    def export_archive(self):
+        """Write the selected captures, or all shown, to a zip or tar archive on a worker thread"""
+        rows = sorted({index.row() for index in self.table.selectionModel().selectedRows()})
+        entries = [self.model.entry(row) for row in rows] if len(rows) > 1 else self.model.entries
+        if not len(entries):
+            QMessageBox.warning(self, "Nothing to Export", "No screenshots are shown")
+            return
+        default_path = os.path.join(os.path.dirname(self.save_directory),
+                                    f"screenshots_{datetime.now():%Y-%m-%d}.zip")
+        out_path, _ = QFileDialog.getSaveFileName(
+            self, f"Export {len(entries):,} Screenshots", default_path,
+            "Zip archive (*.zip);;Tar archive (*.tar);;Gzipped tar (*.tar.gz *.tgz);;Zstandard tar (*.tar.zst)")
+        if not out_path:
+            return
+        
+        self.export_cancel = threading.Event()
+        self.export_progress = QProgressDialog("Exporting screenshots...", "Cancel", 0, 1000, self)
+        self.export_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.export_progress.canceled.connect(self.export_cancel.set)
+        self.export_signals = ExportSignals()
+        self.export_signals.progress.connect(self.on_export_progress)
+        self.export_signals.finished.connect(self.on_export_finished)
+        
+        def progress(done, total):
+            if self.export_cancel.is_set():
+                raise ExportCancelled()
+            self.export_signals.progress.emit(done, total)
+        
+        def worker():
+            try:
+                result = export_archive(entries, out_path, self.save_directory, progress=progress)
+                self.export_signals.finished.emit(result, "")
+            except ExportCancelled:
+                self.export_signals.finished.emit(None, "")
+            except Exception as e:
+                self.export_signals.finished.emit(None, str(e))
+        threading.Thread(target=worker, name="archive-export", daemon=True).start()
+        self.export_progress.show()
+    
+    def on_export_progress(self, done, total):
+        self.export_progress.setValue(int(done * 1000 / total) if total else 0)
+        self.export_progress.setLabelText(f"Exporting screenshots... {done / 1024 / 1024:,.0f} of "
+                                          f"{total / 1024 / 1024:,.0f} MB")
+    
+    def on_export_finished(self, result, error):
+        self.export_progress.canceled.disconnect(self.export_cancel.set)
+        self.export_progress.close()
+        if error:
+            QMessageBox.critical(self, "Error", f"Error exporting archive: {error}")
+        elif result is not None:
+            QMessageBox.information(self, "Export Complete", result.summary())
+    
+    def prefetch_thumbnails(self):
+        """Queue thumbnails for the visible rows and one screen beyond them"""
+        first = self.table.rowAt(0)
+        last = self.table.rowAt(self.table.viewport().height() - 1)
+        if first < 0:
+            return
+        if last < 0:
+            last = self.model.rowCount() - 1
+        page = last - first + 1
+        self.model.thumbnails.prefetch(self.model.filepaths(first, last + page))
 
 
 def main():
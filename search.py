@@ -0,0 +1,286 @@
+"""
+In-memory inverted index for searching the screenshot index.
+
+Filenames are split on the separators the pattern builder uses (``_``,
+``-``, ``.`` and space) into lowercase tokens, each with a posting array of
+entry positions. Creation time and size are kept in flat arrays for range
+filters. Queries combine:
+
+    words        prefix match on filename tokens ("shot" finds "shots_12")
+    numbers      whole-token match (counter values, date and time parts)
+    2024-01-15   captures from that day (2024-01 for a month, 2024 for a year;
+                 four digits from 1970 to next year are a year, so "_2024"
+                 finds a counter value of 2024 while "1234" is a number)
+    after:DATE   created on or after DATE; before:DATE created before it
+    size>2mb     larger than 2 MB; size<500kb smaller than 500 KB
+
+All terms must match. Positions refer to the indexed entry list: the
+screenshot index itself when it only ever grows at the end (a list or
+CompactEntries), otherwise a private copy, so the view stays valid
+whatever store the entries came from.
+"""
+
+import re
+import bisect
+import threading
+from array import array
+from datetime import datetime
+
+SEPARATORS = re.compile(r"[_\-. ]+")
+DATE_TERM = re.compile(r"^(\d{4})(?:-(\d{2}))?(?:-(\d{2}))?$")
+SIZE_TERM = re.compile(r"^size([<>])(\d+(?:\.\d+)?)(b|kb|mb|gb)?$")
+SIZE_UNITS = {'b': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3, None: 1}
+UNBOUNDED = (-1, 1 << 62)  # Exclusive (low, high) range that filters nothing
+FIRST_YEAR = 1970  # Bare four-digit terms before this (or after next year) are numbers
+
+
+def tokenize(filename):
+    return [token for token in SEPARATORS.split(filename.lower()) if token]
+
+
+def created_key(created):
+    """ISO timestamp as a sortable integer YYYYMMDDhhmmss (string slicing, no parsing)"""
+    digits = created[0:4] + created[5:7] + created[8:10] + created[11:13] + created[14:16] + created[17:19]
+    return int(digits.ljust(14, "0"))
+
+
+def date_bounds(term):
+    """[start, end) created_key range for YYYY, YYYY-MM or YYYY-MM-DD, or None"""
+    match = DATE_TERM.match(term)
+    if not match:
+        return None
+    year, month, day = match.groups()
+    start = int(year + (month or "01") + (day or "01") + "000000")
+    if day:
+        end = start + 1000000  # Day 32 etc. still sorts before the next day
+    elif month:
+        end = start + 100000000
+    else:
+        end = start + 10000000000
+    return start, end
+
+
+def is_year(term):
+    """Whether a bare term is a plausible capture year rather than a four-digit number"""
+    return len(term) == 4 and term.isdigit() and FIRST_YEAR <= int(term) <= datetime.now().year + 1
+
+
+class SearchResults:
+    """List-like view of the entries at a set of positions"""
+
+    def __init__(self, entries, positions):
+        self.entries = entries
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.entries[p] for p in self.positions[i]]
+        return self.entries[self.positions[i]]
+
+    def __iter__(self):
+        return (self.entries[p] for p in self.positions)
+
+
+class SearchIndex:
+    """Inverted index over an entry list, built once and then kept up to date.
+
+    build() may run on a worker thread; entries added meanwhile with add()
+    are queued and indexed when the build is swapped in. add() is called
+    after the entry was appended to the screenshot index. Stores whose
+    positions can shift are materialized into the index's own entry list.
+    """
+
+    def __init__(self, screenshot_index):
+        self.screenshot_index = screenshot_index
+        self.shared = isinstance(screenshot_index, list) or getattr(screenshot_index, 'append_only', False)
+        self.count = 0  # Entries indexed so far
+        self.lock = threading.Lock()
+        self.built = False
+        self.building = False
+        self.pending = []
+        self.ready = threading.Event()
+        self.entries = []
+        self.postings = {}
+        self.tokens = []  # Sorted, for prefix lookups
+        self.created = array('q')
+        self.sizes = array('q')
+
+    # Maintenance
+    def build(self):
+        """Index every entry; safe to call from a worker thread.
+
+        Returns once the index is ready, waiting if another thread is
+        already building it.
+        """
+        with self.lock:
+            if self.built:
+                return
+            if self.building:
+                waiting = True
+            else:
+                waiting = False
+                self.building = True
+                count = len(self.screenshot_index)
+                snapshot = self.screenshot_index if self.shared else list(self.screenshot_index)
+        if waiting:
+            self.ready.wait()
+            return
+
+        # Bulk version of _add: plain lists while collecting, arrays at the end.
+        # Most counter values occur once, so a token keeps a bare position
+        # until it is seen a second time.
+        postings = {}
+        created, sizes = array('q'), array('q')
+        split = SEPARATORS.split
+        for position in range(count):
+            entry = snapshot[position]
+            for token in set(split(entry['filename'].lower())):
+                posting = postings.get(token)
+                if posting is None:
+                    postings[token] = position
+                elif type(posting) is int:
+                    postings[token] = [posting, position]
+                else:
+                    posting.append(position)
+            created.append(created_key(entry['created']))
+            sizes.append(entry['size'])
+        postings.pop("", None)  # From separators at either end of a name
+        for token, posting in postings.items():
+            if type(posting) is list:
+                postings[token] = array('i', posting)
+
+        import numpy  # noqa: F401 -- the first query should not pay for the import
+        with self.lock:
+            self.entries = snapshot
+            self.count = count
+            self.postings = postings
+            self.tokens = sorted(postings)
+            self.created, self.sizes = created, sizes
+            for entry in self.pending:
+                self._add(entry)
+            self.pending = []
+            self.built = True
+            self.building = False
+        self.ready.set()
+
+    def add(self, entry):
+        """Index one new entry (a no-op until the index is first built)"""
+        with self.lock:
+            if self.building:
+                self.pending.append(entry)
+            elif self.built:
+                self._add(entry)
+
+    def _add(self, entry):
+        position = self.count
+        self.count += 1
+        if not self.shared:
+            self.entries.append(entry)
+        for token in set(tokenize(entry['filename'])):
+            posting = self.postings.get(token)
+            if posting is None:
+                self.postings[token] = position
+                bisect.insort(self.tokens, token)
+            elif type(posting) is int:
+                self.postings[token] = array('i', (posting, position))
+            else:
+                posting.append(position)
+        self.created.append(created_key(entry['created']))
+        self.sizes.append(entry['size'])
+
+    # Queries
+    def parse(self, query):
+        """Split a query into (numbers, words, created range, size range);
+        ranges are exclusive (low, high) pairs"""
+        numbers, words = [], []
+        created, sizes = list(UNBOUNDED), list(UNBOUNDED)
+        for term in query.lower().split():
+            if term.startswith("after:") or term.startswith("before:"):
+                bounds = date_bounds(term.split(":", 1)[1])
+                if bounds is not None:
+                    if term.startswith("after:"):
+                        created[0] = max(created[0], bounds[0] - 1)
+                    else:
+                        created[1] = min(created[1], bounds[0])
+                continue
+            bounds = date_bounds(term)
+            if bounds is not None and ("-" in term or is_year(term)):
+                created = [max(created[0], bounds[0] - 1), min(created[1], bounds[1])]
+                continue
+            size = SIZE_TERM.match(term)
+            if size:
+                limit = float(size.group(2)) * SIZE_UNITS[size.group(3)]
+                if size.group(1) == ">":
+                    sizes[0] = max(sizes[0], limit)
+                else:
+                    sizes[1] = min(sizes[1], limit)
+                continue
+            for token in tokenize(term):
+                (numbers if token.isdigit() else words).append(token)
+        return numbers, words, tuple(created), tuple(sizes)
+
+    def _posting(self, token, np):
+        posting = self.postings.get(token)
+        if posting is None:
+            return np.empty(0, dtype=np.int32)
+        if type(posting) is int:
+            return np.array([posting], dtype=np.int32)
+        return np.frombuffer(posting, dtype=np.int32)
+
+    def _prefix_positions(self, prefix, np):
+        """Sorted positions of every token starting with prefix"""
+        first = bisect.bisect_left(self.tokens, prefix)
+        last = bisect.bisect_left(self.tokens, prefix + "\uffff")
+        matches = self.tokens[first:last]
+        if len(matches) == 1:
+            return self._posting(matches[0], np)
+        mask = np.zeros(self.count, dtype=bool)
+        for token in matches:
+            mask[self._posting(token, np)] = True
+        return np.flatnonzero(mask).astype(np.int32)
+
+    def _match(self, numbers, words, created, sizes, np):
+        # Runs under the lock: the posting views must be gone before an add()
+        # resizes the arrays they point into, so only copies are returned
+        terms = [self._posting(token, np) for token in numbers]
+        terms.extend(self._prefix_positions(word, np) for word in words)
+        terms.sort(key=len)
+
+        if terms:
+            # Every posting is sorted, so the smallest is narrowed by binary search
+            candidates = terms[0].copy()
+            for other in terms[1:]:
+                if not len(candidates):
+                    break
+                found = np.searchsorted(other, candidates)
+                found[found == len(other)] = 0
+                candidates = candidates[other[found] == candidates]
+        else:
+            candidates = None  # Filters alone: test the whole columns at once
+
+        keep = None
+        for column, (low, high) in ((self.created, created), (self.sizes, sizes)):
+            if (low, high) == UNBOUNDED:
+                continue
+            keys = np.frombuffer(column, dtype=np.int64)
+            if candidates is not None:
+                keys = keys[candidates]
+            inside = (keys > low) & (keys < high)
+            keep = inside if keep is None else keep & inside
+        if candidates is None:
+            if keep is None:
+                return np.arange(self.count, dtype=np.int32)
+            return np.flatnonzero(keep).astype(np.int32)
+        return candidates if keep is None else candidates[keep]
+
+    def search(self, query):
+        """Entries matching query, in index order, as a list-like SearchResults"""
+        import numpy as np
+
+        self.build()
+        numbers, words, created, sizes = self.parse(query)
+        with self.lock:
+            return SearchResults(self.entries, self._match(numbers, words, created, sizes, np))
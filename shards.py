@@ -0,0 +1,409 @@
+"""
+Sharded directory layout for very large save directories.
+
+Files go into ``YYYY/MM/DD`` (``date`` scheme) or two-hex-digit
+(``hash`` scheme) subdirectories. Each shard keeps its entries in an
+append-only ``manifest.jsonl``; ``screenshot_index.shards.json`` at the
+top holds the settings and a summary of every shard (entry count, bytes,
+first and last ``created``). Loading reads only the summary and the
+shards that are actually accessed, and date-range queries skip shards
+whose span does not overlap.
+
+    python shards.py migrate DIR [--scheme date|hash] [--workers N]
+
+Migration moves the files of an existing flat directory in parallel and
+writes the manifests, then the summary, which is the commit point: until
+it exists the flat index is still the one in use, and re-running an
+interrupted migration picks up the files already moved.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import bisect
+import hashlib
+import argparse
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from index_store import write_json_atomic
+
+SUMMARY_FILENAME = "screenshot_index.shards.json"
+MANIFEST_FILENAME = "manifest.jsonl"
+SCHEMES = {
+    'date': re.compile(r"^\d{4}/\d{2}/\d{2}$"),
+    'hash': re.compile(r"^[0-9a-f]{2}$"),
+}
+
+
+def summary_file(save_directory):
+    return os.path.join(save_directory, SUMMARY_FILENAME)
+
+
+def read_manifest(path):
+    """Entries of a manifest and the byte length of its intact prefix"""
+    entries = []
+    good_bytes = 0
+    if not os.path.exists(path):
+        return entries, good_bytes
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("unterminated line")
+                entries.append(json.loads(line))
+            except ValueError:
+                # Torn write from a crash: everything after it is unreliable
+                break
+            good_bytes += len(line)
+    return entries, good_bytes
+
+
+class ShardedEntries:
+    """Read-only, list-like view over all shards in created order.
+
+    With the date scheme shards are ordered by their latest entry and read
+    a few at a time, so the tail of the view is the most recent captures.
+    With the hash scheme every shard spans the whole history, so on first
+    access all shards are read, kept, and merged by ``created`` (a k-way
+    merge of the per-shard runs) into a position -> (shard, offset) table.
+    ``append`` mirrors a write already made through ``ShardedIndex.append``.
+    """
+
+    def __init__(self, store, max_shards=8):
+        self.store = store
+        self.max_shards = max_shards
+        self.merged = store.scheme != 'date'
+        self._shards = OrderedDict()
+        self.refresh()
+
+    def refresh(self):
+        shards = self.store.summary['shards']
+        if self.merged:
+            self.keys = sorted(shards)  # Stable numbering for the merged table
+        else:
+            self.keys = sorted(shards, key=lambda key: (shards[key]['last'], key))
+        self.offsets = []
+        total = 0
+        for key in self.keys:
+            self.offsets.append(total)
+            total += shards[key]['count']
+        self._length = total
+        self._order = None  # Merged table, rebuilt on next access
+
+    def shard(self, key):
+        entries = self._shards.get(key)
+        if entries is None:
+            if not self.merged and len(self._shards) >= self.max_shards:
+                self._shards.popitem(last=False)
+            entries = self.store.read_shard(key)
+            self._shards[key] = entries
+        else:
+            self._shards.move_to_end(key)
+        return entries
+
+    def _merge(self):
+        numbers, offsets = array('H'), array('q')
+        runs = []
+        for number, key in enumerate(self.keys):
+            # Manifests are in append order, which is only created order if nothing was imported late
+            runs.append(sorted((entry['created'], number, offset) for offset, entry in enumerate(self.shard(key))))
+        for _, number, offset in heapq.merge(*runs):
+            numbers.append(number)
+            offsets.append(offset)
+        self._order = (numbers, offsets)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("index out of range")
+        if self.merged:
+            if self._order is None:
+                self._merge()
+            numbers, offsets = self._order
+            return self.shard(self.keys[numbers[i]])[offsets[i]]
+        position = bisect.bisect_right(self.offsets, i) - 1
+        return self.shard(self.keys[position])[i - self.offsets[position]]
+
+    def __iter__(self):
+        if self.merged:
+            for i in range(len(self)):
+                yield self[i]
+            return
+        for key in self.keys:
+            yield from self.shard(key)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def append(self, entry):
+        key = self.store.shard_of(entry)
+        entries = self._shards.get(key)
+        if (self.merged and self._order is not None and entries is not None and key in self.keys
+                and (not self._length or entry['created'] >= self[-1]['created'])):
+            # The newest capture: extend the merged table instead of merging again
+            entries.append(entry)
+            self._order[0].append(self.keys.index(key))
+            self._order[1].append(len(entries) - 1)
+            self._length += 1
+            return
+        self._shards.pop(key, None)
+        self.refresh()
+
+
+class ShardLayout:
+    """Where files and manifests of a sharded directory live"""
+
+    def __init__(self, save_directory, scheme):
+        self.save_directory = save_directory
+        self.scheme = scheme
+
+    def shard_for(self, filename, created):
+        """Shard key for a new file; created is an ISO timestamp"""
+        if self.scheme == 'date':
+            return created[:10].replace("-", "/")
+        return hashlib.sha1(filename.encode()).hexdigest()[:2]
+
+    def shard_of(self, entry):
+        """Shard holding an entry: the directory its file is in, if that is a shard"""
+        relative = os.path.relpath(os.path.dirname(entry['filepath']), self.save_directory)
+        relative = relative.replace(os.sep, "/")
+        if SCHEMES[self.scheme].match(relative):
+            return relative
+        return self.shard_for(entry['filename'], entry['created'])
+
+    def shard_directory(self, key):
+        return os.path.join(self.save_directory, *key.split("/"))
+
+    def manifest(self, key):
+        return os.path.join(self.shard_directory(key), MANIFEST_FILENAME)
+
+    def filepath_for(self, filename, created):
+        """Path for a new file, creating its shard directory"""
+        directory = self.shard_directory(self.shard_for(filename, created))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+
+class ShardedIndex(ShardLayout):
+    """Index store for a sharded directory, with the JournaledIndex surface"""
+
+    def __init__(self, save_directory):
+        self.summary_file = summary_file(save_directory)
+        with open(self.summary_file, 'r') as f:
+            self.summary = json.load(f)
+        super().__init__(save_directory, self.summary['scheme'])
+        self._reconcile()
+
+    @classmethod
+    def create(cls, save_directory, scheme, settings=None, shards=None):
+        write_json_atomic(summary_file(save_directory),
+                          {'scheme': scheme, 'settings': settings or {}, 'shards': shards or {}})
+        return cls(save_directory)
+
+    def read_shard(self, key):
+        return read_manifest(self.manifest(key))[0]
+
+    def _reconcile(self):
+        """Recount shards whose manifest changed after the summary was last written (a crash).
+
+        One stat per shard; only shards that differ are read. A torn last
+        line is cut off so later appends start on a clean line.
+        """
+        shards = self.summary['shards']
+        for key, info in list(shards.items()):
+            manifest = self.manifest(key)
+            try:
+                size = os.path.getsize(manifest)
+            except OSError:
+                size = 0
+            if size == info['bytes']:
+                continue
+            entries, good_bytes = read_manifest(manifest)
+            if good_bytes < size:
+                with open(manifest, 'r+b') as f:
+                    f.truncate(good_bytes)
+            created = [entry['created'] for entry in entries] or [""]
+            shards[key] = {'count': len(entries), 'bytes': good_bytes,
+                           'first': min(created), 'last': max(created)}
+
+    # Store surface
+    def load(self):
+        data = dict(self.summary['settings'])
+        data['screenshots'] = ShardedEntries(self)
+        return data
+
+    def append(self, entry=None, settings=None):
+        self.append_many([] if entry is None else [entry], settings)
+
+    def append_many(self, entries, settings=None):
+        """Append entries to their shard manifests, then rewrite the summary"""
+        by_shard = {}
+        for entry in entries:
+            by_shard.setdefault(self.shard_of(entry), []).append(entry)
+        shards = self.summary['shards']
+        for key, shard_entries in by_shard.items():
+            os.makedirs(self.shard_directory(key), exist_ok=True)
+            with open(self.manifest(key), 'a') as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in shard_entries))
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            info = shards.get(key) or {'count': 0, 'bytes': 0, 'first': None, 'last': ""}
+            created = [entry['created'] for entry in shard_entries]
+            shards[key] = {'count': info['count'] + len(shard_entries), 'bytes': size,
+                           'first': min(created + ([info['first']] if info['first'] else [])),
+                           'last': max(created + [info['last']])}
+        if settings is not None:
+            self.summary['settings'] = settings
+        if by_shard or settings is not None:
+            write_json_atomic(self.summary_file, self.summary)
+
+    def needs_compaction(self):
+        return False
+
+    def compacting(self):
+        return False
+
+    def compact(self, data, background=True):
+        pass
+
+    def close(self):
+        pass
+
+    # Queries
+    def count(self):
+        return sum(info['count'] for info in self.summary['shards'].values())
+
+    def created_between(self, start, end, limit=None):
+        """Entries with start <= created < end, reading only shards that overlap"""
+        matches = []
+        for key, info in sorted(self.summary['shards'].items(), key=lambda item: item[1]['first'] or ""):
+            if not info['count'] or info['last'] < start or info['first'] >= end:
+                continue
+            matches.extend(entry for entry in self.read_shard(key) if start <= entry['created'] < end)
+        matches.sort(key=lambda entry: entry['created'])
+        return matches[:limit] if limit is not None else matches
+
+
+def _move(job):
+    """Worker: move one file into its shard and carry its thumbnail along"""
+    from thumbnails import thumbnail_path
+    old, new, thumbnail_dir = job
+    if not os.path.exists(old):
+        return False  # Moved by an earlier, interrupted run
+    old_thumbnail = thumbnail_path(thumbnail_dir, old)
+    os.makedirs(os.path.dirname(new), exist_ok=True)
+    os.replace(old, new)
+    if old_thumbnail is not None and os.path.exists(old_thumbnail):
+        new_thumbnail = thumbnail_path(thumbnail_dir, new)
+        if new_thumbnail is not None:
+            os.replace(old_thumbnail, new_thumbnail)
+    return True
+
+
+def migrate(save_directory, scheme='date', workers=8, out=sys.stdout):
+    """Move a flat directory into the sharded layout; returns the number of files moved"""
+    from core import ScreenshotLibrary
+    from daemon import DaemonClient
+
+    save_directory = os.path.abspath(save_directory)
+    if os.path.exists(summary_file(save_directory)):
+        raise ValueError(f"{save_directory} is already sharded")
+    if DaemonClient.connect(save_directory) is not None:
+        raise ValueError(f"Stop the index daemon serving {save_directory} first")
+
+    library = ScreenshotLibrary(save_directory, use_daemon=False)
+    library.load_index()
+    entries = list(library.screenshot_index)
+    settings = library.index_settings()
+    thumbnail_dir = library.thumbnail_dir
+    db_file = os.path.splitext(library.index_file)[0] + ".db"
+    flat_files = [library.index_file, os.path.splitext(library.index_file)[0] + ".journal",
+                  db_file, db_file + "-wal", db_file + "-shm"]
+    library.close()
+
+    # Plan every move; the same index yields the same plan when re-run
+    layout = ShardLayout(save_directory, scheme)
+    moves, claimed, migrated = [], {}, []
+    keyframes = {}
+    for entry in entries:
+        old = os.path.abspath(entry['filepath'])
+        key = layout.shard_for(entry['filename'], entry['created'])
+        if entry.get('frame') == 'keyframe':
+            keyframes[entry['filename']] = key
+        elif entry.get('frame') == 'delta':
+            # Delta frames stay next to their keyframe, which they reference by relative path
+            key = keyframes.get(entry.get('keyframe'), key)
+        new = os.path.join(layout.shard_directory(key), entry['filename'])
+        inside = os.path.dirname(old) == save_directory
+        if inside and claimed.get(new, old) == old and (os.path.exists(old) or os.path.exists(new)):
+            if new not in claimed:
+                claimed[new] = old
+                moves.append((old, new, thumbnail_dir))
+            entry = dict(entry, filepath=new)
+        migrated.append(entry)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        moved = sum(pool.map(_move, moves))
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    # Manifests first, then the summary that switches the directory over
+    by_shard = {}
+    for entry in migrated:
+        by_shard.setdefault(layout.shard_of(entry), []).append(entry)
+    shards = {}
+    for key, shard_entries in by_shard.items():
+        manifest = os.path.join(layout.shard_directory(key), MANIFEST_FILENAME)
+        os.makedirs(os.path.dirname(manifest), exist_ok=True)
+        tmp_path = manifest + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in shard_entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, manifest)
+        created = [entry['created'] for entry in shard_entries]
+        shards[key] = {'count': len(shard_entries), 'bytes': os.path.getsize(manifest),
+                       'first': min(created), 'last': max(created)}
+    ShardedIndex.create(save_directory, scheme, settings, shards)
+
+    for path in flat_files:
+        if os.path.exists(path):
+            os.replace(path, path + ".premigration")
+
+    print(f"Moved {moved} files into {len(shards)} shards in {elapsed:.2f}s "
+          f"({moved / elapsed:.0f} files/sec); {len(migrated)} entries indexed", file=out)
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pic Q'er sharded layout tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="Move a flat save directory into shards")
+    migrate_parser.add_argument("directory")
+    migrate_parser.add_argument("--scheme", choices=sorted(SCHEMES), default="date")
+    migrate_parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        try:
+            migrate(os.path.expanduser(args.directory), args.scheme, args.workers)
+        except ValueError as e:
+            print(e)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
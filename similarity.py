@@ -0,0 +1,140 @@
+from collections import deque
+
+DIGEST_STRIP_BYTES = 4 * 1024 * 1024
+
+
+def image_hash(image, hash_size=8):
+    """64-bit difference hash (dHash) of an image, as a hex string.
+
+    The image is shrunk to (hash_size + 1) x hash_size grayscale first, so
+    the cost is dominated by Pillow's reducing resize rather than the
+    full-resolution pixels; the gradient comparison is one NumPy operation.
+    """
+    import numpy as np
+    from PIL import Image
+
+    if image.mode not in ("L", "RGB", "RGBA"):
+        image = image.convert("RGB")
+    small = image.resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    pixels = np.asarray(small.convert("L"), dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return np.packbits(bits).tobytes().hex()
+
+
+def pixel_digest(image):
+    """SHA-256 of an image's mode, size and raw pixels, as a hex string.
+
+    With the 'exact' duplicate match, captures only count as duplicates
+    when these match: a dHash of a 9x8 thumbnail is blind to a changed line
+    of text. Rows are hashed a strip at a time, so no second full-size copy
+    of the pixels is made.
+    """
+    import hashlib
+
+    width, height = image.size
+    digest = hashlib.sha256(f"{image.mode} {width}x{height}".encode())
+    rows = max(1, DIGEST_STRIP_BYTES // max(len(image.crop((0, 0, width, 1)).tobytes()), 1))
+    for top in range(0, height, rows):
+        digest.update(image.crop((0, top, width, min(top + rows, height))).tobytes())
+    return digest.hexdigest()
+
+
+def hamming(a, b):
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over hashes under Hamming distance.
+
+    Range queries only descend into children whose edge distance lies within
+    the query radius of the node's distance, which keeps small-radius lookups
+    well below a linear scan.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, key, item):
+        value = int(key, 16)
+        node = [value, [item], {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = (value ^ current[0]).bit_count()
+            if distance == 0:
+                current[1].append(item)
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, key, max_distance):
+        """All (distance, item) pairs within max_distance, nearest first"""
+        if self.root is None:
+            return []
+        value = int(key, 16)
+        results = []
+        stack = [self.root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = (value ^ node_value).bit_count()
+            if distance <= max_distance:
+                results.extend((distance, item) for item in items)
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for edge, child in children.items() if low <= edge <= high)
+        results.sort(key=lambda pair: pair[0])
+        return results
+
+
+DEFAULT_DUPLICATES = {'policy': 'skip', 'match': 'exact', 'max_distance': 4, 'recent': 20}
+
+
+class SimilarityIndex:
+    """Perceptual-hash lookups over the screenshot index.
+
+    Duplicate checks for new pastes only compare against the most recent
+    captures, either by the pixel ``digest`` stored next to ``phash`` in
+    each entry or by dHash distance. The BK-tree used for "similar to this
+    one" queries is built on first use from the entries' stored ``phash``
+    values and then kept up to date as captures are added.
+    """
+
+    def __init__(self, screenshot_index, recent=20):
+        self.screenshot_index = screenshot_index
+        self.recent = deque(maxlen=recent)
+        self.tree = None
+        for entry in screenshot_index[-recent:]:
+            if entry.get('phash'):
+                self.recent.append(entry)
+
+    def add(self, entry):
+        if not entry.get('phash'):
+            return
+        self.recent.append(entry)
+        if self.tree is not None:
+            self.tree.add(entry['phash'], entry)
+
+    def find_recent_duplicate(self, phash, digest=None, max_distance=4):
+        """The latest recent capture with the same pixel digest, or without one the nearest within max_distance"""
+        if digest is not None:
+            return next((entry for entry in reversed(self.recent) if entry.get('digest') == digest), None)
+        best = None
+        for entry in self.recent:
+            distance = hamming(phash, entry['phash'])
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, entry)
+        return best[1] if best else None
+
+    def similar(self, phash, max_distance=10):
+        if self.tree is None:
+            self.tree = BKTree()
+            for entry in self.screenshot_index:
+                if entry.get('phash'):
+                    self.tree.add(entry['phash'], entry)
+        return self.tree.search(phash, max_distance)
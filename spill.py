@@ -0,0 +1,412 @@
+"""
+Memory-capped queue of captures waiting to be encoded.
+
+Frames are kept in memory up to a byte budget. A frame that would go over
+it is handed to a single spill writer thread, which writes it raw to a
+memory-mapped file in the save directory's .spill folder and then drops
+the in-memory image; until then the frame counts as in memory, and an
+encoder that gets to it first simply uses the image. When an encoder
+thread gets to a spilled frame, the file is mapped again and read with
+Image.frombuffer: L and RGBA frames are used in place, with pixels paged
+in from the file as the encoder reads them, and other modes are unpacked
+once, on the encoder thread. However long the queue grows, memory stays at
+the budget plus the frames waiting for the spill writer (at most half
+the budget, or one frame) plus one frame per encoder thread.
+
+A spill file is a header (magic bytes, then JSON with the frame's mode
+and size and whatever the caller needs to finish the save), padded to a
+multiple of 4 KB, followed by the raw pixels. It is written under a .part name and renamed when
+complete, so after a crash every .spill file holds a whole frame, and
+recover() lists them so the next start can encode and index them. Only a
+process that owns the directory should recover: while a daemon serves it,
+another client's spill files may belong to saves still in progress.
+
+on_pressure(report) is called, from whichever thread changed the queue,
+while frames are being spilled or refused and once more when the queue
+is back within its memory budget. report is a dict with 'level' ('ok',
+'spilling' or 'full'), the in-memory and spilled frame counts and their
+bytes.
+"""
+
+import os
+import json
+import mmap
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+SPILL_DIR = ".spill"
+SPILL_EXTENSION = ".spill"
+MAGIC = b"PQSPILL1"
+HEADER_ALIGN = 4096  # Pixels start on a page boundary after the header
+STRIP_BYTES = 4 * 1024 * 1024  # Rows copied into the map at a time while spilling
+WRITE_AHEAD_SHARE = 2  # Frames waiting for the spill writer may use half the memory budget
+DEFAULT_SAVE_QUEUE = {'memory_mb': 1024, 'spill_mb': 16384}
+RAW_MODES = ("L", "LA", "RGB", "RGBA", "I", "F", "I;16")
+MAPPED_MODES = ("L", "RGBA", "I;16")  # frombuffer uses the file's pages as the image memory
+
+OK, SPILLING, FULL = 'ok', 'spilling', 'full'
+
+
+def memory_bytes(image):
+    """Pillow's in-memory size of an image: 1 byte per pixel for L/P/1, 4 for everything else"""
+    width, height = image.size
+    if image.mode in ("1", "L", "P"):
+        return width * height
+    return width * height * (2 if image.mode == "I;16" else 4)
+
+
+def raw_image(image):
+    """image in a mode whose raw bytes can be spilled and read back with frombuffer"""
+    if image.mode in RAW_MODES:
+        return image
+    has_alpha = 'transparency' in image.info or 'A' in image.getbands()
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+
+def _header_bytes(length):
+    return -(-(len(MAGIC) + 4 + length) // HEADER_ALIGN) * HEADER_ALIGN
+
+
+def encoder_state(encoder, encoder_settings):
+    """What recovery needs to rebuild the encoder of a spilled frame"""
+    from deltas import DeltaFrame
+    if isinstance(encoder, DeltaFrame):
+        return {'delta': {'keyframe_path': encoder.keyframe_path, 'tile': encoder.tile,
+                          'changed': [int(position) for position in encoder.changed],
+                          'compress_level': encoder.compress_level}}
+    return {'encoder': encoder_settings}
+
+
+def restore_encoder(state):
+    if 'delta' in state:
+        import numpy as np
+        from deltas import DeltaFrame
+        delta = state['delta']
+        return DeltaFrame(delta['keyframe_path'], delta['tile'], np.asarray(delta['changed'], dtype=np.int64),
+                          delta.get('compress_level', 6))
+    from encoders import create_encoder
+    return create_encoder(state.get('encoder'))
+
+
+class MemoryFrame:
+    """A queued frame still held in memory"""
+    spilled = False
+
+    def __init__(self, image, meta, nbytes):
+        self.image = image
+        self.meta = meta
+        self.nbytes = nbytes
+
+    def open(self):
+        return self.image
+
+    def close(self):
+        """Drop the image; returns whether the frame was on disk"""
+        self.image = None
+        return False
+
+
+class SpilledFrame:
+    """A queued frame written raw to a spill file; open() maps it back as an image"""
+    spilled = True
+
+    def __init__(self, path, header, offset):
+        self.path = path
+        self.header = header
+        self.meta = header.get('meta', {})
+        self.nbytes = header['bytes']
+        self.offset = offset  # Where the pixels start
+        self._file = None
+        self._map = None
+        self._view = None
+
+    @classmethod
+    def read(cls, path):
+        """The frame in an existing spill file; ValueError if it is not a whole one"""
+        with open(path, 'rb') as f:
+            head = f.read(len(MAGIC) + 4)
+            if len(head) < len(MAGIC) + 4 or not head.startswith(MAGIC):
+                raise ValueError("not a spill file")
+            length = int.from_bytes(head[len(MAGIC):], 'little')
+            header = json.loads(f.read(length))
+            size = os.fstat(f.fileno()).st_size
+        pixels = size - _header_bytes(length)
+        if pixels != header['bytes']:
+            raise ValueError(f"expected {header['bytes']} bytes of pixels, found {pixels}")
+        return cls(path, header, _header_bytes(length))
+
+    def open(self):
+        from PIL import Image
+        mode, size = self.header['mode'], tuple(self.header['size'])
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)[self.offset:]
+        image = Image.frombuffer(mode, size, self._view, "raw", mode, 0, 1)
+        if mode not in MAPPED_MODES:
+            # Unpacked into Pillow's own memory; the map is no longer needed
+            self._release_map()
+        return image
+
+    def _release_map(self):
+        try:
+            if self._view is not None:
+                self._view.release()
+            if self._map is not None:
+                self._map.close()
+        except BufferError:
+            pass  # An image still points into the map; it is unmapped when that image is collected
+        if self._file is not None:
+            self._file.close()
+        self._view = self._map = self._file = None
+
+    def close(self):
+        """Unmap and delete the spill file (call once nothing uses the opened image)"""
+        self._release_map()
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            print(f"Error removing spill file {self.path}: {e}")
+        return True
+
+
+class SpillingFrame:
+    """A queued frame past the memory budget, held in memory until the spill writer has put it on disk"""
+    spilled = True
+
+    def __init__(self, image, meta, nbytes):
+        self.image = image
+        self.meta = meta
+        self.nbytes = nbytes
+        self.spill = None  # The SpilledFrame, once written
+        self.taken = False  # Opened or closed: the image stays in memory from then on
+        self.lock = threading.Lock()
+
+    def pending_image(self):
+        """The image still to be spilled, or None once an encoder has taken the frame"""
+        with self.lock:
+            return None if self.taken else self.image
+
+    def land(self, spill):
+        """Switch to the written spill file; False if an encoder took the frame meanwhile"""
+        with self.lock:
+            if self.taken:
+                return False
+            self.spill, self.image = spill, None
+            return True
+
+    def open(self):
+        with self.lock:
+            self.taken = True
+            spill = self.spill
+            if spill is None:
+                return self.image
+        return spill.open()
+
+    def close(self):
+        """Drop the image or delete the spill file; returns whether the frame was on disk"""
+        with self.lock:
+            self.taken = True
+            spill, self.spill, self.image = self.spill, None, None
+        return spill is not None and spill.close()
+
+
+def write_spill(path, image, meta):
+    """Write image's raw pixels and meta to path (via path.part); returns the SpilledFrame"""
+    image = raw_image(image)
+    width, height = image.size
+    row_bytes = len(image.crop((0, 0, width, 1)).tobytes())
+    header = {'mode': image.mode, 'size': [width, height], 'bytes': row_bytes * height,
+              'spilled': datetime.now().isoformat(), 'meta': meta}
+    encoded = json.dumps(header).encode()
+    offset = _header_bytes(len(encoded))
+    part_path = path + ".part"
+    try:
+        with open(part_path, 'w+b') as f:
+            f.truncate(offset + header['bytes'])
+            with mmap.mmap(f.fileno(), 0) as mapped:
+                mapped[:len(MAGIC) + 4 + len(encoded)] = MAGIC + len(encoded).to_bytes(4, 'little') + encoded
+                rows = max(1, STRIP_BYTES // max(row_bytes, 1))
+                position = offset
+                # A strip of rows at a time, so spilling never holds a second copy of the frame
+                for top in range(0, height, rows):
+                    strip = image.crop((0, top, width, min(top + rows, height))).tobytes()
+                    mapped[position:position + len(strip)] = strip
+                    position += len(strip)
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return SpilledFrame(path, header, offset)
+
+
+def recover(spill_dir):
+    """Whole spilled frames left by an earlier run, oldest first; torn ones are deleted"""
+    try:
+        names = sorted(os.listdir(spill_dir))
+    except FileNotFoundError:
+        return []
+    frames = []
+    for name in names:
+        path = os.path.join(spill_dir, name)
+        if name.endswith(SPILL_EXTENSION + ".part"):
+            os.remove(path)
+        elif name.endswith(SPILL_EXTENSION):
+            try:
+                frames.append(SpilledFrame.read(path))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Discarding unreadable spill file {path}: {e}")
+                os.remove(path)
+    return frames
+
+
+class SaveQueue:
+    """Byte accounting for frames between capture and encode; spills what does not fit.
+
+    accepts() says whether another frame can be queued at all (in memory
+    or spilled, within spill_budget); admit() queues it and returns a
+    MemoryFrame, or a SpillingFrame that the spill writer thread moves to
+    disk; done() gives its bytes back once saved. admit() never writes to
+    disk itself, so it is cheap enough for the GUI thread.
+    """
+
+    def __init__(self, spill_dir, memory_budget, spill_budget, on_pressure=None):
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.spill_budget = spill_budget
+        self.on_pressure = on_pressure
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.memory_frames = 0
+        self.memory_used = 0
+        self.writing_bytes = 0  # In memory (and counted there), waiting for the spill writer
+        self.spilled_frames = 0
+        self.spilled_bytes = 0
+        self.level = OK
+        self.writer = None
+
+    @classmethod
+    def from_settings(cls, spill_dir, settings, on_pressure=None):
+        queue = cls(spill_dir, 0, 0, on_pressure)
+        queue.apply_settings(settings)
+        return queue
+
+    def apply_settings(self, settings):
+        """Budgets from the index's 'save_queue' settings (MB); frames already queued stay where they are"""
+        with self.lock:
+            self.memory_budget = int(settings.get('memory_mb', DEFAULT_SAVE_QUEUE['memory_mb'])) << 20
+            self.spill_budget = int(settings.get('spill_mb', DEFAULT_SAVE_QUEUE['spill_mb'])) << 20
+
+    def report(self):
+        return {'level': self.level, 'memory_frames': self.memory_frames, 'memory_bytes': self.memory_used,
+                'memory_budget': self.memory_budget, 'spilled_frames': self.spilled_frames,
+                'spilled_bytes': self.spilled_bytes}
+
+    def _fits_in_memory(self, nbytes):
+        # One frame is always let through, however large, so a single capture never spills
+        return not self.memory_frames or self.memory_used + nbytes <= self.memory_budget
+
+    def _can_spill(self, nbytes):
+        # A disk slower than the captures refuses frames instead of piling them up in memory
+        if self.spilled_bytes + self.writing_bytes + nbytes > self.spill_budget:
+            return False
+        return not self.writing_bytes or self.writing_bytes + nbytes <= self.memory_budget // WRITE_AHEAD_SHARE
+
+    def _settled(self):
+        return not self.spilled_frames and not self.writing_bytes and self.memory_used <= self.memory_budget
+
+    def accepts(self, image):
+        """Whether a frame can be queued now; reports 'full' if it cannot"""
+        nbytes = memory_bytes(image)
+        with self.lock:
+            if self._fits_in_memory(nbytes) or self._can_spill(nbytes):
+                return True
+            self.level = FULL
+            report = self.report()
+        self._notify(report)
+        return False
+
+    def admit(self, image, meta):
+        """Queue a frame: kept in memory if it fits the budget, handed to the spill writer otherwise"""
+        nbytes = memory_bytes(image)
+        with self.lock:
+            in_memory = self._fits_in_memory(nbytes)
+            self.memory_frames += 1
+            self.memory_used += nbytes
+            if in_memory:
+                return MemoryFrame(image, meta, nbytes)
+            self.writing_bytes += nbytes
+            self.sequence += 1
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+            path = os.path.join(self.spill_dir, f"{stamp}-{os.getpid()}-{self.sequence:06d}{SPILL_EXTENSION}")
+            frame = SpillingFrame(image, meta, nbytes)
+            if self.writer is None:
+                self.writer = ThreadPoolExecutor(1, thread_name_prefix="spill-writer")
+            self.writer.submit(self._spill, frame, path)
+            self.level = SPILLING
+            report = self.report()
+        self._notify(report)
+        return frame
+
+    def _spill(self, frame, path):
+        """Spill writer thread: put a frame on disk unless an encoder already has it"""
+        spill = None
+        try:
+            image = frame.pending_image()
+            if image is not None:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                spill = write_spill(path, image, frame.meta)
+        except Exception as e:
+            print(f"Error spilling frame, keeping it in memory: {e}")
+        image = None
+        with self.lock:
+            self.writing_bytes -= frame.nbytes
+            landed = spill is not None and frame.land(spill)
+            if landed:
+                self.memory_frames -= 1
+                self.memory_used -= frame.nbytes
+                self.spilled_frames += 1
+                self.spilled_bytes += frame.nbytes
+            elif self._settled():
+                self.level = OK
+            report = self.report()
+        if spill is not None and not landed:
+            spill.close()  # The encoder got to the frame while it was being written
+        self._notify(report)
+
+    def flush(self):
+        """Wait until every frame handed to the spill writer so far is on disk (or kept in memory)"""
+        with self.lock:
+            writer = self.writer
+        if writer is not None:
+            writer.submit(lambda: None).result()
+
+    def adopt(self, frame):
+        """Count a recovered spilled frame as queued"""
+        with self.lock:
+            self.spilled_frames += 1
+            self.spilled_bytes += frame.nbytes
+
+    def done(self, frame):
+        """A frame was saved (or failed): free its memory or delete its spill file"""
+        on_disk = frame.close()
+        with self.lock:
+            if on_disk:
+                self.spilled_frames -= 1
+                self.spilled_bytes -= frame.nbytes
+            else:
+                self.memory_frames -= 1
+                self.memory_used -= frame.nbytes
+            if self.level == OK:
+                return
+            if self._settled():
+                self.level = OK
+            elif self.level == FULL:
+                self.level = SPILLING
+            report = self.report()
+        self._notify(report)
+
+    def _notify(self, report):
+        if self.on_pressure is not None:
+            self.on_pressure(report)
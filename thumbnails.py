@@ -0,0 +1,52 @@
+import os
+import hashlib
+
+THUMBNAIL_SIZE = 96
+THUMBNAIL_DIR = ".thumbnails"
+
+
+def thumbnail_path(cache_dir, filepath):
+    """Cache file for a screenshot, keyed by path, mtime and size.
+
+    Returns None when the screenshot no longer exists. Any change to the
+    file yields a different key, so stale thumbnails are never served.
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    key = f"{os.path.abspath(filepath)}|{stat.st_mtime_ns}|{stat.st_size}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".png")
+
+
+def write_thumbnail(image, filepath, cache_dir, size=THUMBNAIL_SIZE):
+    """Store a thumbnail of an in-memory image for the already saved filepath"""
+    path = thumbnail_path(cache_dir, filepath)
+    if path is None:
+        return None
+    from PIL import Image
+
+    os.makedirs(cache_dir, exist_ok=True)
+    if image.mode not in ("L", "RGB", "RGBA"):
+        image = image.convert("RGBA")
+    # resize() builds the small image directly instead of copying the full frame
+    width, height = image.size
+    scale = min(size / width, size / height, 1)
+    thumb = image.resize((max(1, round(width * scale)), max(1, round(height * scale))),
+                         Image.Resampling.BILINEAR, reducing_gap=2.0)
+    tmp_path = path + ".tmp"
+    thumb.save(tmp_path, "PNG", compress_level=1)
+    os.replace(tmp_path, path)
+    return path
+
+
+def ensure_thumbnail(filepath, cache_dir, size=THUMBNAIL_SIZE):
+    """Path of the cached thumbnail, decoding the full image only on a cache miss"""
+    path = thumbnail_path(cache_dir, filepath)
+    if path is None or os.path.exists(path):
+        return path
+    from PIL import Image
+
+    with Image.open(filepath) as image:
+        image.draft("RGB", (size, size))
+        return write_thumbnail(image, filepath, cache_dir, size)